@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the interpolation and I/O hot paths on synthetic gas cubes.
+
+Each benchmark reports its wall time, its throughput (points/s or MB/s), and
+the peak memory that NumPy allocated during the benchmark (via tracemalloc).
+The results are saved as JSON, and a previous result file can be given via
+--compare to flag throughput regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py -s large -o new.json -c results.json
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.column_density import get_directions
+from picard_gas.column_density import get_segments
+from picard_gas.column_density import get_sky_grid
+from picard_gas.column_density import integrate_columns
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.trilinear_interpolation import TrilinearInterpolation
+from picard_gas.tricubic_interpolation import TricubicInterpolation
+from picard_gas.console_scripts.interpolate_gas import interpolate
+from picard_gas.console_scripts.interpolate_gas import interpolate_parallel
+from picard_gas.console_scripts.interpolate_gas import interpolate_slabs
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import h5py
+import numpy as np
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+# source shape (x, y, z) and Picard grid shape (x, y, z) of each size
+SIZES = {
+    'small': ((64, 64, 16), (65, 65, 17)),
+    'medium': ((256, 256, 64), (201, 201, 51)),
+    'large': ((1000, 1000, 160), (401, 401, 101)),
+}
+# x, y, and z limits of the volume represented by the source grid / kpc
+SOURCE_VOLUME_LIMITS = np.array([[-20., 20.], [-20., 20.], [-2., 2.]])
+# number of randomly located points of the point-by-point benchmark
+N_POINTS = 10**6
+# observer, sky grid (longitudes, latitudes), and sample distance / kpc of the
+# column density benchmark
+OBSERVER = np.array([-8.5, 0., 0.])
+SKY_GRID_SHAPE = 90, 45
+COLUMN_STEP = 0.1
+MEGABYTE = 1e6
+
+
+def get_source(shape) -> np.ndarray:
+    """
+    Returns a synthetic gas cube: an exponential disk with noise.
+    """
+    rng = np.random.default_rng(0)
+    x, y, z = (np.linspace(lower, upper, n)
+               for (lower, upper), n in zip(SOURCE_VOLUME_LIMITS, shape))
+    radius = np.hypot(x[:, None, None], y[None, :, None])
+    density = np.exp(-radius / 3.) * np.exp(-np.abs(z[None, None, :]) / 0.1)
+    density *= 1 + 0.1 * rng.random(shape)
+    return density
+
+
+def get_parameters(shape) -> dict:
+    return {
+        'x_min': -22., 'x_max': 22., 'n_xgrid': shape[0],
+        'y_min': -22., 'y_max': 22., 'n_ygrid': shape[1],
+        'z_min': -2.5, 'z_max': 2.5, 'n_zgrid': shape[2],
+    }
+
+
+def measure(function: Callable[[], None], repetitions: int) -> dict:
+    """
+    Returns the shortest wall time, its CPU time, and the peak memory
+    allocated by NumPy of `repetitions` calls of `function`.
+    """
+    wall_times = []
+    cpu_times = []
+    peak_memory = 0
+    for _ in range(repetitions):
+        tracemalloc.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        # the progress output of the console scripts is discarded
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+        peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    best = int(np.argmin(wall_times))
+    return {
+        'seconds': wall_times[best],
+        'cpu seconds': cpu_times[best],
+        'peak memory MB': peak_memory / MEGABYTE,
+    }
+
+
+def run_benchmarks(size: str,
+                   repetitions: int,
+                   jobs: int,
+                   directory: str) -> Dict[str, dict]:
+    source_shape, target_shape = SIZES[size]
+    source = get_source(source_shape)
+    picard_grid = get_picard_grid(get_parameters(target_shape))
+    n_target_points = int(np.prod(target_shape))
+    source_float32 = source.astype(np.float32)
+    source_megabytes = source.nbytes / MEGABYTE
+    interpolation = TrilinearInterpolation(source, SOURCE_VOLUME_LIMITS)
+    tricubic_interpolation = TricubicInterpolation(source,
+                                                   SOURCE_VOLUME_LIMITS)
+    rng = np.random.default_rng(1)
+    points = rng.uniform(SOURCE_VOLUME_LIMITS[:, 0],
+                         SOURCE_VOLUME_LIMITS[:, 1],
+                         size=(N_POINTS, 3))
+    directions = get_directions(OBSERVER, *get_sky_grid(*SKY_GRID_SHAPE))
+    distance_limits = np.array([0., np.inf])
+    n_samples = int(get_segments(SOURCE_VOLUME_LIMITS, source_shape, OBSERVER,
+                                 directions, distance_limits,
+                                 COLUMN_STEP)[1].sum())
+    source_path = os.path.join(directory, 'source.h5')
+    counter = iter(range(10**9))
+
+    def new_path():
+        return os.path.join(directory, f'{next(counter)}.h5')
+
+    def write(**layout):
+        h5_file = H5File(new_path(), 'w', **layout)
+        h5_file.write_density(source)
+        h5_file.write_grid_limits(SOURCE_VOLUME_LIMITS, SOURCE_VOLUME_LIMITS)
+        h5_file.file.close()
+
+    h5_file = H5File(source_path, 'w', contiguous=True, compression=None)
+    h5_file.write_density(source)
+    h5_file.write_grid_limits(SOURCE_VOLUME_LIMITS, SOURCE_VOLUME_LIMITS)
+    h5_file.file.close()
+    source_file = H5File(source_path, 'r')
+
+    def stream():
+        destination_file = H5File(new_path(), 'w')
+        interpolate_slabs(source_file, destination_file, picard_grid,
+                          max_memory=64 * 2**20)
+        destination_file.file.close()
+
+    # name: (function, number of points, number of megabytes)
+    benchmarks = {
+        'TrilinearInterpolation.evaluate': (
+            lambda: interpolation.evaluate(points), N_POINTS, None,
+        ),
+        'TrilinearInterpolation.resample': (
+            lambda: interpolation.resample(picard_grid['x centers'],
+                                           picard_grid['y centers'],
+                                           picard_grid['z centers']),
+            n_target_points, None,
+        ),
+        'TricubicInterpolation.evaluate': (
+            lambda: tricubic_interpolation.evaluate(points), N_POINTS, None,
+        ),
+        'TricubicInterpolation.resample': (
+            lambda: tricubic_interpolation.resample(picard_grid['x centers'],
+                                                    picard_grid['y centers'],
+                                                    picard_grid['z centers']),
+            n_target_points, None,
+        ),
+        'integrate_columns': (
+            lambda: integrate_columns(source, SOURCE_VOLUME_LIMITS, OBSERVER,
+                                      directions, distance_limits,
+                                      COLUMN_STEP),
+            n_samples, None,
+        ),
+        'interpolate': (
+            lambda: interpolate(source, SOURCE_VOLUME_LIMITS, picard_grid),
+            n_target_points, None,
+        ),
+        'interpolate (float32)': (
+            lambda: interpolate(source_float32, SOURCE_VOLUME_LIMITS,
+                                picard_grid),
+            n_target_points, None,
+        ),
+        f'interpolate_parallel ({jobs} jobs)': (
+            lambda: interpolate_parallel(source, SOURCE_VOLUME_LIMITS,
+                                         picard_grid, jobs),
+            n_target_points, None,
+        ),
+        'interpolate_slabs (64 MiB)': (stream, n_target_points, None),
+        'H5File.write_density (gzip)': (write, None, source_megabytes),
+        'H5File.write_density (contiguous)': (
+            lambda: write(contiguous=True, compression=None),
+            None, source_megabytes,
+        ),
+        'H5File.read_density': (
+            lambda: source_file.read_density(), None, source_megabytes,
+        ),
+        'H5File.read_density (memory map)': (
+            lambda: np.sum(source_file.read_density(memory_map=True)),
+            None, source_megabytes,
+        ),
+    }
+
+    fits_path = write_fits_file(source, directory)
+    if fits_path is not None:
+        from picard_gas.console_scripts.fits_to_h5 import convert_fits_file
+        benchmarks['fits_to_h5.convert_fits_file'] = (
+            lambda: convert_fits_file(fits_path, new_path(), dict(),
+                                      64 * 2**20),
+            None, source_megabytes,
+        )
+
+    results = dict()
+    for name, (function, n_points, megabytes) in benchmarks.items():
+        print(f'{name} ...', end=' ', flush=True)
+        result = measure(function, repetitions)
+        if n_points is not None:
+            result['points per second'] = n_points / result['seconds']
+        if megabytes is not None:
+            result['MB per second'] = megabytes / result['seconds']
+        results[name] = result
+        print(format_result(result), flush=True)
+    source_file.file.close()
+    return results
+
+
+def write_fits_file(source: np.ndarray, directory: str) -> Optional[str]:
+    """
+    Writes the source as a big-endian FITS file like the ones from Zenodo.
+    Returns None if astropy isn't installed.
+    """
+    try:
+        from astropy.io import fits
+    except ImportError:
+        return None
+    header_data_unit = fits.PrimaryHDU(source.astype('>f4'))
+    for coordinate, (lower, upper), n in zip(range(1, 4),
+                                             SOURCE_VOLUME_LIMITS,
+                                             source.shape):
+        cell_width = (upper - lower) / n
+        header_data_unit.header[f'CRVAL{coordinate}'] = lower + cell_width/2
+        header_data_unit.header[f'CDELT{coordinate}'] = cell_width
+    fits_path = os.path.join(directory, 'source.fits')
+    header_data_unit.writeto(fits_path)
+    return fits_path
+
+
+def format_result(result: dict) -> str:
+    throughput = (f"{result['points per second']:.3g} points/s"
+                  if 'points per second' in result
+                  else f"{result['MB per second']:.3g} MB/s")
+    return (f"{result['seconds']:.3g} s, {throughput}, "
+            f"{result['peak memory MB']:.1f} MB")
+
+
+def get_throughput(result: dict) -> float:
+    return result.get('points per second', result.get('MB per second'))
+
+
+def compare(results: Dict[str, dict],
+            baseline: Dict[str, dict],
+            threshold: float) -> bool:
+    """
+    Prints the change of the throughput of each benchmark relative to the
+    baseline. Returns True if a throughput dropped by more than `threshold`
+    (relative).
+    """
+    has_regression = False
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = get_throughput(result) / get_throughput(baseline[name]) - 1
+        is_regression = change < -threshold
+        has_regression |= is_regression
+        flag = '  REGRESSION' if is_regression else ''
+        print(f'{name}: {change * 100:+.1f} %{flag}')
+    return has_regression
+
+
+def get_metadata(size: str, jobs: int) -> dict:
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'size': size,
+        'source shape': SIZES[size][0],
+        'target shape': SIZES[size][1],
+        'jobs': jobs,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'h5py': h5py.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu count': os.cpu_count(),
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the interpolation and I/O hot paths.',
+    )
+
+    parser.add_argument('-s', '--size',
+                        choices=tuple(SIZES),
+                        default='small',
+                        help='size of the synthetic gas cube and of the '
+                             'Picard grid (default = small)')
+
+    parser.add_argument('-r', '--repetitions',
+                        metavar='<repetitions>',
+                        type=int,
+                        default=3,
+                        help='number of repetitions of each benchmark; the '
+                             'fastest one is reported (default = 3)')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='number of processes of the parallel '
+                             'interpolation (default = number of CPUs)')
+
+    parser.add_argument('-o', '--output',
+                        metavar='<results *.json>',
+                        help='JSON file into which the results are saved')
+
+    parser.add_argument('-c', '--compare',
+                        metavar='<baseline *.json>',
+                        help='JSON file of previous results; the script exits '
+                             'with 1 if a throughput dropped by more than the '
+                             'threshold')
+
+    parser.add_argument('-t', '--threshold',
+                        metavar='<fraction>',
+                        type=float,
+                        default=0.1,
+                        help='relative drop of the throughput that counts as '
+                             'regression (default = 0.1)')
+
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(arguments.size,
+                                 arguments.repetitions,
+                                 arguments.jobs,
+                                 directory)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'peak RSS: {peak_rss / 1024:.1f} MiB')
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output_file:
+            json.dump({'metadata': get_metadata(arguments.size,
+                                                arguments.jobs),
+                       'peak RSS MiB': peak_rss / 1024,
+                       'results': results},
+                      output_file,
+                      indent=4)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline['results'], arguments.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,76 +3,908 @@ Module for reading and writing to H5 files.
 
 Author: Stefan Lepperdinger
 """
+from h5py import Dataset
 from h5py import File
+from picard_gas.density_statistics import DensityStatistics
+from picard_gas.density_statistics import STATISTICS_ATTRIBUTE_NAMES
+from picard_gas.density_statistics import get_cell_volume
+from picard_gas.settings import COMPONENTS_GROUP_NAME
+from picard_gas.settings import COMPRESSION_FILTERS
+from picard_gas.settings import DEFAULT_COMPRESSION
+from picard_gas.settings import DEFAULT_COMPRESSION_LEVEL
+from picard_gas.settings import DEFAULT_PYRAMID_FACTORS
+import itertools
+import json
 import numpy as np
 import os
-import sys
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
 
 DENSITY_DATASET_NAME = 'gas_density'
+DENSITY_UNIT = 'cm^-3'
+DENSITY_DESCRIPTION = 'particle density of the gas'
+
+# approximate size of the automatically chosen chunks
+DEFAULT_CHUNK_BYTES = 2**20
+# The block occupancy index of a sparse density dataset (see H5File) is
+# stored as 'block occupancy/<name of the dataset>'.
+BLOCK_OCCUPANCY_GROUP_NAME = 'block occupancy'
+# approximate size of the automatically chosen chunks of sparse datasets
+SPARSE_CHUNK_BYTES = 2**18
+# size of the chunk cache of each dataset
+CHUNK_CACHE_BYTES = 64 * 2**20
+# approximate size of the blocks in which the statistics of a density are
+# computed if they haven't been accumulated while writing it
+STATISTICS_BLOCK_BYTES = 64 * 2**20
+
+# attribute of the density dataset that records how many x-planes have been
+# written (see write_progress)
+PROGRESS_ATTRIBUTE_NAME = 'completed x planes'
+# attribute of the file that describes the inputs of the run that wrote it
+RUN_RECORD_ATTRIBUTE_NAME = 'run record'
+# attribute of a partial file of a sharded run that describes the part of the
+# Picard grid it contains (see write_shard_record)
+SHARD_ATTRIBUTE_NAME = 'shard'
+
+# sky map of the column densities (see column_density and write_sky_map)
+COLUMN_DENSITY_DATASET_NAME = 'column density'
+COLUMN_DENSITY_UNIT = 'cm^-2'
+
+# cubic B-spline coefficients of the density (see tricubic_interpolation)
+SPLINE_COEFFICIENTS_DATASET_NAME = 'spline coefficients'
+
+# The downsampled levels of the density are stored in the groups
+# 'pyramid/2x', 'pyramid/4x', ... (see write_pyramid).
+PYRAMID_GROUP_NAME = 'pyramid'
+# approximate size of the blocks in which the levels are computed
+PYRAMID_BLOCK_BYTES = 64 * 2**20
+
+
+def get_default_chunk_shape(shape: Tuple[int, ...],
+                            item_size: int,
+                            chunk_bytes: int = DEFAULT_CHUNK_BYTES
+                            ) -> Tuple[int, ...]:
+    """
+    Returns a chunk shape for a density[x_index, y_index, z_index] of the
+    shape `shape`. The chunks span the whole y axis and are as thick along x
+    as along z, so reading an x-slab or a z-plane touches only a few chunks.
+    """
+    nx, ny, nz = (max(int(n), 1) for n in shape)
+    yz_row_bytes = ny * item_size
+    thickness = max(int(np.sqrt(chunk_bytes / yz_row_bytes)), 1)
+    return min(thickness, nx), ny, min(thickness, nz)
+
+
+def get_cubic_chunk_shape(shape: Tuple[int, ...],
+                          item_size: int,
+                          chunk_bytes: int = SPARSE_CHUNK_BYTES
+                          ) -> Tuple[int, ...]:
+    """
+    Returns a small cubic chunk shape for a sparse density of the shape
+    `shape`, so that the empty regions, e.g., far above the disk, fill whole
+    chunks.
+    """
+    side = max(int(round((chunk_bytes / item_size) ** (1 / 3))), 1)
+    return tuple(min(side, max(int(n), 1)) for n in shape)
 
 
 class H5File:
-    def __init__(self, file_path: str, access_mode: str = 'r'):
+    def __init__(self,
+                 file_path: str,
+                 access_mode: str = 'r',
+                 chunk_shape: Optional[Tuple[int, ...]] = None,
+                 contiguous: bool = False,
+                 compression: Optional[str] = DEFAULT_COMPRESSION,
+                 compression_level: Optional[int] = DEFAULT_COMPRESSION_LEVEL,
+                 dtype=None,
+                 sparse: bool = False,
+                 sparse_threshold: float = 0.):
+        """
+        Parameters
+        ----------
+            file_path         : path of the H5 file
+            access_mode       : 'r' (read), 'w' (write a new file), or 'r+'
+                                (read and write an existing file)
+
+        The remaining parameters specify the layout of the density datasets
+        that are written:
+            chunk_shape       : shape of the chunks (default: see
+                                get_default_chunk_shape)
+            contiguous        : store the density contiguously instead of in
+                                chunks (without compression)
+            compression       : 'gzip', 'lzf', or None; the shuffle filter is
+                                applied before the compression
+            compression_level : level of the gzip compression (0 - 9)
+            dtype             : data type of the density (default: data type
+                                of the written data)
+            sparse            : Don't allocate the chunks of the density that
+                                are empty, i.e., whose values are at most
+                                `sparse_threshold` in magnitude, and record
+                                the non-empty chunks in a block occupancy
+                                index (see read_block_occupancy). The chunks
+                                are cubic by default.
+            sparse_threshold  : magnitude up to which the values of a sparse
+                                density are negligible; the values of the
+                                parts of chunks that aren't written read as
+                                0 (default: 0, i.e., lossless)
+
+        Raises FileExistsError if a file that should be written already
+        exists and FileNotFoundError if a file that should be read doesn't
+        exist.
+        """
         self.file = None
-        access_modes = 'r', 'w'
+        # density dataset that is written slab by slab (see create_density)
+        self.density_dataset = None
+        # number of bytes of the densities that have been read and written
+        self.bytes_read = 0
+        self.bytes_written = 0
+        if compression is not None and compression not in COMPRESSION_FILTERS:
+            raise ValueError('Invalid compression filter.')
+        if contiguous and (compression is not None or chunk_shape is not None):
+            raise ValueError('Contiguous datasets can be neither chunked nor '
+                             'compressed.')
+        if contiguous and sparse:
+            raise ValueError('Contiguous datasets cannot be sparse.')
+        self.chunk_shape = chunk_shape
+        self.contiguous = contiguous
+        self.compression = compression
+        self.compression_level = compression_level
+        self.dtype = dtype
+        self.sparse = sparse
+        self.sparse_threshold = sparse_threshold
+        # block occupancy indices of the sparse datasets by their names (see
+        # _write_block)
+        self.block_occupancy: Dict[str, np.ndarray] = dict()
+        # statistics of the density datasets that are written via this object
+        # by their names (see write_statistics)
+        self.statistics: Dict[str, DensityStatistics] = dict()
+        access_modes = 'r', 'w', 'r+'
         if access_mode not in access_modes:
             raise ValueError('Invalid access mode.')
         if access_mode == 'w' and os.path.exists(file_path):
-            print(f'error: The file "{file_path}" already exists.',
-                  file=sys.stderr)
-            sys.exit(1)
-        if access_mode == 'r' and not os.path.exists(file_path):
-            print(f'error: The file "{file_path}" does not exist.')
-            sys.exit(1)
-        self.file = File(file_path, mode=access_mode)
+            raise FileExistsError(f'The file "{file_path}" already exists.')
+        if access_mode != 'w' and not os.path.exists(file_path):
+            raise FileNotFoundError(f'The file "{file_path}" does not '
+                                    f'exist.')
+        # Slabs that are thinner than the chunks only fill them partially, so
+        # the chunk cache has to hold a whole x-layer of chunks.
+        self.file = File(file_path, mode=access_mode,
+                         rdcc_nbytes=CHUNK_CACHE_BYTES)
+        # group from which the density and the grid limits are read (see
+        # use_level)
+        self.group = self.file
+        # name of the density dataset that is read (see use_density)
+        self.density_name = DENSITY_DATASET_NAME
+        # open density dataset that is read and its group and name (see
+        # _get_density)
+        self.read_dataset = None
+        self.read_dataset_key = None
 
     def __del__(self):
         if self.file is not None:
             self.file.close()
 
-    def read_density(self) -> np.ndarray:
-        density = np.array(self.file[DENSITY_DATASET_NAME], dtype=np.float64)
+    def read_density(self,
+                     selection=Ellipsis,
+                     dtype=np.float64,
+                     memory_map: bool = False) -> np.ndarray:
+        """
+        Reads the density.
+
+        Parameters
+        ----------
+            selection  : hyperslab that should be read, e.g., numpy.s_[10:20]
+            dtype      : data type of the returned density (None: data type of
+                         the dataset)
+            memory_map : If True and the dataset is stored contiguously, a
+                         read-only memory map of the dataset is returned
+                         instead of a copy (see memory_map_density). The
+                         memory map is only converted if `dtype` differs
+                         from the data type of the dataset.
+        """
+        if memory_map:
+            density = self.memory_map_density()
+            if density is not None:
+                density = np.asarray(density[selection], dtype=dtype)
+                self.bytes_read += density.nbytes
+                return density
+        density = np.asarray(self._get_density()[selection],
+                             dtype=dtype)
+        self.bytes_read += density.nbytes
         return density
 
+    def _get_density(self) -> Dataset:
+        """
+        Returns the density dataset that is read. It is kept open, so that
+        consecutive reads of overlapping hyperslabs reuse its chunk cache.
+        """
+        key = self.group.name, self.density_name
+        if self.read_dataset is None or self.read_dataset_key != key:
+            self.read_dataset = self.group[self.density_name]
+            self.read_dataset_key = key
+        return self.read_dataset
+
+    def memory_map_density(self) -> Optional[np.memmap]:
+        """
+        Returns a read-only memory map of the density or None if the density
+        isn't stored contiguously (i.e., if it is chunked or not allocated).
+        """
+        dataset = self._get_density()
+        if dataset.chunks is not None or dataset.external is not None:
+            return None
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return None
+        return np.memmap(self.file.filename,
+                         dtype=dataset.dtype,
+                         mode='r',
+                         offset=offset,
+                         shape=dataset.shape)
+
+    def read_density_shape(self) -> Tuple[int, ...]:
+        return self._get_density().shape
+
+    def read_density_dtype(self) -> np.dtype:
+        return self._get_density().dtype
+
+    def read_density_chunks(self) -> Optional[Tuple[int, ...]]:
+        """
+        Returns the chunk shape of the density or None if it is stored
+        contiguously.
+        """
+        return self._get_density().chunks
+
+    def read_density_into(self, density: np.ndarray) -> None:
+        """
+        Reads the density directly into the array `density` (e.g., a shared
+        array), converting it into the data type of the array.
+        """
+        self._get_density().read_direct(density)
+        self.bytes_read += density.nbytes
+
+    def read_density_names(self) -> List[str]:
+        """
+        Returns the names of the density datasets of the file: the name of
+        the density (if the file has one) followed by the names of the
+        components (see settings.get_component_name).
+        """
+        names = []
+        if DENSITY_DATASET_NAME in self.file:
+            names.append(DENSITY_DATASET_NAME)
+        if COMPONENTS_GROUP_NAME in self.file:
+            names += [dataset.name.lstrip('/')
+                      for dataset in self.file[COMPONENTS_GROUP_NAME].values()]
+        return names
+
+    def use_density(self, name: str) -> None:
+        """
+        Reads from now on the density dataset `name` (see read_density_names)
+        instead of the density.
+        """
+        if name not in self.group:
+            raise ValueError(f"The file has no density dataset '{name}'.")
+        self.density_name = name
+
+    def read_densities(self,
+                       names: Sequence[str],
+                       dtype=np.float64) -> np.ndarray:
+        """
+        Reads the density datasets `names`, which have to have the same
+        shape, into a single array densities[component, x_index, y_index,
+        z_index].
+        """
+        shape = self.group[names[0]].shape
+        densities = np.empty((len(names),) + tuple(shape), dtype=dtype)
+        for index, name in enumerate(names):
+            dataset = self.group[name]
+            if dataset.shape != shape:
+                raise ValueError('The density datasets have to have the same '
+                                 'shape.')
+            dataset.read_direct(densities[index])
+        self.bytes_read += densities.nbytes
+        return densities
+
+    def read_density_attributes(self, name: str) -> dict:
+        """
+        Returns the attributes of the density dataset `name`.
+        """
+        return dict(self.group[name].attrs)
+
+    def read_block_occupancy(self
+                             ) -> Optional[Tuple[np.ndarray, Tuple[int, ...]]]:
+        """
+        Returns the block occupancy index of a sparse density (see H5File)
+        and the shape of its blocks, i.e., of the chunks, or None if the
+        density isn't sparse. occupancy[i, j, k] is False if the block
+        density[i * nx:(i + 1) * nx, j * ny:(j + 1) * ny, k * nz:(k + 1) *
+        nz] with the block shape (nx, ny, nz) is 0.
+        """
+        name = (BLOCK_OCCUPANCY_GROUP_NAME
+                + self.group[self.density_name].name)
+        if name not in self.file:
+            return None
+        dataset = self.file[name]
+        return (np.array(dataset, dtype=bool),
+                tuple(int(n) for n in dataset.attrs['block shape']))
+
+    def read_spline_coefficients(self, dtype=None) -> Optional[np.ndarray]:
+        """
+        Returns the cubic B-spline coefficients of the density that have been
+        saved via write_spline_coefficients (in the data type `dtype`, None:
+        data type of the dataset) or None.
+        """
+        if SPLINE_COEFFICIENTS_DATASET_NAME not in self.group:
+            return None
+        coefficients = np.asarray(
+            self.group[SPLINE_COEFFICIENTS_DATASET_NAME][...], dtype=dtype
+        )
+        self.bytes_read += coefficients.nbytes
+        return coefficients
+
     def read_grid_volume_limits(self) -> np.ndarray:
-        limits = np.array(self.file['grid volume limits'], dtype=np.float64)
+        limits = np.array(self.group['grid volume limits'], dtype=np.float64)
         return limits
 
     def read_grid_cell_center_limits(self) -> np.ndarray:
-        limits = np.array(self.file['grid cell center limits'],
+        limits = np.array(self.group['grid cell center limits'],
                           dtype=np.float64)
         return limits
 
+    def read_levels(self) -> Dict[int, str]:
+        """
+        Returns the names of the groups of the levels of the density by their
+        downsampling factors. The full-resolution density is level 1.
+        """
+        levels = {1: '/'}
+        if PYRAMID_GROUP_NAME in self.file:
+            for group in self.file[PYRAMID_GROUP_NAME].values():
+                levels[int(group.attrs['factor'])] = group.name
+        return dict(sorted(levels.items()))
+
+    def use_level(self, factor: int) -> None:
+        """
+        Reads the density and the grid limits from now on from the level with
+        the downsampling factor `factor` (1: full resolution).
+        """
+        levels = self.read_levels()
+        if factor not in levels:
+            raise ValueError(f'The file has no level with the factor '
+                             f'{factor}.')
+        self.group = self.file[levels[factor]]
+
+    def select_level(self, cell_size: np.ndarray) -> int:
+        """
+        Reads the density from now on from the coarsest level whose cells
+        aren't larger than `cell_size` (x, y, and z size of the target cells)
+        along any axis, i.e., the coarsest level that still resolves the
+        target grid. Returns the downsampling factor of the level.
+        """
+        cell_size = np.asarray(cell_size, dtype=np.float64)
+        selected_factor = 1
+        for factor, name in self.read_levels().items():
+            group = self.file[name]
+            limits = np.array(group['grid volume limits'], dtype=np.float64)
+            shape = np.array(group[DENSITY_DATASET_NAME].shape)
+            level_cell_size = (limits[:, 1] - limits[:, 0]) / shape
+            # tolerance for the rounding errors of the limits
+            if np.all(level_cell_size <= cell_size * (1 + 1e-9)):
+                selected_factor = factor
+        self.use_level(selected_factor)
+        return selected_factor
+
+    def _get_density_layout(self,
+                            shape: Tuple[int, ...],
+                            dtype) -> dict:
+        """
+        Returns the keyword arguments of h5py.File.create_dataset that specify
+        the layout of a density dataset of the shape `shape`.
+        """
+        dtype = np.dtype(dtype if self.dtype is None else self.dtype)
+        layout = dict(dtype=dtype)
+        if self.contiguous:
+            return layout
+        if self.chunk_shape is None and self.sparse:
+            chunk_shape = get_cubic_chunk_shape(shape, dtype.itemsize)
+        elif self.chunk_shape is None:
+            chunk_shape = get_default_chunk_shape(shape, dtype.itemsize)
+        else:
+            chunk_shape = tuple(max(min(int(chunk), int(n)), 1)
+                                for chunk, n in zip(self.chunk_shape, shape))
+        layout['chunks'] = chunk_shape
+        if self.sparse:
+            layout['fillvalue'] = 0
+        if self.compression is not None:
+            layout['compression'] = self.compression
+            layout['shuffle'] = True
+            if self.compression == 'gzip':
+                layout['compression_opts'] = self.compression_level
+        return layout
+
     def _write_data(self,
                     name: str,
                     data: np.ndarray,
                     unit: str,
                     description: str) -> None:
         self.file.create_dataset(name, data=data)
+        self._write_attributes(name, unit, description)
+
+    def _write_attributes(self,
+                          name: str,
+                          unit: str,
+                          description: str) -> None:
         self.file[name].attrs.create('unit', unit)
         self.file[name].attrs.create('description', description)
 
-    def write_density(self, density: np.ndarray) -> None:
+    def _write_limits(self,
+                      prefix: str,
+                      grid_volume_limits: np.ndarray,
+                      grid_cell_center_limits: np.ndarray) -> None:
+        self._write_data(
+            name=prefix + 'grid volume limits',
+            data=grid_volume_limits,
+            unit='kpc',
+            description='x, y, and z limits of the volume represented by the '
+                        'grid',
+        )
         self._write_data(
-            name=DENSITY_DATASET_NAME,
-            data=density,
-            unit='cm^-3',
-            description='particle density of the gas',
+            name=prefix + 'grid cell center limits',
+            data=grid_cell_center_limits,
+            unit='kpc',
+            description='x, y, and z limits of the cell centers'
+        )
+
+    def _write_density_attributes(self,
+                                  name: str,
+                                  attributes: Optional[dict]) -> None:
+        self._write_attributes(
+            name=name,
+            unit=DENSITY_UNIT,
+            description=DENSITY_DESCRIPTION,
+        )
+        if name.startswith(COMPONENTS_GROUP_NAME + '/'):
+            self.file[name].attrs.create(
+                'component', name[len(COMPONENTS_GROUP_NAME) + 1:]
+            )
+        for key, value in (attributes or dict()).items():
+            if (key != PROGRESS_ATTRIBUTE_NAME
+                    and key not in STATISTICS_ATTRIBUTE_NAMES):
+                self.file[name].attrs[key] = value
+
+    def write_density(self,
+                      density: np.ndarray,
+                      name: str = DENSITY_DATASET_NAME,
+                      attributes: Optional[dict] = None) -> None:
+        """
+        Writes the density or, if `name` is the name of a component (see
+        settings.get_component_name), a density component.
+
+        Parameters
+        ----------
+            density    : density[x_index, y_index, z_index]
+            name       : name of the dataset
+            attributes : further attributes of the dataset, e.g., the ones of
+                         the source of an interpolated component
+        """
+        layout = self._get_density_layout(density.shape, density.dtype)
+        if self.sparse:
+            dataset = self.file.create_dataset(name, shape=density.shape,
+                                               **layout)
+            self.statistics[dataset.name] = DensityStatistics()
+            self._write_block(dataset, (0, 0, 0), density)
+        else:
+            dataset = self.file.create_dataset(name, data=density, **layout)
+            self.statistics[dataset.name] = DensityStatistics()
+            self.statistics[dataset.name].update(
+                density.astype(dataset.dtype, copy=False)
+            )
+            self.bytes_written += density.nbytes
+        self._write_density_attributes(name, attributes)
+
+    def create_density(self,
+                       shape: Tuple[int, ...],
+                       dtype=np.float64,
+                       name: str = DENSITY_DATASET_NAME,
+                       attributes: Optional[dict] = None) -> None:
+        """
+        Creates an empty density dataset (see write_density) that is filled
+        slab by slab via write_density_slab.
+        """
+        # The dataset is kept open because closing it flushes its chunk cache,
+        # i.e., partially written chunks would be compressed and written once
+        # per slab.
+        self.density_dataset = self.file.create_dataset(
+            name,
+            shape=tuple(shape),
+            **self._get_density_layout(shape, dtype)
+        )
+        self.statistics[self.density_dataset.name] = DensityStatistics()
+        self._write_density_attributes(name, attributes)
+
+    def open_density(self) -> None:
+        """
+        Opens the existing density dataset of a file opened with 'r+' for
+        writing it slab by slab via write_density_slab.
+        """
+        self.density_dataset = self.file[DENSITY_DATASET_NAME]
+
+    def write_progress(self, completed_x_planes: int) -> None:
+        """
+        Records that the x-planes [0, completed_x_planes) of the density have
+        been written and flushes the file, so that an interrupted run can be
+        resumed from there.
+        """
+        self.density_dataset.attrs[PROGRESS_ATTRIBUTE_NAME] = \
+            completed_x_planes
+        self.file.flush()
+
+    def read_progress(self) -> int:
+        """
+        Returns the number of x-planes recorded by write_progress.
+        """
+        dataset = self.file[DENSITY_DATASET_NAME]
+        return int(dataset.attrs.get(PROGRESS_ATTRIBUTE_NAME, 0))
+
+    def write_run_record(self, record: dict) -> None:
+        """
+        Saves the JSON-serializable description `record` of the inputs of the
+        run that writes the file.
+        """
+        self.file.attrs[RUN_RECORD_ATTRIBUTE_NAME] = json.dumps(
+            record, sort_keys=True
+        )
+
+    def read_run_record(self) -> Optional[dict]:
+        """
+        Returns the record saved by write_run_record or None.
+        """
+        if RUN_RECORD_ATTRIBUTE_NAME not in self.file.attrs:
+            return None
+        return json.loads(self.file.attrs[RUN_RECORD_ATTRIBUTE_NAME])
+
+    def write_shard_record(self,
+                           index: int,
+                           count: int,
+                           start: Sequence[int],
+                           grid_shape: Sequence[int]) -> None:
+        """
+        Records that the density of the file is the shard `index` of `count`
+        shards of a density of the shape `grid_shape` and that its first
+        element is located at the index `start` = (x, y, z) of the whole
+        density. The record should be written last, so that files of
+        interrupted runs aren't mistaken for complete shards.
+        """
+        self.file.attrs[SHARD_ATTRIBUTE_NAME] = json.dumps({
+            'index': int(index),
+            'count': int(count),
+            'start': [int(n) for n in start],
+            'grid shape': [int(n) for n in grid_shape],
+        })
+
+    def read_shard_record(self) -> Optional[dict]:
+        """
+        Returns the record saved by write_shard_record or None.
+        """
+        if SHARD_ATTRIBUTE_NAME not in self.file.attrs:
+            return None
+        return json.loads(self.file.attrs[SHARD_ATTRIBUTE_NAME])
+
+    def write_density_slab(self, x_start: int, slab: np.ndarray) -> None:
+        """
+        Writes the x-slab `slab` starting at the x index `x_start` into the
+        density dataset created by create_density.
+        """
+        self._write_block(self.density_dataset, (x_start, 0, 0), slab)
+
+    def write_density_region(self,
+                             start: Tuple[int, ...],
+                             block: np.ndarray) -> None:
+        """
+        Writes `block` into the existing density dataset such that
+        block[0, 0, 0] is written at the index `start` = (x, y, z).
+        """
+        self._write_block(self.file[DENSITY_DATASET_NAME], start, block)
+
+    def write_statistics(self,
+                         names: Optional[List[str]] = None,
+                         grid_shape: Optional[Tuple[int, ...]] = None
+                         ) -> None:
+        """
+        Saves the summary statistics of the density datasets `names`
+        (default: the ones created via this object) as attributes of the
+        datasets (see density_statistics). The grid volume limits have to be
+        written beforehand. The cell volume is determined from them and from
+        `grid_shape`, the shape of the whole grid (default: the grid shape of
+        the shard record or else the shape of the dataset).
+
+        The statistics of the datasets created via this object have been
+        accumulated while they were written, and their parts that haven't
+        been written are 0. The other datasets, e.g., a density that has
+        been completed by a resumed run, are read block by block.
+        """
+        volume_limits = self.file['grid volume limits'][()]
+        if grid_shape is None and self.read_shard_record() is not None:
+            grid_shape = self.read_shard_record()['grid shape']
+        if names is None:
+            names = list(self.statistics)
+        for name in names:
+            dataset = self.file[name]
+            cell_volume = get_cell_volume(
+                volume_limits,
+                dataset.shape if grid_shape is None else grid_shape,
+            )
+            statistics = self.statistics.get(dataset.name)
+            if statistics is None:
+                statistics = DensityStatistics()
+                plane_bytes = (max(int(np.prod(dataset.shape[1:])), 1)
+                               * dataset.dtype.itemsize)
+                planes_per_block = max(STATISTICS_BLOCK_BYTES // plane_bytes,
+                                       1)
+                for x_start in range(0, dataset.shape[0], planes_per_block):
+                    statistics.update(
+                        dataset[x_start:x_start + planes_per_block]
+                    )
+            else:
+                statistics.add_zeros(dataset.size - statistics.count)
+            for key, value in statistics.get_attributes(cell_volume).items():
+                dataset.attrs[key] = value
+
+    def read_statistics(self) -> Optional[dict]:
+        """
+        Returns the statistics of the density that is read (see
+        write_statistics) or None if they haven't been saved.
+        """
+        attributes = self._get_density().attrs
+        if STATISTICS_ATTRIBUTE_NAMES[0] not in attributes:
+            return None
+        return {name: attributes[name] for name in STATISTICS_ATTRIBUTE_NAMES}
+
+    def _is_negligible(self, block: np.ndarray) -> bool:
+        return bool(np.all(np.abs(block) <= self.sparse_threshold))
+
+    def _write_block(self,
+                     dataset: Dataset,
+                     start: Tuple[int, ...],
+                     block: np.ndarray) -> None:
+        """
+        Writes `block` into `dataset` such that block[0, 0, 0] is written at
+        the index `start`. If the dataset is sparse (see H5File), only the
+        parts of the block within chunks that are non-empty are written, so
+        all-zero chunks are never allocated, and the block occupancy index of
+        the dataset is updated.
+        """
+        statistics = self.statistics.get(dataset.name)
+        if statistics is not None:
+            statistics.update(block.astype(dataset.dtype, copy=False))
+        else:
+            # The statistics of an existing density are outdated once it is
+            # changed.
+            for name in STATISTICS_ATTRIBUTE_NAMES:
+                if name in dataset.attrs:
+                    del dataset.attrs[name]
+
+        index_name = BLOCK_OCCUPANCY_GROUP_NAME + dataset.name
+        is_sparse = (dataset.chunks is not None
+                     and (self.sparse or index_name in self.file))
+        if not is_sparse:
+            selection = tuple(slice(index, index + n)
+                              for index, n in zip(start, block.shape))
+            dataset[selection] = block
+            self.bytes_written += block.nbytes
+            return
+
+        chunk_shape = dataset.chunks
+        occupancy = self.block_occupancy.get(dataset.name)
+        if occupancy is None:
+            if index_name in self.file:
+                occupancy = np.array(self.file[index_name], dtype=bool)
+            else:
+                occupancy = np.zeros(
+                    [-(-n // chunk) for n, chunk in zip(dataset.shape,
+                                                        chunk_shape)],
+                    dtype=bool,
+                )
+            self.block_occupancy[dataset.name] = occupancy
+        chunk_ranges = [range(first // chunk, (first + n - 1) // chunk + 1)
+                        for first, n, chunk in zip(start, block.shape,
+                                                   chunk_shape)]
+        for chunk_index in itertools.product(*chunk_ranges):
+            selection = []
+            block_selection = []
+            for index, first, n, chunk in zip(chunk_index, start,
+                                              block.shape, chunk_shape):
+                lower = max(index * chunk, first)
+                upper = min((index + 1) * chunk, first + n)
+                selection.append(slice(lower, upper))
+                block_selection.append(slice(lower - first, upper - first))
+            part = block[tuple(block_selection)]
+            # Empty parts of chunks that already contain data are written as
+            # well because they could overwrite data.
+            if not occupancy[chunk_index] and self._is_negligible(part):
+                continue
+            dataset[tuple(selection)] = part
+            occupancy[chunk_index] = True
+            self.bytes_written += part.nbytes
+
+        if index_name in self.file:
+            self.file[index_name][...] = occupancy
+        else:
+            index = self.file.create_dataset(index_name, data=occupancy)
+            index.attrs.create('block shape', chunk_shape)
+            index.attrs.create('description',
+                               'whether the blocks of the shape "block '
+                               'shape" (the chunks) of the density contain '
+                               'data')
+
+    def write_spline_coefficients(self, coefficients: np.ndarray) -> None:
+        """
+        Saves the cubic B-spline coefficients of the density (see
+        tricubic_interpolation.get_spline_coefficients) next to the density
+        of the current level, so that they are only computed once.
+        """
+        name = (self.group.name.rstrip('/') + '/'
+                + SPLINE_COEFFICIENTS_DATASET_NAME)
+        if name in self.file:
+            del self.file[name]
+        self.file.create_dataset(
+            name,
+            data=coefficients,
+            **self._get_density_layout(coefficients.shape, coefficients.dtype)
+        )
+        self.bytes_written += coefficients.nbytes
+        self._write_attributes(
+            name=name,
+            unit=DENSITY_UNIT,
+            description='coefficients of the cubic B-splines (with mirror-'
+                        'symmetric boundaries) that interpolate the density',
         )
 
     def write_grid_limits(self,
                           grid_volume_limits: np.ndarray,
                           grid_cell_center_limits: np.ndarray) -> None:
+        self._write_limits('', grid_volume_limits, grid_cell_center_limits)
+
+    def write_sky_map(self,
+                      column_densities: np.ndarray,
+                      longitudes: np.ndarray,
+                      latitudes: np.ndarray,
+                      distance_limits: np.ndarray,
+                      observer: np.ndarray) -> None:
+        """
+        Writes a sky map of column densities (see column_density).
+
+        Parameters
+        ----------
+            column_densities : column_densities[shell, longitude_index,
+                               latitude_index] / cm^-2
+            longitudes       : longitudes of the pixel centers / degree
+            latitudes        : latitudes of the pixel centers / degree
+            distance_limits  : limits of the distance shells / kpc
+            observer         : x, y, and z position of the observer / kpc
+        """
+        self.file.create_dataset(
+            COLUMN_DENSITY_DATASET_NAME,
+            data=column_densities,
+            **self._get_density_layout(column_densities.shape,
+                                       column_densities.dtype)
+        )
+        self.bytes_written += column_densities.nbytes
+        self._write_attributes(
+            name=COLUMN_DENSITY_DATASET_NAME,
+            unit=COLUMN_DENSITY_UNIT,
+            description='column density of the gas along the line of sight '
+                        'within each distance shell',
+        )
         self._write_data(
-            name='grid volume limits',
-            data=grid_volume_limits,
+            name='longitudes',
+            data=longitudes,
+            unit='degree',
+            description='Galactic longitudes of the pixel centers',
+        )
+        self._write_data(
+            name='latitudes',
+            data=latitudes,
+            unit='degree',
+            description='Galactic latitudes of the pixel centers',
+        )
+        self._write_data(
+            name='distance limits',
+            data=distance_limits,
             unit='kpc',
-            description='x, y, and z limits of the volume represented by the '
-                        'grid',
+            description='limits of the distance shells',
         )
         self._write_data(
-            name='grid cell center limits',
-            data=grid_cell_center_limits,
+            name='observer',
+            data=observer,
             unit='kpc',
-            description='x, y, and z limits of the cell centers'
+            description='x, y, and z position of the observer',
         )
+
+    def write_pyramid(self,
+                      factors: Sequence[int] = DEFAULT_PYRAMID_FACTORS
+                      ) -> None:
+        """
+        Writes downsampled levels of the density, which has to be written
+        together with the grid limits beforehand. Each level consists of the
+        averages of blocks of factor x factor x factor cells and is stored
+        with its own grid limits in the group 'pyramid/<factor>x' (see
+        use_level and select_level). Cells at the upper ends of the axes that
+        don't fill a whole block are left out, so the volume of a level can
+        be slightly smaller than the one of the full-resolution density.
+
+        Parameters
+        ----------
+            factors : increasing downsampling factors; each factor has to be
+                      a multiple of the previous one
+        """
+        # levels of an interrupted run are replaced
+        if PYRAMID_GROUP_NAME in self.file:
+            del self.file[PYRAMID_GROUP_NAME]
+            self.read_dataset = None
+        index_group_name = f'{BLOCK_OCCUPANCY_GROUP_NAME}/{PYRAMID_GROUP_NAME}'
+        if index_group_name in self.file:
+            del self.file[index_group_name]
+        self.block_occupancy = {
+            name: occupancy
+            for name, occupancy in self.block_occupancy.items()
+            if not name.startswith(f'/{PYRAMID_GROUP_NAME}/')
+        }
+        source = self.file[DENSITY_DATASET_NAME]
+        volume_limits = np.array(self.file['grid volume limits'],
+                                 dtype=np.float64)
+        cell_size = (volume_limits[:, 1] - volume_limits[:, 0]) / source.shape
+        previous_factor = 1
+        for factor in factors:
+            if factor <= previous_factor or factor % previous_factor != 0:
+                raise ValueError('Each factor of the pyramid has to be a '
+                                 'multiple of the previous one.')
+            # Each level is averaged from the previous one, which is exact
+            # since all blocks have the same size.
+            ratio = factor // previous_factor
+            shape = tuple(n // ratio for n in source.shape)
+            if min(shape) == 0:
+                break
+            group_name = f'{PYRAMID_GROUP_NAME}/{factor}x'
+            group = self.file.require_group(group_name)
+            group.attrs.create('factor', factor)
+            dataset = group.create_dataset(
+                DENSITY_DATASET_NAME,
+                shape=shape,
+                **self._get_density_layout(shape, source.dtype)
+            )
+            self._write_attributes(
+                name=dataset.name,
+                unit=DENSITY_UNIT,
+                description=f'{DENSITY_DESCRIPTION} averaged over blocks of '
+                            f'{factor}^3 cells',
+            )
+            plane_bytes = max(ratio * shape[1] * ratio * shape[2]
+                              * ratio * 8, 1)
+            planes_per_block = max(PYRAMID_BLOCK_BYTES // plane_bytes, 1)
+            for x_start in range(0, shape[0], planes_per_block):
+                x_stop = min(x_start + planes_per_block, shape[0])
+                block = np.asarray(source[x_start * ratio:x_stop * ratio,
+                                          :shape[1] * ratio,
+                                          :shape[2] * ratio],
+                                   dtype=np.float64)
+                block = block.reshape(x_stop - x_start, ratio,
+                                      shape[1], ratio,
+                                      shape[2], ratio).mean(axis=(1, 3, 5))
+                self._write_block(dataset, (x_start, 0, 0), block)
+            level_cell_size = cell_size * factor
+            level_volume_limits = np.empty((3, 2))
+            level_volume_limits[:, 0] = volume_limits[:, 0]
+            level_volume_limits[:, 1] = (volume_limits[:, 0]
+                                         + level_cell_size * np.array(shape))
+            level_cell_center_limits = np.empty((3, 2))
+            level_cell_center_limits[:, 0] = (level_volume_limits[:, 0]
+                                              + level_cell_size / 2)
+            level_cell_center_limits[:, 1] = (level_volume_limits[:, 1]
+                                              - level_cell_size / 2)
+            self._write_limits(group_name + '/',
+                               level_volume_limits,
+                               level_cell_center_limits)
+            source = dataset
+            previous_factor = factor
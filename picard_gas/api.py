@@ -0,0 +1,177 @@
+"""
+Projects a gas distribution onto a Picard grid within a Python program,
+without the H5 files of the console scripts.
+
+Errors are raised as exceptions: FileNotFoundError if a file doesn't exist,
+parameter_file.ParameterFileError if a grid parameter is missing, and
+ValueError if the arguments are invalid.
+
+Usage:
+    density, volume_limits, cell_center_limits = project(
+        'H2_dens_mean_model_1.fits', 'galaxy.nx'
+    )
+    density, volume_limits, cell_center_limits = project(
+        distribution, {'x_min': -20., 'x_max': 20., 'n_xgrid': 201, ...},
+        grid_volume_limits=distribution_volume_limits,
+    )
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.picard_grid import parse_parameter_file
+from picard_gas.parameter_file import ParameterFileError
+from picard_gas.tricubic_interpolation import TricubicInterpolation
+from picard_gas.trilinear_interpolation import get_grid_weights
+from picard_gas.trilinear_interpolation import resample_with_weights
+import numpy as np
+import os
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+METHODS = 'trilinear', 'tricubic'
+GRID_PARAMETERS = ('x_min', 'x_max', 'n_xgrid',
+                   'y_min', 'y_max', 'n_ygrid',
+                   'z_min', 'z_max', 'n_zgrid')
+
+
+def read_fits(fits_file_path: str,
+              dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads a 3D FITS file from https://zenodo.org/record/5501196.
+
+    Parameters
+    ----------
+        fits_file_path : path of the FITS file
+        dtype          : data type of the returned density; if None, the
+                         memory map of the file is returned without copying
+                         it for unscaled data and float64 for scaled data
+
+    Returns
+    -------
+        density and x, y, and z limits of the volume represented by the grid
+    """
+    # astropy is only needed for FITS files
+    from astropy.io import fits
+    from picard_gas.fits_file import get_grid_limits
+
+    if not os.path.exists(fits_file_path):
+        raise FileNotFoundError(f"The file '{fits_file_path}' does not "
+                                f"exist.")
+    # The scaling is applied plane by plane below because astropy would
+    # otherwise load the whole data and scale it in a temporary copy.
+    with fits.open(fits_file_path,
+                   memmap=True,
+                   do_not_scale_image_data=True) as header_data_unit_list:
+        header = header_data_unit_list[0].header
+        grid_volume_limits, _ = get_grid_limits(header)
+        data = header_data_unit_list[0].data
+        scale = header.get('BSCALE', 1)
+        zero = header.get('BZERO', 0)
+        if scale != 1 or zero != 0:
+            scaled_data = np.empty(data.shape,
+                                   dtype=np.float64 if dtype is None
+                                   else dtype)
+            for x_index in range(data.shape[0]):
+                # computed in float64 like in fits_to_h5
+                scaled_data[x_index] = (
+                    np.asarray(data[x_index], dtype=np.float64) * scale
+                    + zero
+                )
+            data = scaled_data
+        elif dtype is not None:
+            # a single copy that also converts the byte order
+            data = np.asarray(data, dtype=dtype)
+        # Otherwise, the data remain valid after closing the file since
+        # astropy keeps the memory map open as long as it is referenced.
+    return data, grid_volume_limits
+
+
+def get_parameters(parameters: Union[str, Dict[str, float]]) -> dict:
+    """
+    Returns the grid parameters of a parameter file path or checks the
+    parameter dictionary.
+    """
+    if isinstance(parameters, str):
+        if not os.path.exists(parameters):
+            raise FileNotFoundError(f"The file '{parameters}' does not "
+                                    f"exist.")
+        return parse_parameter_file(parameters)
+    missing_parameters = [name for name in GRID_PARAMETERS
+                          if name not in parameters]
+    if missing_parameters:
+        raise ParameterFileError(f'The grid parameters '
+                                 f'{", ".join(missing_parameters)} are '
+                                 f'missing.')
+    return {name: (int(parameters[name]) if name.startswith('n_')
+                   else float(parameters[name]))
+            for name in GRID_PARAMETERS}
+
+
+def project(source: Union[str, np.ndarray],
+            parameters: Union[str, Dict[str, float]],
+            grid_volume_limits: Optional[np.ndarray] = None,
+            method: str = 'trilinear',
+            dtype=np.float64
+            ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Projects a gas distribution onto a Picard grid. The result is the same
+    as the one of fits_to_h5 followed by interpolate_gas.
+
+    Parameters
+    ----------
+        source             : path of a FITS file or 3D density
+                             density[x_index, y_index, z_index]
+        parameters         : path of a Picard parameter file (*.nx) or
+                             dictionary of the grid parameters x_min, x_max,
+                             n_xgrid, y_min, ... (see
+                             picard_grid.parse_parameter_file)
+        grid_volume_limits : x, y, and z limits of the volume represented by
+                             the grid of the density (only if `source` is an
+                             array)
+        method             : 'trilinear' or 'tricubic'
+        dtype              : data type in which the density is interpolated;
+                             if None, the data type of the source is used,
+                             which avoids copying the source
+
+    Returns
+    -------
+        projected density, x, y, and z limits of the volume represented by
+        the Picard grid, and x, y, and z limits of its cell centers
+    """
+    if method not in METHODS:
+        raise ValueError(f"Invalid interpolation method '{method}'.")
+    if isinstance(source, str):
+        if grid_volume_limits is not None:
+            raise ValueError('The grid limits of a FITS file are read from '
+                             'the file.')
+        density, grid_volume_limits = read_fits(source, dtype)
+    else:
+        if grid_volume_limits is None:
+            raise ValueError('The grid limits of the density are missing.')
+        density = (source if dtype is None
+                   else np.asarray(source, dtype=dtype))
+    grid_volume_limits = np.asarray(grid_volume_limits, dtype=np.float64)
+    if density.ndim != 3 or grid_volume_limits.shape != (3, 2):
+        raise ValueError('The density has to be 3D, and the grid limits '
+                         'have to have the shape (3, 2).')
+
+    picard_grid = get_picard_grid(get_parameters(parameters))
+    if method == 'tricubic':
+        interpolation = TricubicInterpolation(density, grid_volume_limits)
+        projected_density = interpolation.resample(picard_grid['x centers'],
+                                                   picard_grid['y centers'],
+                                                   picard_grid['z centers'],
+                                                   fill_value=0.)
+    else:
+        weights = get_grid_weights(grid_volume_limits,
+                                   density.shape,
+                                   picard_grid['x centers'],
+                                   picard_grid['y centers'],
+                                   picard_grid['z centers'])
+        projected_density = resample_with_weights(density, weights,
+                                                  fill_value=0.)
+    return (projected_density,
+            picard_grid['volume limits'],
+            picard_grid['cell center limits'])
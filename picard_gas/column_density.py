@@ -0,0 +1,291 @@
+"""
+Integrates a gas density along lines of sight that start at an observer,
+e.g., for sky maps of the column density of HI or H2.
+
+The rays are clipped to the grid before they are sampled, so no samples are
+evaluated outside the grid, and the samples of many rays are interpolated at
+once (see TrilinearInterpolation.evaluate). The column densities are
+integrated with the midpoint rule in distance shells, e.g., [0, 1), [1, 2),
+and [2, inf) kpc.
+
+Usage:
+    longitudes, latitudes = get_sky_grid(n_longitudes, n_latitudes)
+    directions = get_directions(observer, longitudes, latitudes)
+    column_densities = integrate_columns(density, volume_limits, observer,
+                                         directions, distance_limits, step)
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.trilinear_interpolation import TrilinearInterpolation
+from picard_gas.metrics import ProgressReporter
+from picard_gas.shared_array import SharedArray
+from multiprocessing import Pool
+import numpy as np
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+KPC_IN_CM = 3.0856775814913673e21
+# maximum number of samples that are interpolated at once
+SAMPLES_PER_BATCH = 2**20
+# number of blocks of directions per job (several blocks per job balance the
+# load because rays through the disk are much longer than the others)
+BLOCKS_PER_JOB = 8
+
+# shared density and integration settings of the worker processes
+_worker_state = dict()
+
+
+def get_sky_grid(n_longitudes: int,
+                 n_latitudes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the longitudes [0, 360) and the latitudes [-90, 90] / degree of
+    the pixel centers of a full-sky grid with equally spaced longitudes and
+    latitudes.
+    """
+    longitudes = (np.arange(n_longitudes) + 0.5) * 360. / n_longitudes
+    latitudes = (np.arange(n_latitudes) + 0.5) * 180. / n_latitudes - 90.
+    return longitudes, latitudes
+
+
+def get_directions(observer: np.ndarray,
+                   longitudes: np.ndarray,
+                   latitudes: np.ndarray) -> np.ndarray:
+    """
+    Returns the unit vectors (x, y, z) of the directions of the sky grid
+    spanned by `longitudes` and `latitudes` / degree as an array of the
+    shape (len(longitudes) * len(latitudes), 3), ordered like
+    numpy.meshgrid(longitudes, latitudes, indexing='ij').
+
+    The longitude 0 points from the observer towards the z axis (i.e., the
+    Galactic Center), the longitude increases counterclockwise as seen from
+    +z, and the latitude 90 points to +z.
+    """
+    observer = np.asarray(observer, dtype=np.float64)
+    distance_to_axis = np.hypot(observer[0], observer[1])
+    if distance_to_axis == 0:
+        raise ValueError('The observer must not be located on the z axis.')
+    towards_center = np.array([-observer[0], -observer[1], 0.])
+    towards_center /= distance_to_axis
+    up = np.array([0., 0., 1.])
+    left = np.cross(up, towards_center)
+    longitude, latitude = np.meshgrid(np.radians(longitudes),
+                                      np.radians(latitudes),
+                                      indexing='ij')
+    longitude = longitude.ravel()[:, np.newaxis]
+    latitude = latitude.ravel()[:, np.newaxis]
+    return (np.cos(latitude) * np.cos(longitude) * towards_center
+            + np.cos(latitude) * np.sin(longitude) * left
+            + np.sin(latitude) * up)
+
+
+def get_ray_limits(observer: np.ndarray,
+                   directions: np.ndarray,
+                   lower_limits: np.ndarray,
+                   upper_limits: np.ndarray
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the distances at which the rays enter and leave the box
+    [lower_limits, upper_limits]. The entry distance is at least 0, and rays
+    that miss the box leave it before they enter it.
+    """
+    observer = np.asarray(observer, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower_distances = (lower_limits - observer) / directions
+        upper_distances = (upper_limits - observer) / directions
+    # rays that are parallel to a pair of faces are either always or never
+    # between them
+    is_parallel = directions == 0
+    is_between = (lower_limits <= observer) & (observer <= upper_limits)
+    lower_distances = np.where(is_parallel,
+                               np.where(is_between, -np.inf, np.inf),
+                               lower_distances)
+    upper_distances = np.where(is_parallel,
+                               np.where(is_between, np.inf, -np.inf),
+                               upper_distances)
+    entry = np.minimum(lower_distances, upper_distances).max(axis=1)
+    exit_ = np.maximum(lower_distances, upper_distances).min(axis=1)
+    return np.maximum(entry, 0.), exit_
+
+
+def get_segments(volume_limits: np.ndarray,
+                 shape: Tuple[int, ...],
+                 observer: np.ndarray,
+                 directions: np.ndarray,
+                 distance_limits: np.ndarray,
+                 step: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the segments of the rays within the grid and within the distance
+    shells, ordered by ray and shell (see integrate_columns for the
+    parameters).
+
+    Returns
+    -------
+        starts           : distances / kpc at which the segments start
+        n_samples        : numbers of samples of the segments (0 if a ray
+                           doesn't pass through the grid within a shell)
+        sample_distances : distances / kpc between the samples of the
+                           segments
+    """
+    cell_size = (volume_limits[:, 1] - volume_limits[:, 0]) / shape
+    # The density is interpolated between the first and the last cell center
+    # and 0 elsewhere.
+    entry, exit_ = get_ray_limits(observer, directions,
+                                  volume_limits[:, 0] + cell_size / 2,
+                                  volume_limits[:, 1] - cell_size / 2)
+    distance_limits = np.asarray(distance_limits, dtype=np.float64)
+    starts = np.maximum(entry[:, np.newaxis], distance_limits[:-1]).ravel()
+    stops = np.minimum(exit_[:, np.newaxis], distance_limits[1:]).ravel()
+    lengths = np.maximum(stops - starts, 0.)
+    n_samples = np.ceil(lengths / step).astype(np.intp)
+    sample_distances = np.divide(lengths, n_samples,
+                                 out=np.zeros_like(lengths),
+                                 where=n_samples > 0)
+    return starts, n_samples, sample_distances
+
+
+def integrate_columns(density: np.ndarray,
+                      volume_limits: np.ndarray,
+                      observer: np.ndarray,
+                      directions: np.ndarray,
+                      distance_limits: np.ndarray,
+                      step: float,
+                      progress: Optional[ProgressReporter] = None
+                      ) -> np.ndarray:
+    """
+    Integrates the density along the rays from the observer in the
+    directions `directions`.
+
+    Parameters
+    ----------
+        density         : 3D density / cm^-3: density[x_index, y_index,
+                          z_index]
+        volume_limits   : x, y, and z limits of the volume represented by the
+                          grid of the density / kpc
+        observer        : (x, y, z) position of the observer / kpc
+        directions      : (N, 3) unit vectors of the rays
+        distance_limits : increasing limits of the distance shells / kpc,
+                          e.g., [0, inf] for the whole line of sight
+        step            : maximum distance between two samples / kpc
+        progress        : reporter of the number of finished rays
+
+    Returns
+    -------
+        column densities / cm^-2 of the shape (N, number of shells)
+    """
+    interpolation = TrilinearInterpolation(density, volume_limits)
+    observer = np.asarray(observer, dtype=np.float64)
+    n_directions = len(directions)
+    n_shells = len(distance_limits) - 1
+    starts, n_samples, sample_distances = get_segments(
+        volume_limits, density.shape, observer, directions, distance_limits,
+        step
+    )
+
+    column_densities = np.zeros(n_directions * n_shells)
+    # The segments are split into batches of about SAMPLES_PER_BATCH
+    # samples, which always contain whole rays.
+    samples_per_ray = n_samples.reshape(n_directions, n_shells).sum(axis=1)
+    cumulative_samples = np.cumsum(samples_per_ray)
+    ray_start = 0
+    while ray_start < n_directions:
+        done = cumulative_samples[ray_start - 1] if ray_start > 0 else 0
+        ray_stop = int(np.searchsorted(cumulative_samples,
+                                       done + SAMPLES_PER_BATCH,
+                                       side='right'))
+        ray_stop = min(max(ray_stop, ray_start + 1), n_directions)
+        segments = slice(ray_start * n_shells, ray_stop * n_shells)
+        counts = n_samples[segments]
+        segment_indices = np.repeat(np.arange(len(counts)), counts)
+        first_samples = np.cumsum(counts) - counts
+        sample_indices = (np.arange(len(segment_indices))
+                          - first_samples[segment_indices])
+        distances = (starts[segments][segment_indices]
+                     + (sample_indices + 0.5)
+                     * sample_distances[segments][segment_indices])
+        ray_indices = ray_start + segment_indices // n_shells
+        locations = (observer
+                     + distances[:, np.newaxis] * directions[ray_indices])
+        values = interpolation.evaluate(locations, fill_value=0.)
+        column_densities[segments] = np.bincount(
+            segment_indices,
+            weights=values * sample_distances[segments][segment_indices],
+            minlength=len(counts),
+        )
+        if progress is not None:
+            progress.update(ray_stop)
+        ray_start = ray_stop
+    return column_densities.reshape(n_directions, n_shells) * KPC_IN_CM
+
+
+def _initialize_worker(density_name: str,
+                       density_shape: Tuple[int, ...],
+                       density_dtype: np.dtype,
+                       volume_limits: np.ndarray,
+                       observer: np.ndarray,
+                       distance_limits: np.ndarray,
+                       step: float) -> None:
+    _worker_state['density'] = SharedArray(density_shape, density_dtype,
+                                           name=density_name)
+    _worker_state['arguments'] = (volume_limits, observer, distance_limits,
+                                  step)
+
+
+def _integrate_block(directions: np.ndarray) -> np.ndarray:
+    volume_limits, observer, distance_limits, step = \
+        _worker_state['arguments']
+    return integrate_columns(_worker_state['density'].array,
+                             volume_limits,
+                             observer,
+                             directions,
+                             distance_limits,
+                             step)
+
+
+def get_direction_blocks(n_directions: int,
+                         n_blocks: int) -> List[Tuple[int, int]]:
+    """
+    Splits the direction indices [0, n_directions) into at most n_blocks
+    ranges [start, stop) of similar size.
+    """
+    n_blocks = max(min(n_blocks, n_directions), 1)
+    block_limits = np.linspace(0, n_directions, n_blocks + 1).astype(int)
+    return [(int(start), int(stop))
+            for start, stop in zip(block_limits[:-1], block_limits[1:])]
+
+
+def integrate_columns_parallel(density: np.ndarray,
+                               volume_limits: np.ndarray,
+                               observer: np.ndarray,
+                               directions: np.ndarray,
+                               distance_limits: np.ndarray,
+                               step: float,
+                               jobs: int) -> np.ndarray:
+    """
+    Parallel version of integrate_columns: The directions are split into
+    blocks that are integrated by a pool of `jobs` processes, which share
+    the density read-only via shared memory. The result is identical to the
+    one of integrate_columns.
+    """
+    blocks = get_direction_blocks(len(directions), jobs * BLOCKS_PER_JOB)
+    column_densities = np.empty((len(directions), len(distance_limits) - 1))
+    shared_density = SharedArray(density.shape, density.dtype)
+    try:
+        shared_density.array[...] = density
+        initial_arguments = (shared_density.name, shared_density.shape,
+                             shared_density.dtype, volume_limits,
+                             np.asarray(observer, dtype=np.float64),
+                             distance_limits, step)
+        progress = ProgressReporter(len(blocks))
+        with Pool(jobs, _initialize_worker, initial_arguments) as pool:
+            results = pool.imap(_integrate_block,
+                                [directions[start:stop]
+                                 for start, stop in blocks])
+            for block_index, ((start, stop), block) in enumerate(
+                    zip(blocks, results)):
+                column_densities[start:stop] = block
+                progress.update(block_index + 1)
+        progress.finish()
+    finally:
+        shared_density.close()
+    return column_densities
@@ -0,0 +1,145 @@
+"""
+Command-line arguments that are shared by several console scripts.
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.settings import COMPRESSION_FILTERS
+from picard_gas.settings import DEFAULT_COMPRESSION
+from picard_gas.settings import DEFAULT_COMPRESSION_LEVEL
+from picard_gas.settings import DEFAULT_PYRAMID_FACTORS
+from picard_gas.metrics import Metrics
+import argparse
+import sys
+
+
+def add_layout_arguments(parser: argparse.ArgumentParser,
+                         default_dtype_description: str = 'data type of the '
+                                                          'source') -> None:
+    """
+    Adds the arguments that specify the layout of the written density
+    dataset (see H5File). By default, the density is written in the data type
+    of the data (described by `default_dtype_description`).
+    """
+    group = parser.add_argument_group('layout of the written density')
+
+    group.add_argument('--chunk-shape',
+                       metavar=('<x>', '<y>', '<z>'),
+                       dest='chunk_shape',
+                       type=int,
+                       nargs=3,
+                       help='shape of the chunks (default: whole y axis and '
+                            'about 1 MiB per chunk)')
+
+    group.add_argument('--contiguous',
+                       action='store_true',
+                       help='store the density contiguously (neither chunked '
+                            'nor compressed)')
+
+    group.add_argument('--compression',
+                       choices=COMPRESSION_FILTERS + ('none',),
+                       default=DEFAULT_COMPRESSION,
+                       help='compression filter, which is combined with the '
+                            'shuffle filter (default = '
+                            f'{DEFAULT_COMPRESSION})')
+
+    group.add_argument('--compression-level',
+                       metavar='<level>',
+                       dest='compression_level',
+                       type=int,
+                       choices=range(10),
+                       default=DEFAULT_COMPRESSION_LEVEL,
+                       help='gzip compression level 0 - 9 (default = '
+                            f'{DEFAULT_COMPRESSION_LEVEL})')
+
+    group.add_argument('--dtype',
+                       choices=('float32', 'float64'),
+                       help='data type of the density (default = '
+                            f'{default_dtype_description})')
+
+    group.add_argument('--sparse',
+                       action='store_true',
+                       help="don't allocate the empty (all-zero) chunks of "
+                            'the density and write an index of the non-empty '
+                            'ones, from which empty regions are skipped; the '
+                            'chunks are cubic by default')
+
+    group.add_argument('--sparse-threshold',
+                       metavar='<cm^-3>',
+                       dest='sparse_threshold',
+                       type=float,
+                       default=0.,
+                       help='with --sparse, parts of chunks whose values are '
+                            'at most this large in magnitude are treated as '
+                            'empty, i.e., as 0 (default = 0, lossless)')
+
+    factors = ', '.join(f'{factor}x' for factor in DEFAULT_PYRAMID_FACTORS)
+    group.add_argument('--pyramid',
+                       action='store_true',
+                       help=f'also write the {factors} block averages of the '
+                            'density with their own grid limits, from which '
+                            'coarse grids and plots can be read faster')
+
+
+def get_layout(arguments: argparse.Namespace) -> dict:
+    """
+    Returns the keyword arguments of H5File that correspond to the arguments
+    added by add_layout_arguments.
+    """
+    if arguments.contiguous:
+        if arguments.chunk_shape is not None:
+            print('Error: --contiguous cannot be combined with --chunk-shape.',
+                  file=sys.stderr)
+            sys.exit(1)
+        compression = None
+    else:
+        compression = (None if arguments.compression == 'none'
+                       else arguments.compression)
+    if arguments.sparse and arguments.contiguous:
+        print('Error: --sparse cannot be combined with --contiguous.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.sparse_threshold < 0:
+        print('Error: The sparse threshold has to be non-negative.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.chunk_shape is not None and min(arguments.chunk_shape) < 1:
+        print('Error: The chunk shape has to be positive.', file=sys.stderr)
+        sys.exit(1)
+    return dict(
+        chunk_shape=arguments.chunk_shape,
+        contiguous=arguments.contiguous,
+        compression=compression,
+        compression_level=arguments.compression_level,
+        dtype=arguments.dtype,
+        sparse=arguments.sparse,
+        sparse_threshold=arguments.sparse_threshold,
+    )
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments for reporting the time spent in each stage, the
+    throughput, and the peak memory (see metrics.Metrics).
+    """
+    group = parser.add_argument_group('profiling')
+
+    group.add_argument('--profile',
+                       action='store_true',
+                       help='print the wall and CPU time of each stage, the '
+                            'throughput, and the peak memory')
+
+    group.add_argument('--metrics-json',
+                       metavar='<metrics *.json>',
+                       dest='metrics_json',
+                       help='JSON file into which the metrics are saved')
+
+
+def report_metrics(metrics: Metrics, arguments: argparse.Namespace) -> None:
+    """
+    Prints and/or saves the metrics as requested by the arguments added by
+    add_metrics_arguments.
+    """
+    if arguments.profile:
+        metrics.print_summary()
+    if arguments.metrics_json is not None:
+        metrics.write_json(arguments.metrics_json)
@@ -0,0 +1,100 @@
+"""
+The command picard-gas, whose subcommands replace the console scripts:
+
+    picard-gas convert      (fits_to_h5)
+    picard-gas interpolate  (interpolate_gas)
+    picard-gas merge        (merge_h5)
+    picard-gas batch        (interpolate_gas_batch)
+    picard-gas plot         (plot_h5)
+    picard-gas columns      (integrate_columns)
+    picard-gas compare      (compare_h5)
+    picard-gas info         (the datasets and attributes of an H5 file)
+
+The arguments are parsed and checked with the light parsers of the module
+parsers. Only then, the module of the chosen subcommand is imported, so only
+the libraries that it needs are loaded, e.g., astropy only for convert and
+matplotlib only for plot. The former console scripts are aliases of the
+subcommands.
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import PARSERS
+from picard_gas.console_scripts.parsers import parse_arguments
+import argparse
+import importlib
+from typing import List
+from typing import Optional
+
+# module with the function run(arguments) of each subcommand
+SUBCOMMAND_MODULES = {
+    'convert': 'picard_gas.console_scripts.fits_to_h5',
+    'interpolate': 'picard_gas.console_scripts.interpolate_gas',
+    'merge': 'picard_gas.console_scripts.merge_h5',
+    'batch': 'picard_gas.console_scripts.interpolate_gas_batch',
+    'plot': 'picard_gas.console_scripts.plot_h5',
+    'columns': 'picard_gas.console_scripts.integrate_columns',
+    'compare': 'picard_gas.console_scripts.compare_h5',
+    'info': 'picard_gas.console_scripts.info',
+}
+
+
+def run_subcommand(subcommand: str, arguments: argparse.Namespace) -> None:
+    """
+    Imports the module of the subcommand and runs it with the parsed
+    arguments.
+    """
+    module = importlib.import_module(SUBCOMMAND_MODULES[subcommand])
+    exit_on_user_error(module.run)(arguments)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='picard-gas',
+        description='Converts, projects, and inspects the gas distributions '
+                    'for Picard.',
+    )
+    subparsers = parser.add_subparsers(metavar='<subcommand>',
+                                       dest='subcommand',
+                                       required=True)
+    for subcommand, (description, add_arguments, _) in PARSERS.items():
+        add_arguments(subparsers.add_parser(subcommand,
+                                            help=description,
+                                            description=description))
+    arguments = parser.parse_args(args)
+    _, _, check_arguments = PARSERS[arguments.subcommand]
+    check_arguments(arguments)
+    run_subcommand(arguments.subcommand, arguments)
+
+
+# aliases of the former console scripts
+def fits_to_h5() -> None:
+    run_subcommand('convert', parse_arguments('convert'))
+
+
+def interpolate_gas() -> None:
+    run_subcommand('interpolate', parse_arguments('interpolate'))
+
+
+def merge_h5() -> None:
+    run_subcommand('merge', parse_arguments('merge'))
+
+
+def interpolate_gas_batch() -> None:
+    run_subcommand('batch', parse_arguments('batch'))
+
+
+def plot_h5() -> None:
+    run_subcommand('plot', parse_arguments('plot'))
+
+
+def integrate_columns() -> None:
+    run_subcommand('columns', parse_arguments('columns'))
+
+
+def compare_h5() -> None:
+    run_subcommand('compare', parse_arguments('compare'))
+
+
+if __name__ == '__main__':
+    main()
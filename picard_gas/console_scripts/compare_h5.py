@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Compares the density of an H5 file with the density of a reference H5 file,
+e.g., the projections of two releases, without loading either of them into
+the memory: The densities are read in x-slabs of whole chunks, which are
+compared by one or several processes (see density_comparison).
+
+The grid limits and the shapes of the densities have to be equal. The
+maximum absolute and relative errors with their locations, the RMS error,
+and the fraction of the values outside the tolerance are printed. The script
+exits with 1 if more values than allowed by --max-fraction are outside the
+tolerance, so it can be used as a check in a pipeline:
+    compare_h5 old/galaxy.h5 new/galaxy.h5 --rtol 1e-6 --fail-fast
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.density_comparison import DensityDifference
+from picard_gas.metrics import Metrics
+from picard_gas.metrics import ProgressReporter
+from picard_gas.settings import get_component_name
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import sys
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# state of a worker process (see _initialize_worker)
+_worker_state = dict()
+
+
+def exit_with_error(message: str) -> None:
+    print(f'Error: {message}', file=sys.stderr)
+    sys.exit(1)
+
+
+def open_density(file_path: str, component: Optional[str]) -> H5File:
+    """
+    Opens the H5 file for reading the density or, if `component` isn't None,
+    the density component `component`.
+    """
+    h5_file = H5File(file_path, 'r')
+    if component is not None:
+        name = get_component_name(component)
+        if name not in h5_file.read_density_names():
+            exit_with_error(f"'{file_path}' has no component '{component}'.")
+        h5_file.use_density(name)
+    return h5_file
+
+
+def check_grids(reference_file: H5File, compared_file: H5File) -> None:
+    """
+    Exits if the densities don't have the same shape or grid limits.
+    """
+    if (reference_file.read_density_shape()
+            != compared_file.read_density_shape()):
+        exit_with_error(f'The shapes of the densities differ: '
+                        f'{reference_file.read_density_shape()} (reference) '
+                        f'and {compared_file.read_density_shape()}.')
+    for read_limits in ('read_grid_volume_limits',
+                        'read_grid_cell_center_limits'):
+        reference_limits = getattr(reference_file, read_limits)()
+        compared_limits = getattr(compared_file, read_limits)()
+        if not np.allclose(reference_limits, compared_limits,
+                           rtol=1e-12, atol=1e-12):
+            exit_with_error('The grid limits of the densities differ.')
+
+
+def get_slabs(reference_file: H5File,
+              block_size: int) -> List[Tuple[int, int]]:
+    """
+    Returns the x-slabs (x start, x stop) in which the densities are
+    compared. Their thickness is a multiple of the chunks of the reference,
+    and they contain approximately `block_size` bytes of float64 values.
+    """
+    n_x, n_y, n_z = reference_file.read_density_shape()
+    plane_bytes = max(n_y * n_z, 1) * np.dtype(np.float64).itemsize
+    chunk_x_size = (reference_file.read_density_chunks() or (1,))[0]
+    planes_per_slab = max(block_size // plane_bytes // chunk_x_size, 1)
+    planes_per_slab *= chunk_x_size
+    return [(x_start, min(x_start + planes_per_slab, n_x))
+            for x_start in range(0, n_x, planes_per_slab)]
+
+
+def compare_slab(reference_file: H5File,
+                 compared_file: H5File,
+                 slab: Tuple[int, int],
+                 rtol: float,
+                 atol: float) -> DensityDifference:
+    """
+    Returns the differences between the x-slabs `slab` = (x start, x stop)
+    of the densities.
+    """
+    x_start, x_stop = slab
+    difference = DensityDifference(rtol, atol)
+    difference.update((x_start, 0, 0),
+                      reference_file.read_density(np.s_[x_start:x_stop],
+                                                  dtype=None),
+                      compared_file.read_density(np.s_[x_start:x_stop],
+                                                 dtype=None))
+    return difference
+
+
+def _initialize_worker(reference_file_path: str,
+                       compared_file_path: str,
+                       component: Optional[str],
+                       rtol: float,
+                       atol: float) -> None:
+    # The files are opened by each worker because open HDF5 files can't be
+    # passed to other processes.
+    _worker_state['files'] = (open_density(reference_file_path, component),
+                              open_density(compared_file_path, component))
+    _worker_state['tolerances'] = rtol, atol
+
+
+def _compare_slab(slab: Tuple[int, int]) -> DensityDifference:
+    return compare_slab(*_worker_state['files'], slab,
+                        *_worker_state['tolerances'])
+
+
+def compare_slabs(arguments: argparse.Namespace,
+                  reference_file: H5File,
+                  compared_file: H5File,
+                  slabs: List[Tuple[int, int]]
+                  ) -> Iterator[DensityDifference]:
+    """
+    Yields the differences of the slabs in their order, which are compared
+    by `arguments.jobs` processes.
+    """
+    if arguments.jobs == 1:
+        for slab in slabs:
+            yield compare_slab(reference_file, compared_file, slab,
+                               arguments.rtol, arguments.atol)
+        return
+    initial_arguments = (arguments.reference_file_path,
+                         arguments.compared_file_path,
+                         arguments.component,
+                         arguments.rtol,
+                         arguments.atol)
+    # Leaving the with statement early, e.g., after the first failure,
+    # terminates the workers.
+    with Pool(arguments.jobs, _initialize_worker, initial_arguments) as pool:
+        yield from pool.imap(_compare_slab, slabs)
+
+
+def format_location(index: Optional[Tuple[int, ...]],
+                    reference_file: H5File) -> str:
+    """
+    Returns the index (x, y, z) and the position / kpc of a cell.
+    """
+    if index is None:
+        return '-'
+    limits = reference_file.read_grid_cell_center_limits()
+    shape = np.array(reference_file.read_density_shape())
+    cell_size = (limits[:, 1] - limits[:, 0]) / np.maximum(shape - 1, 1)
+    position = limits[:, 0] + np.array(index) * cell_size
+    return (f"({', '.join(map(str, index))}), i.e., "
+            f"({', '.join(f'{value:.6g}' for value in position)}) kpc")
+
+
+def print_report(difference: DensityDifference,
+                 reference_file: H5File,
+                 n_values: int) -> None:
+    fraction = difference.n_outside / max(difference.count, 1)
+    print(f'compared values        : {difference.count} of {n_values}')
+    location = format_location(difference.max_abs_error_index,
+                               reference_file)
+    line = (f'maximum absolute error : {difference.max_abs_error:.6g} '
+            f'cm^-3 at {location}')
+    if difference.max_abs_error_values is not None:
+        reference_value, compared_value = difference.max_abs_error_values
+        line += (f' (reference: {reference_value:.9g}, compared: '
+                 f'{compared_value:.9g})')
+    print(line)
+    location = format_location(difference.max_rel_error_index,
+                               reference_file)
+    print(f'maximum relative error : {difference.max_rel_error:.6g} at '
+          f'{location}')
+    print(f'RMS error              : {difference.get_rms_error():.6g} cm^-3')
+    print(f'outside the tolerance  : {difference.n_outside} values '
+          f'({fraction:.6g})')
+    if difference.n_nan > 0:
+        print(f'values with NaN        : {difference.n_nan}')
+
+
+def compare_files(arguments: argparse.Namespace, metrics: Metrics) -> bool:
+    """
+    Compares the densities of the files, prints the differences, and
+    returns whether the fraction of the values outside the tolerance is
+    allowed.
+    """
+    reference_file = open_density(arguments.reference_file_path,
+                                  arguments.component)
+    compared_file = open_density(arguments.compared_file_path,
+                                 arguments.component)
+    check_grids(reference_file, compared_file)
+
+    n_values = int(np.prod(reference_file.read_density_shape()))
+    # maximum number of values outside the tolerance
+    max_outside = int(arguments.max_fraction * n_values)
+    slabs = get_slabs(reference_file, int(arguments.block_size * 2**20))
+    bytes_per_value = (reference_file.read_density_dtype().itemsize
+                       + compared_file.read_density_dtype().itemsize)
+    difference = DensityDifference(arguments.rtol, arguments.atol)
+    progress = ProgressReporter(len(slabs))
+    with metrics.stage('compare'):
+        results = compare_slabs(arguments, reference_file, compared_file,
+                                slabs)
+        for slab_index, slab_difference in enumerate(results):
+            difference.merge(slab_difference)
+            metrics.count('bytes read',
+                          slab_difference.count * bytes_per_value)
+            progress.update(slab_index + 1)
+            if arguments.fail_fast and difference.n_outside > max_outside:
+                results.close()
+                break
+    progress.finish()
+
+    print_report(difference, reference_file, n_values)
+    if difference.n_outside > max_outside:
+        stopped = (' (stopped at the first failure)'
+                   if difference.count < n_values else '')
+        print(f'Error: More than {max_outside} values are outside the '
+              f'tolerance{stopped}.', file=sys.stderr)
+        return False
+    return True
+
+
+def run(arguments: argparse.Namespace) -> None:
+    metrics = Metrics()
+    is_equal = compare_files(arguments, metrics)
+    report_metrics(metrics, arguments)
+    if not is_equal:
+        sys.exit(1)
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('compare'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Reporting of the errors raised by the library in the console scripts.
+
+Author: Stefan Lepperdinger
+"""
+import functools
+import sys
+from typing import Callable
+
+# errors that are caused by the input of the user and are, therefore,
+# reported without a traceback; ValueError includes
+# parameter_file.ParameterFileError and the invalid input files or options
+# reported by the library
+USER_ERRORS = FileExistsError, FileNotFoundError, ValueError
+
+
+def exit_on_user_error(main: Callable[..., None]) -> Callable[..., None]:
+    """
+    Decorates the main function of a console script (or the run function of
+    a subcommand, see cli) such that the errors in USER_ERRORS are printed to
+    stderr and the script exits with 1.
+    """
+    @functools.wraps(main)
+    def wrapped_main(*args, **kwargs) -> None:
+        try:
+            main(*args, **kwargs)
+        except USER_ERRORS as error:
+            print(f'Error: {error}', file=sys.stderr)
+            sys.exit(1)
+    return wrapped_main
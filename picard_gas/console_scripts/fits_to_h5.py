@@ -2,76 +2,221 @@
 """
 Converts the 3D FITS files from https://zenodo.org/record/5501196 to H5 files.
 
+The FITS file is memory-mapped and copied into the H5 file block by block, so
+the conversion doesn't need memory for the whole distribution. If the source
+is a directory, all FITS files within it are converted in parallel.
+
+Several FITS files of the same grid, e.g., HI and H2 of several gas-flow
+models, can be collected in a single H5 file as named density components
+(see --component), which interpolate_gas projects in a single pass.
+
 Author: Stefan Lepperdinger
 """
 from astropy.io import fits
 from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import get_layout
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.fits_file import get_grid_limits
+from picard_gas.metrics import Metrics
+from picard_gas.settings import get_component_name
+from multiprocessing import Pool
 import numpy as np
 import argparse
+import glob
+import os
 import sys
+from typing import List
+from typing import Optional
+from typing import Tuple
 
+# Conversion task of a worker process:
+# (source path, destination path, layout of the density, block size in bytes,
+#  whether the pyramid is written)
+Task = Tuple[str, str, dict, int, bool]
 
-def read_fits_file(fits_file_path):
-    try:
-        with fits.open(fits_file_path) as header_data_unit_list:
-            header = header_data_unit_list[0].header
-            # x, y, and z limits of the volume represented by the grid
-            grid_volume_limits = []
-            # x, y, and z limits of the cell centers
-            grid_cell_center_limits = []
-            for coordinate in range(1, 4):  # 1, 2, 3 = x, y, z
-                first_cell_center = header[f'CRVAL{coordinate}']
-                cell_width = header[f'CDELT{coordinate}']
-                lower_volume_limit = first_cell_center - cell_width/2
-                assert lower_volume_limit < 0
-                # I assume the distribution is centered at the Galactic Center
-                upper_volume_limit = -lower_volume_limit
-                upper_cell_center = upper_volume_limit - cell_width/2
-                grid_volume_limits.append([
-                    lower_volume_limit,
-                    upper_volume_limit,
-                ])
-                grid_cell_center_limits.append([
-                    first_cell_center,
-                    upper_cell_center,
-                ])
-            grid_volume_limits = np.array(grid_volume_limits)
-            grid_cell_center_limits = np.array(grid_cell_center_limits)
-            data = header_data_unit_list[0].data
-    except FileNotFoundError:
-        print(f"File '{fits_file_path}' not found.", file=sys.stderr)
+
+def open_component_file(h5_file_path: str,
+                        layout: dict,
+                        component: str,
+                        shape: Tuple[int, ...],
+                        grid_volume_limits: np.ndarray) -> H5File:
+    """
+    Opens the H5 file to which the density component `component` of the
+    shape `shape` is added. A new file is created if it doesn't exist yet.
+    The densities of an existing file have to have the same grid.
+    """
+    if not os.path.exists(h5_file_path):
+        return H5File(h5_file_path, 'w', **layout)
+    h5_file = H5File(h5_file_path, 'r+', **layout)
+    name = get_component_name(component)
+    if name in h5_file.file:
+        print(f"Error: The file '{h5_file_path}' already contains the "
+              f"component '{component}'.", file=sys.stderr)
+        sys.exit(1)
+    names = h5_file.read_density_names()
+    has_same_grid = (
+        all(h5_file.file[other].shape == tuple(shape) for other in names)
+        and np.allclose(h5_file.read_grid_volume_limits(),
+                        grid_volume_limits)
+    )
+    if not has_same_grid:
+        print(f"Error: The grid of the component '{component}' differs from "
+              f"the one of '{h5_file_path}'.", file=sys.stderr)
         sys.exit(1)
+    return h5_file
 
-    return data, grid_volume_limits, grid_cell_center_limits
 
+def convert_fits_file(fits_file_path: str,
+                      h5_file_path: str,
+                      layout: dict,
+                      block_size: int,
+                      pyramid: bool = False,
+                      component: Optional[str] = None,
+                      metrics: Optional[Metrics] = None) -> None:
+    """
+    Copies the memory-mapped FITS file into the H5 file in blocks of
+    approximately `block_size` bytes. The byte order is converted into the
+    native one block by block. If `pyramid` is True, the downsampled levels
+    of the density are written as well (see H5File.write_pyramid). If
+    `component` is given, the density is added as this component to the H5
+    file (see settings.get_component_name), which may already contain other
+    components of the same grid. The time spent reading and writing is
+    recorded in `metrics`.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    # The error is raised instead of exiting because this function also
+    # runs in the worker processes of a directory conversion, whose errors
+    # are reported by the parent process.
+    try:
+        # The scaling is applied block by block as well because astropy
+        # would otherwise load the whole scaled data into the memory.
+        header_data_unit_list = fits.open(fits_file_path,
+                                          memmap=True,
+                                          do_not_scale_image_data=True)
+    except FileNotFoundError as error:
+        raise FileNotFoundError(
+            f"The FITS file '{fits_file_path}' doesn't exist."
+        ) from error
+    with header_data_unit_list:
+        header = header_data_unit_list[0].header
+        grid_volume_limits, grid_cell_center_limits = get_grid_limits(header)
+        data = header_data_unit_list[0].data
+        scale = header.get('BSCALE', 1)
+        zero = header.get('BZERO', 0)
+        is_scaled = scale != 1 or zero != 0
+        dtype = (np.dtype(np.float64) if is_scaled
+                 else data.dtype.newbyteorder('='))
+
+        if component is None:
+            h5_file = H5File(h5_file_path, 'w', **layout)
+            h5_file.create_density(data.shape, dtype)
+        else:
+            h5_file = open_component_file(h5_file_path, layout,
+                                          component, data.shape,
+                                          grid_volume_limits)
+            h5_file.create_density(
+                data.shape, dtype,
+                name=get_component_name(component),
+                attributes={
+                    'source file': os.path.basename(fits_file_path),
+                },
+            )
+        plane_size = max(int(np.prod(data.shape[1:])) * dtype.itemsize, 1)
+        planes_per_block = max(block_size // plane_size, 1)
+        # Blocks that are aligned with the chunks write each chunk only
+        # once instead of compressing it again for each block.
+        chunks = h5_file.density_dataset.chunks
+        if chunks is not None and planes_per_block > chunks[0]:
+            planes_per_block -= planes_per_block % chunks[0]
+        for x_start in range(0, data.shape[0], planes_per_block):
+            with metrics.stage('read source'):
+                block = np.asarray(
+                    data[x_start:x_start + planes_per_block], dtype=dtype
+                )
+                if is_scaled:
+                    block = block * scale + zero
+            metrics.count('bytes read', block.nbytes)
+            with metrics.stage('write destination'):
+                h5_file.write_density_slab(x_start, block)
+        if 'grid volume limits' not in h5_file.file:
+            with metrics.stage('write destination'):
+                h5_file.write_grid_limits(grid_volume_limits,
+                                          grid_cell_center_limits)
+        with metrics.stage('write statistics'):
+            h5_file.write_statistics()
+        if pyramid:
+            with metrics.stage('write pyramid'):
+                h5_file.write_pyramid()
+        with metrics.stage('write destination'):
+            h5_file.file.close()
+        metrics.count('bytes written', h5_file.bytes_written)
+        metrics.count('files converted', 1)
+        del data
 
-def parse_arguments():
-    parser = argparse.ArgumentParser(
-        description='Converts the 3D FITS files from '
-                    'https://zenodo.org/record/5501196 to H5 files.',
-    )
 
-    parser.add_argument(metavar='<source *.fits>',
-                        dest='source_path',
-                        help='path of the fits file')
+def _convert(task: Task) -> Tuple[str, Metrics]:
+    metrics = Metrics()
+    convert_fits_file(*task, metrics=metrics)
+    return task[1], metrics
 
-    parser.add_argument(metavar='<destination *.h5>',
-                        dest='destination_path',
-                        help='path of the H5 file')
 
-    arguments = parser.parse_args()
+def get_tasks(source_path: str,
+              destination_path: str,
+              layout: dict,
+              block_size: int,
+              pyramid: bool = False) -> List[Task]:
+    """
+    Returns the conversion of a single file or, if the source is a
+    directory, of all FITS files within it into the destination directory.
+    """
+    if not os.path.isdir(source_path):
+        return [(source_path, destination_path, layout, block_size,
+                 pyramid)]
+    fits_file_paths = sorted(glob.glob(os.path.join(source_path, '*.fits')))
+    if len(fits_file_paths) == 0:
+        raise FileNotFoundError(f"The directory '{source_path}' doesn't "
+                                f"contain FITS files.")
+    os.makedirs(destination_path, exist_ok=True)
+    tasks = []
+    for fits_file_path in fits_file_paths:
+        file_name = os.path.splitext(os.path.basename(fits_file_path))[0]
+        h5_file_path = os.path.join(destination_path, file_name + '.h5')
+        tasks.append((fits_file_path, h5_file_path, layout, block_size,
+                      pyramid))
+    return tasks
 
-    return arguments
 
+def run(arguments: argparse.Namespace) -> None:
+    tasks = get_tasks(arguments.source_path,
+                      arguments.destination_path,
+                      get_layout(arguments),
+                      int(arguments.block_size * 2**20),
+                      arguments.pyramid)
+    for _, h5_file_path, _, _, _ in tasks:
+        # components are added to existing files
+        if os.path.exists(h5_file_path) and arguments.component is None:
+            raise FileExistsError(f"The file '{h5_file_path}' already "
+                                  f"exists.")
 
+    metrics = Metrics()
+    if len(tasks) == 1:
+        convert_fits_file(*tasks[0], component=arguments.component,
+                          metrics=metrics)
+    else:
+        with Pool(min(arguments.jobs, len(tasks))) as pool:
+            for h5_file_path, task_metrics in pool.imap_unordered(_convert,
+                                                                  tasks):
+                print(h5_file_path, flush=True)
+                metrics.merge(task_metrics)
+    report_metrics(metrics, arguments)
+
+
+@exit_on_user_error
 def main():
-    arguments = parse_arguments()
-    density, grid_volume_limits, grid_cell_center_limits = read_fits_file(
-        arguments.source_path
-    )
-    h5_file = H5File(arguments.destination_path, 'w')
-    h5_file.write_density(density)
-    h5_file.write_grid_limits(grid_volume_limits, grid_cell_center_limits)
+    run(parse_arguments('convert'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Prints the datasets of an H5 file written by the console scripts, i.e., their
+shapes, data types, layouts, and attributes, as well as the values of the
+small datasets such as the grid limits. Only the metadata of the densities
+are read, so this is fast even for large files.
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import parse_arguments
+from h5py import Dataset
+import argparse
+from typing import List
+
+# attribute values that are longer are shortened
+MAX_ATTRIBUTE_LENGTH = 200
+
+
+def format_size(n_bytes: int) -> str:
+    """
+    Returns the size `n_bytes` in B, KiB, MiB, or GiB.
+    """
+    for unit in ('B', 'KiB', 'MiB'):
+        if n_bytes < 2**10:
+            return f'{n_bytes:.4g} {unit}'
+        n_bytes /= 2**10
+    return f'{n_bytes:.4g} GiB'
+
+
+def format_value(value) -> str:
+    """
+    Returns the value of an attribute or of a small dataset as a string.
+    """
+    if isinstance(value, bytes):
+        value = value.decode()
+    elif hasattr(value, 'tolist'):
+        value = value.tolist()
+    text = str(value)
+    if len(text) > MAX_ATTRIBUTE_LENGTH:
+        text = text[:MAX_ATTRIBUTE_LENGTH - 3] + '...'
+    return text
+
+
+def describe_dataset(dataset: Dataset, max_values: int) -> List[str]:
+    """
+    Returns the lines that describe the dataset: its shape, data type, and
+    layout, its values if it has at most `max_values` elements, and its
+    attributes.
+    """
+    lines = [f'{dataset.name}: shape {dataset.shape}, {dataset.dtype}']
+    if dataset.chunks is None:
+        lines.append('    contiguous')
+    else:
+        filters = [f'{dataset.compression} {dataset.compression_opts}'
+                   if dataset.compression == 'gzip'
+                   else str(dataset.compression)]
+        if dataset.shuffle:
+            filters.append('shuffle')
+        n_chunks = 1
+        for n, chunk_size in zip(dataset.shape, dataset.chunks):
+            n_chunks *= -(-n // chunk_size)
+        lines.append(f'    chunks {dataset.chunks}, '
+                     f'{dataset.id.get_num_chunks()} / {n_chunks} '
+                     f'allocated, compression: {", ".join(filters)}')
+    lines.append(f'    {format_size(dataset.id.get_storage_size())} stored, '
+                 f'{format_size(dataset.nbytes)} uncompressed')
+    if dataset.size <= max_values:
+        lines.append(f'    values: {format_value(dataset[()])}')
+    lines.extend(f'    {name}: {format_value(value)}'
+                 for name, value in dataset.attrs.items())
+    return lines
+
+
+def run(arguments: argparse.Namespace) -> None:
+    h5_file = H5File(arguments.h5_file_path, 'r')
+    file = h5_file.file
+    lines = [f'{file.filename}: {format_size(file.id.get_filesize())}']
+    lines.extend(f'    {name}: {format_value(value)}'
+                 for name, value in file.attrs.items())
+
+    def visit(_, item):
+        if isinstance(item, Dataset):
+            lines.extend(describe_dataset(item, arguments.max_values))
+
+    file.visititems(visit)
+    print('\n'.join(lines))
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('info'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Integrates a gas density along the lines of sight of a full-sky grid of
+pixels and saves the column densities as a sky map (see column_density).
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.column_density import get_directions
+from picard_gas.column_density import get_segments
+from picard_gas.column_density import get_sky_grid
+from picard_gas.column_density import integrate_columns
+from picard_gas.column_density import integrate_columns_parallel
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import DEFAULT_STEP
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.metrics import Metrics
+from picard_gas.metrics import ProgressReporter
+from picard_gas.settings import get_component_name
+import argparse
+import numpy as np
+import sys
+
+
+def integrate_file(arguments: argparse.Namespace, metrics: Metrics) -> None:
+    """
+    Integrates the density of the source file along the lines of sight and
+    writes the sky map into the destination file, recording each stage in
+    `metrics`.
+    """
+    source_file = H5File(arguments.source_file_path, 'r')
+    if arguments.component is not None:
+        name = get_component_name(arguments.component)
+        if name not in source_file.read_density_names():
+            print(f"Error: The source file has no component "
+                  f"'{arguments.component}'.", file=sys.stderr)
+            sys.exit(1)
+        source_file.use_density(name)
+    destination_file = H5File(arguments.destination_file_path, 'w')
+
+    with metrics.stage('read source'):
+        density = source_file.read_density()
+        volume_limits = source_file.read_grid_volume_limits()
+    cell_size = (volume_limits[:, 1] - volume_limits[:, 0]) / density.shape
+    step = (arguments.step if arguments.step is not None
+            else DEFAULT_STEP * cell_size.min())
+    observer = np.array(arguments.observer)
+    distance_limits = np.array(arguments.distances)
+    longitudes, latitudes = get_sky_grid(arguments.n_longitudes,
+                                         arguments.n_latitudes)
+    directions = get_directions(observer, longitudes, latitudes)
+    n_samples = get_segments(volume_limits, density.shape, observer,
+                             directions, distance_limits, step)[1]
+    metrics.count('rays', len(directions))
+    metrics.count('points interpolated', int(n_samples.sum()))
+
+    with metrics.stage('interpolate'):
+        if arguments.jobs > 1:
+            column_densities = integrate_columns_parallel(
+                density, volume_limits, observer, directions,
+                distance_limits, step, arguments.jobs
+            )
+        else:
+            progress = ProgressReporter(len(directions))
+            column_densities = integrate_columns(
+                density, volume_limits, observer, directions,
+                distance_limits, step, progress=progress
+            )
+            progress.finish()
+
+    # [ray, shell] -> [shell, longitude, latitude]
+    sky_map = column_densities.T.reshape(len(distance_limits) - 1,
+                                         len(longitudes),
+                                         len(latitudes))
+    with metrics.stage('write destination'):
+        destination_file.write_sky_map(sky_map, longitudes, latitudes,
+                                       distance_limits, observer)
+        destination_file.file.close()
+    metrics.count('bytes read', source_file.bytes_read)
+    metrics.count('bytes written', destination_file.bytes_written)
+
+
+def run(arguments: argparse.Namespace) -> None:
+    metrics = Metrics()
+    integrate_file(arguments, metrics)
+    report_metrics(metrics, arguments)
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('columns'))
+
+
+if __name__ == '__main__':
+    main()
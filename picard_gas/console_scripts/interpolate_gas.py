@@ -7,91 +7,1090 @@ simulation via trilinear interpolation.
 Author: Stefan Lepperdinger
 """
 from picard_gas.trilinear_interpolation import TrilinearInterpolation
-from picard_gas.trilinear_interpolation import PointNotWithinGrid
+from picard_gas.trilinear_interpolation import AxisWeights
+from picard_gas.trilinear_interpolation import get_axis_weights
+from picard_gas.trilinear_interpolation import get_compute_dtype
+from picard_gas.trilinear_interpolation import get_grid_weights
+from picard_gas.trilinear_interpolation import get_within_range
+from picard_gas.trilinear_interpolation import resample_with_weights
+from picard_gas.tricubic_interpolation import TricubicInterpolation
+from picard_gas.tricubic_interpolation import get_spline_coefficients
+from picard_gas.H5File import DENSITY_DATASET_NAME
 from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import get_layout
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import DEFAULT_CHECKPOINT_INTERVAL
+from picard_gas.console_scripts.parsers import check_component_arguments
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.metrics import Metrics
+from picard_gas.metrics import ProgressReporter
+from picard_gas.operator_cache import OperatorCache
+from picard_gas.shared_array import SharedArray
 from picard_gas.picard_grid import get_picard_grid
 from picard_gas.picard_grid import parse_parameter_file
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+import itertools
 import sys
 import argparse
 import numpy as np
 import os
+import time
 from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+BYTES_PER_VALUE = np.dtype(np.float64).itemsize
+# data types in which the distribution can be read (None: data type of the
+# dataset)
+PRECISIONS = {
+    'float64': np.float64,
+    'float32': np.float32,
+    'native': None,
+}
+# number of blocks per job into which the Picard grid is split when
+# interpolating in parallel (several blocks per job balance the load)
+BLOCKS_PER_JOB = 4
+# relative tolerance when comparing the grid limits of an existing destination
+# file with the ones of the Picard grid
+LIMITS_TOLERANCE = 1e-9
+# blocks of the Picard grid into which a sparse source is interpolated if the
+# destination isn't chunked (see interpolate_sparse)
+SPARSE_BLOCK_SHAPE = 32, 32, 32
+
+# index ranges [start, stop) along the x, y, and z axis of a sub-block of the
+# Picard grid
+Region = Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]
+
+# shared arrays and interpolation weights of the worker processes
+_worker_state = dict()
 
 
 def interpolate(distribution: np.ndarray,
                 grid_volume_limits: np.ndarray,
-                picard_grid: Dict[str, np.ndarray]) -> np.ndarray:
+                picard_grid: Dict[str, np.ndarray],
+                separable: bool = True,
+                weights: Optional[List[AxisWeights]] = None) -> np.ndarray:
+    """
+    Evaluates the distribution at the grid points of the Picard grid.
+
+    Parameters
+    ----------
+        distribution       : 3D gas density
+        grid_volume_limits : x, y, and z limits of the volume represented by
+                             the grid of the distribution
+        picard_grid        : see picard_grid.get_picard_grid
+        separable          : Both grids are regular, so by default the
+                             interpolation is carried out axis by axis (see
+                             TrilinearInterpolation.resample). If False, the
+                             distribution is evaluated point by point.
+        weights            : precomputed x, y, and z weights of the Picard
+                             grid (see get_source_weights), e.g., from the
+                             operator cache
+    """
+    if separable and weights is not None:
+        return resample_with_weights(distribution, weights, fill_value=0.)
+
     interpolation = TrilinearInterpolation(distribution, grid_volume_limits)
 
+    if separable:
+        return interpolation.resample(picard_grid['x centers'],
+                                      picard_grid['y centers'],
+                                      picard_grid['z centers'],
+                                      fill_value=0.)
+
     x_centers = picard_grid['x centers']
     y_centers = picard_grid['y centers']
     z_centers = picard_grid['z centers']
     grid_shape = picard_grid['shape']
-    converted_distribution = np.zeros(shape=grid_shape)
+    converted_distribution = np.zeros(shape=grid_shape,
+                                      dtype=interpolation.compute_dtype)
+
+    # (y, z) locations of an x-plane of the grid
+    y_plane, z_plane = np.meshgrid(y_centers, z_centers, indexing='ij')
+    y_plane = y_plane.ravel()
+    z_plane = z_plane.ravel()
 
+    progress = ProgressReporter(len(x_centers))
     for x_index, x_center in enumerate(x_centers):
-        percent = round(x_index / (len(x_centers) - 1) * 100)
-        print(f'{percent} %', end='\r', flush=True)
-        for y_index, y_center in enumerate(y_centers):
-            for z_index, z_center in enumerate(z_centers):
-                try:
-                    density = interpolation(x_center, y_center, z_center)
-                except PointNotWithinGrid:
-                    density = 0.
-                converted_distribution[x_index, y_index, z_index] = density
-    print(flush=True)
+        densities = interpolation.evaluate(x_center, y_plane, z_plane,
+                                           fill_value=0.)
+        converted_distribution[x_index] = densities.reshape(grid_shape[1:])
+        progress.update(x_index + 1)
+    progress.finish()
     return converted_distribution
 
 
-def parse_arguments() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(
-        description='Projects the numerical distribution onto the grid '
-                    'specified by the Picard parameter file.',
-    )
+def get_source_weights(grid_volume_limits: np.ndarray,
+                       source_shape: Tuple[int, ...],
+                       picard_grid: Dict[str, np.ndarray]
+                       ) -> List[AxisWeights]:
+    """
+    Determines the x, y, and z interpolation weights (see
+    trilinear_interpolation.get_axis_weights) of the Picard grid within the
+    grid of the distribution without reading the distribution.
+    """
+    return get_grid_weights(grid_volume_limits,
+                            source_shape,
+                            picard_grid['x centers'],
+                            picard_grid['y centers'],
+                            picard_grid['z centers'])
+
+
+def get_source_window(x_weights: AxisWeights,
+                      x_start: int,
+                      x_stop: int) -> Tuple[int, int]:
+    """
+    Returns the range of source x indices that is needed for interpolating
+    the target x-slab [x_start, x_stop).
+    """
+    cell_index, _, within_grid = x_weights
+    cell_index = cell_index[x_start:x_stop][within_grid[x_start:x_stop]]
+    if len(cell_index) == 0:
+        return 0, 0
+    return int(cell_index.min()), int(cell_index.max()) + 2
+
+
+def get_x_slabs(x_weights: AxisWeights,
+                source_shape: Tuple[int, ...],
+                target_shape: Tuple[int, ...],
+                max_memory: float,
+                item_size: int = BYTES_PER_VALUE) -> List[Tuple[int, int]]:
+    """
+    Splits the target grid into x-slabs [x_start, x_stop) such that the
+    source window and the intermediate arrays of each slab approximately fit
+    into `max_memory` bytes. Each slab contains at least one x-plane.
+    `item_size` is the size of the values in bytes.
+    """
+    _, source_ny, source_nz = source_shape
+    _, target_ny, target_nz = target_shape
+    source_plane_bytes = source_ny * source_nz * item_size
+    # the three contractions along x, y, and z create a lower, an upper, and a
+    # weighted plane each
+    target_plane_bytes = 3 * (source_ny * source_nz
+                              + target_ny * source_nz
+                              + target_ny * target_nz) * item_size
+
+    cell_index, _, within_grid = x_weights
+
+    def window_bytes(lowest_index, highest_index):
+        if lowest_index is None:
+            return 0
+        return (highest_index - lowest_index + 2) * source_plane_bytes
+
+    slabs = []
+    x_start = 0
+    lowest_index = highest_index = None
+    for x_index in range(target_shape[0]):
+        index = int(cell_index[x_index]) if within_grid[x_index] else None
+        new_lowest, new_highest = lowest_index, highest_index
+        if index is not None:
+            new_lowest = index if lowest_index is None else min(lowest_index,
+                                                                index)
+            new_highest = index if highest_index is None else max(
+                highest_index, index
+            )
+        slab_bytes = (window_bytes(new_lowest, new_highest)
+                      + (x_index - x_start + 1) * target_plane_bytes)
+        if slab_bytes > max_memory and x_index > x_start:
+            slabs.append((x_start, x_index))
+            x_start = x_index
+            new_lowest = new_highest = index
+        lowest_index, highest_index = new_lowest, new_highest
+    slabs.append((x_start, target_shape[0]))
+    return slabs
+
+
+def interpolate_slabs(source_file: H5File,
+                      destination_file: H5File,
+                      picard_grid: Dict[str, np.ndarray],
+                      max_memory: float,
+                      weights: Optional[List[AxisWeights]] = None,
+                      dtype=np.float64,
+                      memory_map: bool = False,
+                      metrics: Optional[Metrics] = None,
+                      resume: bool = False,
+                      checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+                      pipelined: bool = False) -> None:
+    """
+    Streaming version of interpolate: Walks through the Picard grid in
+    x-slabs, reads only the source hyperslab each slab needs, and writes
+    each finished slab into the destination file. The peak memory is
+    approximately bounded by `max_memory` bytes. `dtype` and `memory_map`
+    specify how the hyperslabs are read (see H5File.read_density). The time
+    spent reading, interpolating, and writing is recorded in `metrics`.
+
+    At most every `checkpoint_interval` seconds and after the last slab, the
+    number of finished x-planes is recorded in the destination file (see
+    H5File.write_progress). If `resume` is True, the density of the
+    destination file already exists, and the recorded x-planes are skipped.
+
+    If `pipelined` is True, a reader thread reads the source hyperslab of
+    the next slab and a writer thread writes the previous slab while the
+    current slab is interpolated. Since two slabs are in flight at a time,
+    the slabs are half as large.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    grid_volume_limits = source_file.read_grid_volume_limits()
+    source_shape = source_file.read_density_shape()
+    compute_dtype = get_compute_dtype(source_file.read_density_dtype()
+                                      if dtype is None else dtype)
+    target_shape = tuple(picard_grid['shape'])
+    if weights is None:
+        weights = get_source_weights(grid_volume_limits,
+                                     source_shape,
+                                     picard_grid)
+    x_weights, y_weights, z_weights = weights
+    slabs = get_x_slabs(x_weights, source_shape, target_shape,
+                        max_memory / 2 if pipelined else max_memory,
+                        compute_dtype.itemsize)
 
-    parser.add_argument(metavar='<source *.h5>',
-                        dest='source_file_path',
-                        help='H5 file file that contains the gas distribution '
-                             'that should be interpolated at the simulation '
-                             'grid points')
+    # a run may have been interrupted before the density was created
+    if resume and DENSITY_DATASET_NAME in destination_file.file:
+        destination_file.open_density()
+        completed_x_planes = destination_file.read_progress()
+    else:
+        destination_file.create_density(target_shape, compute_dtype)
+        completed_x_planes = 0
+    slabs = [(x_start, x_stop) for x_start, x_stop in slabs
+             if x_stop > completed_x_planes]
 
-    parser.add_argument(metavar='<destination *.h5>',
-                        dest='destination_file_path',
-                        help='H5 file into which the interpolated gas '
-                             'distribution should be saved')
+    def read_window(x_start: int, x_stop: int
+                    ) -> Tuple[int, Optional[np.ndarray]]:
+        window_start, window_stop = get_source_window(x_weights,
+                                                      x_start,
+                                                      x_stop)
+        if window_start == window_stop:
+            return window_start, None
+        with metrics.stage('read source'):
+            window = source_file.read_density(
+                np.s_[window_start:window_stop],
+                dtype=dtype,
+                memory_map=memory_map,
+            )
+        return window_start, window
 
-    parser.add_argument(metavar='<parameter *.nx>',
-                        dest='parameter_file_path',
-                        help='Picard parameter file')
+    def interpolate_slab(x_start: int,
+                         x_stop: int,
+                         window_start: int,
+                         window: Optional[np.ndarray]) -> np.ndarray:
+        if window is None:
+            return np.zeros((x_stop - x_start,) + target_shape[1:],
+                            dtype=compute_dtype)
+        with metrics.stage('interpolate'):
+            cell_index, weight, within_grid = (
+                array[x_start:x_stop] for array in x_weights
+            )
+            cell_index = np.where(within_grid,
+                                  cell_index - window_start,
+                                  0)
+            return resample_with_weights(
+                window,
+                [(cell_index, weight, within_grid), y_weights, z_weights],
+                fill_value=0.,
+            )
 
-    parsed_arguments = parser.parse_args()
+    last_checkpoint_time = time.perf_counter()
 
-    destination = parsed_arguments.destination_file_path
-    if os.path.exists(destination):
-        print(f"Error: The file '{destination}' already exists.",
+    def write_slab(x_start: int, x_stop: int, slab: np.ndarray) -> None:
+        nonlocal last_checkpoint_time
+        with metrics.stage('write destination'):
+            destination_file.write_density_slab(x_start, slab)
+            now = time.perf_counter()
+            if (now - last_checkpoint_time >= checkpoint_interval
+                    or x_stop == target_shape[0]):
+                destination_file.write_progress(x_stop)
+                last_checkpoint_time = now
+
+    progress = ProgressReporter(target_shape[0])
+    if not pipelined:
+        for x_start, x_stop in slabs:
+            window_start, window = read_window(x_start, x_stop)
+            slab = interpolate_slab(x_start, x_stop, window_start, window)
+            write_slab(x_start, x_stop, slab)
+            progress.update(x_stop)
+        progress.finish()
+        return
+
+    # Each executor has a single thread, so the slabs are read and written in
+    # order. At most one read and one write are pending at a time, which
+    # bounds the memory to two windows and two slabs.
+    with ThreadPoolExecutor(1) as reader, ThreadPoolExecutor(1) as writer:
+        next_read = (reader.submit(read_window, *slabs[0]) if slabs
+                     else None)
+        last_write = None
+        for slab_index, (x_start, x_stop) in enumerate(slabs):
+            with metrics.stage('wait for I/O'):
+                window_start, window = next_read.result()
+            if slab_index + 1 < len(slabs):
+                next_read = reader.submit(read_window, *slabs[slab_index + 1])
+            slab = interpolate_slab(x_start, x_stop, window_start, window)
+            del window
+            with metrics.stage('wait for I/O'):
+                if last_write is not None:
+                    last_write.result()
+            last_write = writer.submit(write_slab, x_start, x_stop, slab)
+            progress.update(x_stop)
+        if last_write is not None:
+            with metrics.stage('wait for I/O'):
+                last_write.result()
+    progress.finish()
+
+
+def get_region(picard_grid: Dict[str, np.ndarray],
+               limits: np.ndarray) -> Region:
+    """
+    Returns the index ranges of the Picard grid points whose centers are
+    within the x, y, and z limits `limits` (shape (3, 2), in kpc).
+    """
+    region = []
+    for axis, (lower, upper) in zip('xyz', limits):
+        centers = picard_grid[f'{axis} centers']
+        region.append((int(np.searchsorted(centers, lower, side='left')),
+                       int(np.searchsorted(centers, upper, side='right'))))
+    return tuple(region)
+
+
+def get_region_window(grid_volume_limits: np.ndarray,
+                      source_shape: Tuple[int, ...],
+                      picard_grid: Dict[str, np.ndarray],
+                      region: Region,
+                      weights: Optional[List[AxisWeights]] = None
+                      ) -> Optional[Tuple[tuple, List[AxisWeights], tuple]]:
+    """
+    Returns the part of the sub-block `region` of the Picard grid within the
+    source grid, which is determined axis by axis from the grid limits (see
+    get_within_range), the weights of this part relative to the source
+    window it needs, and the source window. Returns None if the sub-block is
+    entirely outside of the source grid. If the weights of the whole Picard
+    grid `weights` are given (see get_source_weights), the weights of the
+    part are taken from them instead of being computed.
+    """
+    cell_size = ((grid_volume_limits[:, 1] - grid_volume_limits[:, 0])
+                 / source_shape)
+    inner_selection = []
+    region_weights = []
+    window_selection = []
+    for axis, (start, stop) in enumerate(region):
+        centers = picard_grid['xyz'[axis] + ' centers'][start:stop]
+        inner_start, inner_stop = get_within_range(centers,
+                                                   grid_volume_limits[axis, 0],
+                                                   cell_size[axis],
+                                                   source_shape[axis])
+        if weights is None:
+            cell_index, weight, within_grid = get_axis_weights(
+                centers[inner_start:inner_stop],
+                grid_volume_limits[axis, 0],
+                cell_size[axis],
+                source_shape[axis],
+            )
+        else:
+            cell_index, weight, within_grid = (
+                array[start + inner_start:start + inner_stop]
+                for array in weights[axis]
+            )
+        if not np.any(within_grid):
+            return None
+        window_start = int(cell_index[within_grid].min())
+        window_stop = min(int(cell_index[within_grid].max()) + 2,
+                          source_shape[axis])
+        cell_index = np.where(within_grid, cell_index - window_start, 0)
+        inner_selection.append(slice(inner_start, inner_stop))
+        region_weights.append((cell_index, weight, within_grid))
+        window_selection.append(slice(window_start, window_stop))
+    return tuple(inner_selection), region_weights, tuple(window_selection)
+
+
+def interpolate_region(source_file: H5File,
+                       picard_grid: Dict[str, np.ndarray],
+                       region: Region,
+                       dtype=np.float64,
+                       memory_map: bool = False,
+                       metrics: Optional[Metrics] = None,
+                       weights: Optional[List[AxisWeights]] = None
+                       ) -> np.ndarray:
+    """
+    Interpolates only the sub-block `region` of the Picard grid. The part of
+    the sub-block that is outside of the source grid is filled with zeros as
+    a whole, so only the remaining part is interpolated, and only the source
+    hyperslab it needs is read (see get_region_window). `dtype` and
+    `memory_map` specify how the hyperslab is read (see
+    H5File.read_density). `weights` are the optional precomputed weights of
+    the whole Picard grid (see get_source_weights).
+    """
+    if metrics is None:
+        metrics = Metrics()
+    compute_dtype = get_compute_dtype(source_file.read_density_dtype()
+                                      if dtype is None else dtype)
+    block = np.zeros([stop - start for start, stop in region],
+                     dtype=compute_dtype)
+    region_window = get_region_window(source_file.read_grid_volume_limits(),
+                                      source_file.read_density_shape(),
+                                      picard_grid,
+                                      region,
+                                      weights=weights)
+    if region_window is None:
+        return block
+    inner_selection, region_weights, window_selection = region_window
+
+    with metrics.stage('read source'):
+        window = source_file.read_density(window_selection,
+                                          dtype=dtype,
+                                          memory_map=memory_map)
+    with metrics.stage('interpolate'):
+        block[inner_selection] = resample_with_weights(window,
+                                                       region_weights,
+                                                       fill_value=0.)
+    return block
+
+
+def get_shard_region(shape: Tuple[int, ...],
+                     index: int,
+                     count: int) -> Region:
+    """
+    Returns the sub-block of a Picard grid of the shape `shape` that the
+    shard `index` of `count` shards contains. The grid is split into `count`
+    x-slabs of similar thickness.
+    """
+    n_x, n_y, n_z = (int(n) for n in shape)
+    return ((index * n_x // count, (index + 1) * n_x // count),
+            (0, n_y),
+            (0, n_z))
+
+
+def get_blocks(shape: Tuple[int, ...],
+               block_shape: Tuple[int, ...]) -> List[Region]:
+    """
+    Splits a grid of the shape `shape` into blocks of the shape
+    `block_shape` (smaller at the upper ends of the axes).
+    """
+    ranges = [[(start, min(start + n_block, n))
+               for start in range(0, n, n_block)]
+              for n, n_block in zip(shape, block_shape)]
+    return list(itertools.product(*ranges))
+
+
+def interpolate_sparse(source_file: H5File,
+                       destination_file: H5File,
+                       picard_grid: Dict[str, np.ndarray],
+                       dtype=np.float64,
+                       memory_map: bool = False,
+                       metrics: Optional[Metrics] = None,
+                       weights: Optional[List[AxisWeights]] = None) -> None:
+    """
+    Interpolates a sparse source (see H5File) block by block into the
+    density dataset created beforehand via destination_file.create_density.
+    The blocks whose source window only covers empty blocks of the block
+    occupancy index of the source are neither read nor interpolated nor
+    written, i.e., they stay 0. The blocks are the chunks of the destination
+    (or SPARSE_BLOCK_SHAPE for contiguous destinations). The result is
+    identical to the one of interpolate. `weights` are the optional
+    precomputed weights of the whole Picard grid, e.g., from the operator
+    cache.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    occupancy, source_block_shape = source_file.read_block_occupancy()
+    grid_volume_limits = source_file.read_grid_volume_limits()
+    source_shape = source_file.read_density_shape()
+    block_shape = destination_file.density_dataset.chunks or SPARSE_BLOCK_SHAPE
+    blocks = get_blocks(tuple(picard_grid['shape']), block_shape)
+    n_skipped = 0
+    progress = ProgressReporter(len(blocks))
+    for block_index, region in enumerate(blocks):
+        region_window = get_region_window(grid_volume_limits,
+                                          source_shape,
+                                          picard_grid,
+                                          region,
+                                          weights=weights)
+        is_empty = region_window is None
+        if not is_empty:
+            occupancy_selection = tuple(
+                slice(window.start // n_block,
+                      (window.stop - 1) // n_block + 1)
+                for window, n_block in zip(region_window[2],
+                                           source_block_shape)
+            )
+            is_empty = not np.any(occupancy[occupancy_selection])
+        if is_empty:
+            n_skipped += 1
+        else:
+            block = interpolate_region(source_file, picard_grid, region,
+                                       dtype=dtype,
+                                       memory_map=memory_map,
+                                       metrics=metrics,
+                                       weights=weights)
+            with metrics.stage('write destination'):
+                destination_file.write_density_region(
+                    tuple(start for start, _ in region), block
+                )
+        progress.update(block_index + 1)
+    progress.finish()
+    metrics.count('empty blocks skipped', n_skipped)
+    metrics.count('blocks interpolated', len(blocks) - n_skipped)
+
+
+def open_destination_region(arguments: argparse.Namespace,
+                            picard_grid: Dict[str, np.ndarray],
+                            dtype) -> H5File:
+    """
+    Opens the existing destination file into which a region is written after
+    checking that it belongs to the Picard grid (ValueError otherwise). If the
+    file doesn't exist, it is created with an empty (zero) density of the data
+    type `dtype`.
+    """
+    path = arguments.destination_file_path
+    if not os.path.exists(path):
+        destination_file = H5File(path, 'w', **get_layout(arguments))
+        destination_file.create_density(tuple(picard_grid['shape']), dtype)
+        destination_file.write_grid_limits(picard_grid['volume limits'],
+                                           picard_grid['cell center limits'])
+        return destination_file
+
+    destination_file = H5File(path, 'r+')
+    shape = destination_file.read_density_shape()
+    limits = destination_file.read_grid_cell_center_limits()
+    if (tuple(shape) != tuple(picard_grid['shape'])
+            or not np.allclose(limits, picard_grid['cell center limits'],
+                               rtol=LIMITS_TOLERANCE, atol=0.)):
+        raise ValueError(f"The grid of '{path}' differs from the one of the "
+                         f"parameter file.")
+    if len(destination_file.read_levels()) > 1:
+        print(f"Warning: The downsampled levels of '{path}' aren't updated.",
               file=sys.stderr)
-        sys.exit(1)
+    return destination_file
 
-    return parsed_arguments
 
+def _initialize_worker(source_name: str,
+                       source_shape: Tuple[int, ...],
+                       source_dtype: np.dtype,
+                       target_name: str,
+                       target_shape: Tuple[int, ...],
+                       target_dtype: np.dtype,
+                       weights: List[AxisWeights]) -> None:
+    _worker_state['source'] = SharedArray(source_shape, source_dtype,
+                                          name=source_name)
+    _worker_state['target'] = SharedArray(target_shape, target_dtype,
+                                          name=target_name)
+    _worker_state['weights'] = weights
 
-def main():
-    arguments = parse_arguments()
 
+def _interpolate_block(x_range: Tuple[int, int]) -> None:
+    """
+    Interpolates the x-slab x_range = (x_start, x_stop) of the Picard grid and
+    writes it into the shared target array.
+    """
+    x_start, x_stop = x_range
+    source = _worker_state['source'].array
+    target = _worker_state['target'].array
+    x_weights, y_weights, z_weights = _worker_state['weights']
+    x_weights = tuple(array[x_start:x_stop] for array in x_weights)
+    target[x_start:x_stop] = resample_with_weights(
+        source, [x_weights, y_weights, z_weights], fill_value=0.
+    )
+
+
+def get_x_blocks(n_x: int, n_blocks: int) -> List[Tuple[int, int]]:
+    """
+    Splits the x indices [0, n_x) into at most n_blocks x-slabs
+    [x_start, x_stop) of similar size.
+    """
+    n_blocks = max(min(n_blocks, n_x), 1)
+    block_limits = np.linspace(0, n_x, n_blocks + 1).astype(int)
+    return [(int(x_start), int(x_stop))
+            for x_start, x_stop in zip(block_limits[:-1], block_limits[1:])]
+
+
+def interpolate_shared(source: SharedArray,
+                       grid_volume_limits: np.ndarray,
+                       picard_grid: Dict[str, np.ndarray],
+                       jobs: int,
+                       weights: Optional[List[AxisWeights]] = None
+                       ) -> SharedArray:
+    """
+    Splits the Picard grid into x-slabs that are interpolated by a pool of
+    `jobs` processes. The workers read the distribution from the shared
+    array `source` and write their slabs directly into the returned shared
+    array, which the caller has to close. The result is identical to the
+    one of interpolate.
+    """
+    target_shape = tuple(int(n) for n in picard_grid['shape'])
+    if weights is None:
+        weights = get_source_weights(grid_volume_limits, source.shape,
+                                     picard_grid)
+    blocks = get_x_blocks(target_shape[0], jobs * BLOCKS_PER_JOB)
+
+    target = SharedArray(target_shape, get_compute_dtype(source.dtype))
+    try:
+        initial_arguments = (source.name, source.shape, source.dtype,
+                             target.name, target_shape, target.dtype,
+                             weights)
+        progress = ProgressReporter(len(blocks))
+        with Pool(jobs, _initialize_worker, initial_arguments) as pool:
+            for block_index, _ in enumerate(
+                    pool.imap_unordered(_interpolate_block, blocks)):
+                progress.update(block_index + 1)
+        progress.finish()
+    except BaseException:
+        target.close()
+        raise
+    return target
+
+
+def interpolate_parallel(distribution: np.ndarray,
+                         grid_volume_limits: np.ndarray,
+                         picard_grid: Dict[str, np.ndarray],
+                         jobs: int,
+                         weights: Optional[List[AxisWeights]] = None
+                         ) -> np.ndarray:
+    """
+    Parallel version of interpolate for a distribution in the memory (see
+    interpolate_shared). The distribution and the result are copied into
+    and out of the shared memory; interpolate_files_parallel avoids these
+    copies for files.
+    """
+    source = SharedArray(distribution.shape, distribution.dtype)
+    try:
+        source.array[...] = distribution
+        target = interpolate_shared(source, grid_volume_limits, picard_grid,
+                                    jobs, weights)
+        try:
+            interpolated_density = target.array.copy()
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return interpolated_density
+
+
+def interpolate_files_parallel(source_file: H5File,
+                               destination_file: H5File,
+                               picard_grid: Dict[str, np.ndarray],
+                               jobs: int,
+                               dtype=np.float64,
+                               weights: Optional[List[AxisWeights]] = None,
+                               metrics: Optional[Metrics] = None) -> None:
+    """
+    Interpolates the source file with `jobs` processes (see
+    interpolate_shared) and writes the result into the destination file.
+    The distribution is read directly into the shared memory in the data
+    type `dtype` (None: data type of the source), and the shared result is
+    written before it is freed, so neither is held twice.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    source = SharedArray(
+        source_file.read_density_shape(),
+        source_file.read_density_dtype() if dtype is None else dtype,
+    )
+    try:
+        with metrics.stage('read source'):
+            source_file.read_density_into(source.array)
+        with metrics.stage('interpolate'):
+            target = interpolate_shared(source,
+                                        source_file.read_grid_volume_limits(),
+                                        picard_grid,
+                                        jobs,
+                                        weights)
+    finally:
+        source.close()
+    try:
+        with metrics.stage('write destination'):
+            destination_file.write_density(target.array)
+    finally:
+        target.close()
+
+
+def interpolate_components(source_file: H5File,
+                           destination_file: H5File,
+                           names: List[str],
+                           grid_volume_limits: np.ndarray,
+                           picard_grid: Dict[str, np.ndarray],
+                           weights: Optional[List[AxisWeights]] = None,
+                           dtype=np.float64,
+                           metrics: Optional[Metrics] = None) -> None:
+    """
+    Projects the density datasets `names` of the source file (see
+    H5File.read_density_names) onto the Picard grid and writes each one with
+    the attributes of its source dataset into the destination file. The
+    components are stacked, so a single set of weights is computed and all
+    components are interpolated in a single pass.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    if dtype is None:
+        dtype = source_file.read_density_dtype()
+    with metrics.stage('read source'):
+        densities = source_file.read_densities(names, dtype)
+    with metrics.stage('interpolate'):
+        if weights is None:
+            weights = get_source_weights(grid_volume_limits,
+                                         densities.shape[1:],
+                                         picard_grid)
+        interpolated_densities = resample_with_weights(densities, weights,
+                                                       fill_value=0.)
+    with metrics.stage('write destination'):
+        for name, density in zip(names, interpolated_densities):
+            destination_file.write_density(
+                density, name,
+                attributes=source_file.read_density_attributes(name),
+            )
+        destination_file.write_grid_limits(
+            picard_grid['volume limits'],
+            picard_grid['cell center limits'],
+        )
+
+
+def load_spline_coefficients(arguments: argparse.Namespace,
+                             source_file: H5File,
+                             density: np.ndarray,
+                             metrics: Metrics) -> np.ndarray:
+    """
+    Returns the cubic B-spline coefficients of the density. They are read
+    from the source file or from the cache file given by --spline-cache if
+    it contains them (in at least the precision of the density). Otherwise,
+    they are computed and, with --spline-cache, saved in the cache file for
+    later runs. The source file is never modified.
+    """
+    compute_dtype = get_compute_dtype(density.dtype)
+
+    def is_usable(coefficients: Optional[np.ndarray]) -> bool:
+        return (coefficients is not None
+                and coefficients.shape == density.shape
+                and coefficients.dtype.itemsize >= compute_dtype.itemsize)
+
+    cache_path = arguments.spline_cache
+    source_record = get_source_record(arguments, source_file)
+    with metrics.stage('load operator'):
+        coefficients = source_file.read_spline_coefficients()
+        if (not is_usable(coefficients) and cache_path is not None
+                and os.path.exists(cache_path)):
+            cache_file = H5File(cache_path, 'r')
+            if cache_file.read_run_record() == {'source': source_record}:
+                coefficients = cache_file.read_spline_coefficients()
+            cache_file.file.close()
+    if is_usable(coefficients):
+        return coefficients.astype(compute_dtype, copy=False)
+
+    with metrics.stage('prefilter'):
+        coefficients = get_spline_coefficients(density)
+    if cache_path is not None:
+        with metrics.stage('write operator'):
+            try:
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+                cache_file = H5File(cache_path, 'w')
+                cache_file.write_spline_coefficients(coefficients)
+                cache_file.write_run_record({'source': source_record})
+                cache_file.file.close()
+            except OSError as error:
+                print(f"Warning: The spline coefficients couldn't be saved "
+                      f"in '{cache_path}': {error}", file=sys.stderr)
+    return coefficients
+
+
+def get_source_record(arguments: argparse.Namespace,
+                      source_file: H5File) -> dict:
+    """
+    Returns the description of the read distribution: the size and the
+    modification time of the source file and the level and the grid of the
+    distribution.
+    """
+    status = os.stat(arguments.source_file_path)
+    return {
+        'size': status.st_size,
+        'modification time': status.st_mtime_ns,
+        'level': source_file.group.name,
+        'shape': list(source_file.read_density_shape()),
+        'grid volume limits': source_file.read_grid_volume_limits().tolist(),
+    }
+
+
+def get_run_record(arguments: argparse.Namespace,
+                   source_file: H5File,
+                   parameters: dict) -> dict:
+    """
+    Returns the description of the inputs of a run that has to be unchanged
+    when the run is resumed: the size and the modification time of the
+    source file, the level and the grid of the read distribution, the grid
+    parameters, and the precision.
+    """
+    return {
+        'source': get_source_record(arguments, source_file),
+        'parameters': parameters,
+        'precision': arguments.precision,
+    }
+
+
+def interpolate_files(arguments: argparse.Namespace,
+                      metrics: Metrics) -> None:
+    """
+    Projects the source file onto the Picard grid and saves the result in the
+    destination file, recording each stage in `metrics`.
+    """
     source_file = H5File(arguments.source_file_path, 'r')
-    destination_file = H5File(arguments.destination_file_path, 'w')
+    density_names = source_file.read_density_names()
+    if not density_names:
+        raise ValueError(f"'{arguments.source_file_path}' doesn't contain "
+                         f"a density.")
+    has_components = density_names != [DENSITY_DATASET_NAME]
+    if has_components:
+        check_component_arguments(arguments)
+        source_file.use_density(density_names[0])
 
-    parameters = parse_parameter_file(arguments.parameter_file_path)
-    picard_grid = get_picard_grid(parameters)
-    density = source_file.read_density()
-    grid_volume_limits = source_file.read_grid_volume_limits()
-    interpolated_density = interpolate(density,
-                                       grid_volume_limits,
-                                       picard_grid)
+    with metrics.stage('parse parameters'):
+        parameters = parse_parameter_file(arguments.parameter_file_path)
+        picard_grid = get_picard_grid(parameters)
+        if arguments.use_pyramid:
+            factor = source_file.select_level(picard_grid['cell size'])
+            print(f'Reading the {factor}x level of the distribution.')
+        grid_volume_limits = source_file.read_grid_volume_limits()
+
+    if arguments.region is not None or arguments.region_kpc is not None:
+        interpolate_files_region(arguments, source_file, picard_grid, metrics)
+        return
+    if arguments.shard is not None:
+        interpolate_files_shard(arguments, source_file, picard_grid,
+                                get_run_record(arguments, source_file,
+                                               parameters),
+                                metrics)
+        return
+
+    destination_path = arguments.destination_file_path
+    resume = arguments.resume and os.path.exists(destination_path)
+    run_record = get_run_record(arguments, source_file, parameters)
+    if resume:
+        destination_file = H5File(destination_path, 'r+')
+        if destination_file.read_run_record() != run_record:
+            raise ValueError(f"'{destination_path}' can't be resumed "
+                             f"because the source, the parameter file, or "
+                             f"the precision have changed.")
+    else:
+        destination_file = H5File(destination_path, 'w',
+                                  **get_layout(arguments))
+        destination_file.write_run_record(run_record)
+    metrics.count('points interpolated', int(np.prod(picard_grid['shape'])))
+
+    weights = None
+    if arguments.operator_cache is not None:
+        with metrics.stage('load operator'):
+            cache = OperatorCache(arguments.operator_cache,
+                                  int(arguments.operator_cache_size * 2**20))
+            weights = cache.get_weights(grid_volume_limits,
+                                        source_file.read_density_shape(),
+                                        parameters)
+
+    if has_components:
+        interpolate_components(source_file,
+                               destination_file,
+                               density_names,
+                               grid_volume_limits,
+                               picard_grid,
+                               weights=weights,
+                               dtype=PRECISIONS[arguments.precision],
+                               metrics=metrics)
+        metrics.count('components interpolated', len(density_names))
+    elif arguments.max_memory is not None:
+        if 'grid volume limits' not in destination_file.file:
+            with metrics.stage('write destination'):
+                destination_file.write_grid_limits(
+                    picard_grid['volume limits'],
+                    picard_grid['cell center limits'],
+                )
+        interpolate_slabs(source_file,
+                          destination_file,
+                          picard_grid,
+                          max_memory=arguments.max_memory * 2**20,
+                          weights=weights,
+                          dtype=PRECISIONS[arguments.precision],
+                          memory_map=arguments.memory_map,
+                          metrics=metrics,
+                          resume=resume,
+                          checkpoint_interval=arguments.checkpoint_interval,
+                          pipelined=arguments.pipeline)
+    elif (arguments.method == 'trilinear' and arguments.jobs == 1
+            and not arguments.pointwise
+            and source_file.read_block_occupancy() is not None):
+        dtype = PRECISIONS[arguments.precision]
+        compute_dtype = get_compute_dtype(source_file.read_density_dtype()
+                                          if dtype is None else dtype)
+        with metrics.stage('write destination'):
+            destination_file.create_density(tuple(picard_grid['shape']),
+                                            compute_dtype)
+            destination_file.write_grid_limits(
+                picard_grid['volume limits'],
+                picard_grid['cell center limits'],
+            )
+        interpolate_sparse(source_file,
+                           destination_file,
+                           picard_grid,
+                           dtype=dtype,
+                           memory_map=arguments.memory_map,
+                           metrics=metrics,
+                           weights=weights)
+    elif arguments.jobs > 1:
+        interpolate_files_parallel(source_file,
+                                   destination_file,
+                                   picard_grid,
+                                   arguments.jobs,
+                                   dtype=PRECISIONS[arguments.precision],
+                                   weights=weights,
+                                   metrics=metrics)
+        with metrics.stage('write destination'):
+            destination_file.write_grid_limits(
+                picard_grid['volume limits'],
+                picard_grid['cell center limits'],
+            )
+    else:
+        with metrics.stage('read source'):
+            density = source_file.read_density(
+                dtype=PRECISIONS[arguments.precision],
+                memory_map=arguments.memory_map,
+            )
+        if arguments.method == 'tricubic':
+            coefficients = load_spline_coefficients(arguments, source_file,
+                                                    density, metrics)
+        with metrics.stage('interpolate'):
+            if arguments.method == 'tricubic':
+                interpolation = TricubicInterpolation(density,
+                                                      grid_volume_limits,
+                                                      coefficients)
+                interpolated_density = interpolation.resample(
+                    picard_grid['x centers'],
+                    picard_grid['y centers'],
+                    picard_grid['z centers'],
+                    fill_value=0.,
+                )
+            else:
+                interpolated_density = interpolate(
+                    density,
+                    grid_volume_limits,
+                    picard_grid,
+                    separable=not arguments.pointwise,
+                    weights=weights,
+                )
+        with metrics.stage('write destination'):
+            destination_file.write_density(interpolated_density)
+            destination_file.write_grid_limits(
+                picard_grid['volume limits'],
+                picard_grid['cell center limits'],
+            )
+
+    with metrics.stage('write statistics'):
+        destination_file.write_statistics(density_names)
+    if arguments.pyramid:
+        with metrics.stage('write pyramid'):
+            destination_file.write_pyramid()
+    with metrics.stage('write destination'):
+        destination_file.file.close()
+    metrics.count('bytes read', source_file.bytes_read)
+    metrics.count('bytes written', destination_file.bytes_written)
 
-    destination_file.write_density(interpolated_density)
-    destination_file.write_grid_limits(picard_grid['volume limits'],
-                                       picard_grid['cell center limits'])
+
+def interpolate_files_region(arguments: argparse.Namespace,
+                             source_file: H5File,
+                             picard_grid: Dict[str, np.ndarray],
+                             metrics: Metrics) -> None:
+    """
+    Interpolates the region given by --region or --region-kpc and writes it
+    into the matching region of the destination file.
+    """
+    if arguments.region is not None:
+        region = tuple(
+            (max(start, 0), min(stop, int(n)))
+            for start, stop, n in zip(arguments.region[::2],
+                                      arguments.region[1::2],
+                                      picard_grid['shape'])
+        )
+    else:
+        region = get_region(picard_grid,
+                            np.reshape(arguments.region_kpc, (3, 2)))
+    if any(start >= stop for start, stop in region):
+        raise ValueError('The region does not contain any grid point.')
+    dtype = PRECISIONS[arguments.precision]
+    compute_dtype = get_compute_dtype(source_file.read_density_dtype()
+                                      if dtype is None else dtype)
+    destination_file = open_destination_region(arguments, picard_grid,
+                                               compute_dtype)
+    metrics.count('points interpolated',
+                  int(np.prod([stop - start for start, stop in region])))
+
+    block = interpolate_region(source_file,
+                               picard_grid,
+                               region,
+                               dtype=dtype,
+                               memory_map=arguments.memory_map,
+                               metrics=metrics)
+    with metrics.stage('write destination'):
+        destination_file.write_density_region(
+            tuple(start for start, _ in region), block
+        )
+        # only if the destination has been created by this run; the
+        # statistics of an existing destination are removed since they are
+        # outdated
+        destination_file.write_statistics()
+        destination_file.file.close()
+    metrics.count('bytes read', source_file.bytes_read)
+    metrics.count('bytes written', destination_file.bytes_written)
+
+
+def interpolate_files_shard(arguments: argparse.Namespace,
+                            source_file: H5File,
+                            picard_grid: Dict[str, np.ndarray],
+                            run_record: dict,
+                            metrics: Metrics) -> None:
+    """
+    Interpolates the shard given by --shard and saves it together with the
+    grid limits of the whole Picard grid, the run record, and the shard
+    record in its own partial destination file, which is merged with the
+    other shards by merge_h5.
+    """
+    index, count = arguments.shard
+    region = get_shard_region(picard_grid['shape'], index, count)
+    (x_start, x_stop), _, _ = region
+    if x_start == x_stop:
+        raise ValueError(f'The Picard grid has fewer x planes than shards '
+                         f'({count}).')
+    metrics.count('points interpolated',
+                  int(np.prod([stop - start for start, stop in region])))
+
+    block = interpolate_region(source_file,
+                               picard_grid,
+                               region,
+                               dtype=PRECISIONS[arguments.precision],
+                               memory_map=arguments.memory_map,
+                               metrics=metrics)
+    with metrics.stage('write destination'):
+        destination_file = H5File(arguments.destination_file_path, 'w',
+                                  **get_layout(arguments))
+        destination_file.write_density(block)
+        destination_file.write_grid_limits(picard_grid['volume limits'],
+                                           picard_grid['cell center limits'])
+        # The shard record, which contains the shape of the whole grid, is
+        # written last.
+        destination_file.write_statistics(grid_shape=picard_grid['shape'])
+        destination_file.write_run_record(run_record)
+        destination_file.write_shard_record(
+            index, count, tuple(start for start, _ in region),
+            picard_grid['shape']
+        )
+        destination_file.file.close()
+    metrics.count('bytes read', source_file.bytes_read)
+    metrics.count('bytes written', destination_file.bytes_written)
+
+
+def run(arguments: argparse.Namespace) -> None:
+    metrics = Metrics()
+    interpolate_files(arguments, metrics)
+    report_metrics(metrics, arguments)
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('interpolate'))
 
 
 if __name__ == '__main__':
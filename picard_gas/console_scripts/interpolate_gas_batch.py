@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Projects several numerical distributions onto several grids specified by Picard
+parameter files in a single process. Each distribution is read only once, each
+Picard grid is built only once, and the projections are distributed over a pool
+of processes. The projection of <source>.h5 onto the grid of <parameter>.nx is
+saved as <output directory>/<source>_<parameter>.h5.
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import get_layout
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.operator_cache import OperatorCache
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.picard_grid import parse_parameter_file
+from picard_gas.shared_array import SharedArray
+from picard_gas.trilinear_interpolation import AxisWeights
+from picard_gas.trilinear_interpolation import resample_with_weights
+from picard_gas.console_scripts.interpolate_gas import PRECISIONS
+from picard_gas.console_scripts.interpolate_gas import get_source_weights
+from multiprocessing import Pool
+from multiprocessing import resource_tracker
+import argparse
+import glob
+import math
+import numpy as np
+import os
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# Task of a worker process:
+# (name, shape, and data type of the shared distribution, interpolation
+#  weights, Picard grid, destination path, layout of the destination density,
+#  whether the pyramid is written)
+Task = Tuple[str, Tuple[int, ...], np.dtype, List[AxisWeights],
+             Dict[str, np.ndarray], str, dict, bool]
+
+
+def expand_paths(patterns: List[str]) -> List[str]:
+    """
+    Expands the glob patterns. Duplicates are removed. Raises
+    FileNotFoundError if a pattern doesn't match any file.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if len(matches) == 0:
+            raise FileNotFoundError(f"'{pattern}' does not match any file.")
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def get_destination_path(output_directory: str,
+                         source_path: str,
+                         parameter_file_path: str) -> str:
+    def stem(path):
+        return os.path.splitext(os.path.basename(path))[0]
+    file_name = f'{stem(source_path)}_{stem(parameter_file_path)}.h5'
+    return os.path.join(output_directory, file_name)
+
+
+def _project(task: Task) -> str:
+    """
+    Projects the shared distribution onto the Picard grid and saves the
+    result.
+    """
+    (source_name, source_shape, source_dtype, weights, picard_grid,
+     destination_path, layout, pyramid) = task
+    source = SharedArray(source_shape, source_dtype, name=source_name)
+    try:
+        interpolated_density = resample_with_weights(source.array,
+                                                     weights,
+                                                     fill_value=0.)
+    finally:
+        source.close()
+    destination_file = H5File(destination_path, 'w', **layout)
+    destination_file.write_density(interpolated_density)
+    destination_file.write_grid_limits(picard_grid['volume limits'],
+                                       picard_grid['cell center limits'])
+    destination_file.write_statistics()
+    if pyramid:
+        destination_file.write_pyramid()
+    destination_file.file.close()
+    return destination_path
+
+
+def project_batch(source_paths: List[str],
+                  parameter_file_paths: List[str],
+                  output_directory: str,
+                  jobs: int,
+                  operator_cache: Optional[OperatorCache] = None,
+                  layout: Optional[dict] = None,
+                  dtype=np.float64,
+                  pyramid: bool = False) -> None:
+    """
+    Projects each distribution onto each Picard grid. `layout` specifies the
+    layout of the written densities (see H5File), and `dtype` is the data type
+    in which the distributions are read and interpolated (None: data type of
+    the source). If `pyramid` is True, the downsampled levels of the
+    projections are written as well (see H5File.write_pyramid).
+
+    The distributions are processed in groups that are just large enough to
+    keep all `jobs` processes busy, which bounds the memory to a few
+    distributions at a time.
+    """
+    parameters = [parse_parameter_file(path) for path in parameter_file_paths]
+    picard_grids = [get_picard_grid(grid_parameters)
+                    for grid_parameters in parameters]
+    # weights of each pair of a source grid and a Picard grid
+    weights: Dict[tuple, List[AxisWeights]] = dict()
+
+    def get_weights(grid_volume_limits, source_shape, grid_index):
+        key = grid_volume_limits.tobytes(), source_shape, grid_index
+        if key not in weights:
+            if operator_cache is None:
+                weights[key] = get_source_weights(grid_volume_limits,
+                                                  source_shape,
+                                                  picard_grids[grid_index])
+            else:
+                weights[key] = operator_cache.get_weights(
+                    grid_volume_limits, source_shape, parameters[grid_index]
+                )
+        return weights[key]
+
+    sources_per_group = max(1, math.ceil(jobs / len(picard_grids)))
+    n_projections = len(source_paths) * len(picard_grids)
+    n_finished = 0
+    # Every process that attaches a shared array registers it with a
+    # resource tracker process, which unlinks the registered shared memory
+    # and warns about a leak when its processes exit. If the tracker isn't
+    # running yet when the pool forks, each worker starts its own tracker,
+    # which would unlink the distributions that the parent still uses when
+    # the worker exits. Started before the fork, the single tracker of this
+    # process is inherited by the workers.
+    resource_tracker.ensure_running()
+    with Pool(jobs) as pool:
+        for group_start in range(0, len(source_paths), sources_per_group):
+            group = source_paths[group_start:group_start + sources_per_group]
+            shared_sources = []
+            tasks = []
+            try:
+                for source_path in group:
+                    source_file = H5File(source_path, 'r')
+                    shared_source = SharedArray(
+                        source_file.read_density_shape(),
+                        source_file.read_density_dtype() if dtype is None
+                        else dtype,
+                    )
+                    shared_sources.append(shared_source)
+                    source_file.read_density_into(shared_source.array)
+                    grid_volume_limits = source_file.read_grid_volume_limits()
+                    source_file.file.close()
+                    for grid_index, picard_grid in enumerate(picard_grids):
+                        tasks.append((
+                            shared_source.name,
+                            shared_source.shape,
+                            shared_source.dtype,
+                            get_weights(grid_volume_limits,
+                                        shared_source.shape,
+                                        grid_index),
+                            picard_grid,
+                            get_destination_path(
+                                output_directory,
+                                source_path,
+                                parameter_file_paths[grid_index],
+                            ),
+                            dict() if layout is None else layout,
+                            pyramid,
+                        ))
+                for destination_path in pool.imap_unordered(_project, tasks):
+                    n_finished += 1
+                    print(f'{n_finished} / {n_projections}: '
+                          f'{destination_path}', flush=True)
+            finally:
+                for shared_source in shared_sources:
+                    shared_source.close()
+
+
+def run(arguments: argparse.Namespace) -> None:
+    source_paths = expand_paths(arguments.sources)
+    parameter_file_paths = expand_paths(arguments.parameter_files)
+
+    os.makedirs(arguments.output_directory, exist_ok=True)
+    destination_paths = [
+        get_destination_path(arguments.output_directory,
+                             source_path,
+                             parameter_file_path)
+        for source_path in source_paths
+        for parameter_file_path in parameter_file_paths
+    ]
+    if len(set(destination_paths)) < len(destination_paths):
+        raise ValueError('The file names of the sources or of the parameter '
+                         'files are ambiguous.')
+    for destination_path in destination_paths:
+        if os.path.exists(destination_path):
+            raise FileExistsError(f"The file '{destination_path}' already "
+                                  f"exists.")
+
+    operator_cache = (None if arguments.operator_cache is None
+                      else OperatorCache(arguments.operator_cache))
+    project_batch(source_paths,
+                  parameter_file_paths,
+                  arguments.output_directory,
+                  arguments.jobs,
+                  operator_cache,
+                  get_layout(arguments),
+                  PRECISIONS[arguments.precision],
+                  arguments.pyramid)
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('batch'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Assembles the partial files of a sharded interpolate_gas run (see --shard of
+interpolate_gas) into a single H5 file.
+
+The shards are checked before anything is written: All shards of the run
+have to be given exactly once, they have to be complete (the shard record
+is written last), and their grid limits and run records have to be equal.
+The densities are copied block by block, so the merge doesn't need memory
+for the whole density.
+
+Usage on a cluster (e.g., as a job array with the task index i):
+    interpolate_gas source.h5 shard_<i>.h5 galaxy.nx --shard <i>/<N>
+    merge_h5 shard_*.h5 galaxy.h5
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import get_layout
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.interpolate_gas import get_shard_region
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.metrics import Metrics
+from picard_gas.metrics import ProgressReporter
+import argparse
+import numpy as np
+import sys
+from typing import List
+
+
+def exit_with_error(message: str) -> None:
+    print(f'Error: {message}', file=sys.stderr)
+    sys.exit(1)
+
+
+def open_shards(shard_file_paths: List[str]) -> List[H5File]:
+    """
+    Opens the shards and checks that they form a complete run, i.e., that
+    each shard index of the run occurs exactly once, that the grid limits
+    and the run records of the shards are equal, and that the density of each
+    shard has the shape and the position given by its shard index. Exits if
+    they don't. Returns the shards ordered by their index.
+    """
+    shards = dict()
+    for path in shard_file_paths:
+        shard_file = H5File(path, 'r')
+        record = shard_file.read_shard_record()
+        if record is None:
+            exit_with_error(f"'{path}' isn't a complete shard (see --shard "
+                            f"of interpolate_gas).")
+        if record['index'] in shards:
+            exit_with_error(f"The shard {record['index']} is given more "
+                            f"than once.")
+        shards[record['index']] = path, shard_file, record
+
+    _, first_file, first_record = shards[min(shards)]
+    count = first_record['count']
+    grid_shape = first_record['grid shape']
+    missing = [str(index) for index in range(count) if index not in shards]
+    if missing:
+        exit_with_error(f"The shards {', '.join(missing)} of {count} are "
+                        f"missing.")
+
+    volume_limits = first_file.read_grid_volume_limits()
+    cell_center_limits = first_file.read_grid_cell_center_limits()
+    run_record = first_file.read_run_record()
+    dtype = first_file.read_density_dtype()
+    for index in range(count):
+        path, shard_file, record = shards[index]
+        if record['count'] != count or record['grid shape'] != grid_shape:
+            exit_with_error(f"'{path}' belongs to a different run.")
+        if (not np.array_equal(shard_file.read_grid_volume_limits(),
+                               volume_limits)
+                or not np.array_equal(
+                    shard_file.read_grid_cell_center_limits(),
+                    cell_center_limits
+                )):
+            exit_with_error(f"The grid limits of '{path}' differ from the "
+                            f"ones of the other shards.")
+        if shard_file.read_run_record() != run_record:
+            exit_with_error(f"The source, the parameter file, or the "
+                            f"precision of '{path}' differ from the ones of "
+                            f"the other shards.")
+        if shard_file.read_density_dtype() != dtype:
+            exit_with_error(f"The data type of '{path}' differs from the one "
+                            f"of the other shards.")
+        region = get_shard_region(grid_shape, index, count)
+        if (record['start'] != [start for start, _ in region]
+                or list(shard_file.read_density_shape())
+                != [stop - start for start, stop in region]):
+            exit_with_error(f"The density of '{path}' doesn't match its "
+                            f"shard index.")
+    return [shards[index][1] for index in range(count)]
+
+
+def merge_shards(shard_files: List[H5File],
+                 destination_file: H5File,
+                 block_size: int,
+                 metrics: Metrics) -> None:
+    """
+    Copies the densities of the checked shards (see open_shards) in blocks of
+    approximately `block_size` bytes into the density of the destination
+    file and writes the grid limits and the run record of the shards.
+    """
+    first_file = shard_files[0]
+    record = first_file.read_shard_record()
+    with metrics.stage('write destination'):
+        destination_file.create_density(record['grid shape'],
+                                        first_file.read_density_dtype())
+        destination_file.write_grid_limits(
+            first_file.read_grid_volume_limits(),
+            first_file.read_grid_cell_center_limits(),
+        )
+        run_record = first_file.read_run_record()
+        if run_record is not None:
+            destination_file.write_run_record(run_record)
+    # The blocks are x-slabs whose thickness is a multiple of the chunks of
+    # the destination, so that each chunk is written as a whole.
+    _, n_y, n_z = record['grid shape']
+    plane_bytes = n_y * n_z * first_file.read_density_dtype().itemsize
+    chunk_x_size = (destination_file.density_dataset.chunks or (1,))[0]
+    planes_per_block = max(block_size // plane_bytes // chunk_x_size, 1)
+    planes_per_block *= chunk_x_size
+
+    n_x = record['grid shape'][0]
+    progress = ProgressReporter(n_x)
+    x_start = 0
+    for shard_file in shard_files:
+        shard_start = shard_file.read_shard_record()['start'][0]
+        shard_stop = shard_start + shard_file.read_density_shape()[0]
+        while x_start < shard_stop:
+            x_stop = min(x_start + planes_per_block, shard_stop)
+            with metrics.stage('read shards'):
+                slab = shard_file.read_density(
+                    np.s_[x_start - shard_start:x_stop - shard_start],
+                    dtype=None,
+                )
+            with metrics.stage('write destination'):
+                destination_file.write_density_slab(x_start, slab)
+            x_start = x_stop
+            progress.update(x_start)
+    progress.finish()
+    for shard_file in shard_files:
+        metrics.count('bytes read', shard_file.bytes_read)
+
+
+def run(arguments: argparse.Namespace) -> None:
+    metrics = Metrics()
+    shard_files = open_shards(arguments.shard_file_paths)
+    destination_file = H5File(arguments.destination_file_path, 'w',
+                              **get_layout(arguments))
+    merge_shards(shard_files,
+                 destination_file,
+                 int(arguments.block_size * 2**20),
+                 metrics)
+    with metrics.stage('write statistics'):
+        destination_file.write_statistics()
+    if arguments.pyramid:
+        with metrics.stage('write pyramid'):
+            destination_file.write_pyramid()
+    with metrics.stage('write destination'):
+        destination_file.file.close()
+    metrics.count('shards merged', len(shard_files))
+    metrics.count('bytes written', destination_file.bytes_written)
+    report_metrics(metrics, arguments)
+
+
+@exit_on_user_error
+def main():
+    run(parse_arguments('merge'))
+
+
+if __name__ == '__main__':
+    main()
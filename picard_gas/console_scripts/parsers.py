@@ -0,0 +1,864 @@
+"""
+Command-line parsers of the console scripts and of the subcommands of
+picard-gas (see cli).
+
+The arguments are parsed and checked before the module that runs the
+subcommand is imported, so this module must only import modules that don't
+load NumPy, h5py, astropy, or matplotlib. Therefore, `--help` and invalid
+arguments are reported immediately.
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.console_scripts.arguments import add_layout_arguments
+from picard_gas.console_scripts.arguments import add_metrics_arguments
+from picard_gas.settings import AXES
+from picard_gas.settings import DEFAULT_MAX_CACHE_SIZE
+from picard_gas.settings import PROJECTIONS
+from picard_gas.settings import get_component_name
+import argparse
+import json
+import os
+import sys
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# fits_to_h5
+DEFAULT_BLOCK_SIZE = 64  # MiB
+
+# interpolate_gas
+INTERPOLATION_METHODS = 'trilinear', 'tricubic'
+# data types in which the distribution can be read (native: data type of the
+# dataset, see interpolate_gas.PRECISIONS)
+PRECISION_NAMES = 'float64', 'float32', 'native'
+# minimum time between two checkpoints of a slab-by-slab run / s (each
+# checkpoint flushes the partially written chunks of the destination)
+DEFAULT_CHECKPOINT_INTERVAL = 30.
+
+# compare_h5
+# default tolerance of the differences, see density_comparison
+DEFAULT_RTOL = 1e-6
+DEFAULT_ATOL = 0.  # cm^-3
+
+# integrate_columns
+DEFAULT_N_LONGITUDES = 720
+DEFAULT_N_LATITUDES = 360
+# default distance between two samples along a ray in units of the smallest
+# cell size of the density
+DEFAULT_STEP = 0.5
+
+
+def check_new_file(file_path: str) -> None:
+    """
+    Exits if the file that should be created already exists.
+    """
+    if os.path.exists(file_path):
+        print(f"Error: The file '{file_path}' already exists.",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """
+    Parses the value <index>/<count> of --shard.
+    """
+    try:
+        index, count = (int(number) for number in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard '{text}' (expected <index>/<count>, e.g., 0/8)"
+        )
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard '{text}' (the index has to be at least 0 and "
+            f"smaller than the number of shards)"
+        )
+    return index, count
+
+
+def add_convert_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<source *.fits>',
+                        dest='source_path',
+                        help='path of the fits file or of a directory of fits '
+                             'files')
+
+    parser.add_argument(metavar='<destination *.h5>',
+                        dest='destination_path',
+                        help='path of the H5 file or, if the source is a '
+                             'directory, of the destination directory')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        dest='jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='number of files that are converted in parallel '
+                             'if the source is a directory (default = number '
+                             'of CPUs)')
+
+    parser.add_argument('--block-size',
+                        metavar='<MiB>',
+                        dest='block_size',
+                        type=float,
+                        default=DEFAULT_BLOCK_SIZE,
+                        help='size of the blocks in which the data are copied '
+                             f'(default = {DEFAULT_BLOCK_SIZE})')
+
+    parser.add_argument('--component',
+                        metavar='<name>',
+                        dest='component',
+                        help='add the density as the component <name>, '
+                             'e.g., HI_model_1, to the H5 file, which is '
+                             'created if it does not exist yet; the '
+                             'components of a file are projected together by '
+                             'interpolate_gas')
+
+    add_layout_arguments(parser)
+
+    add_metrics_arguments(parser)
+
+
+def check_convert_arguments(arguments: argparse.Namespace) -> None:
+    if arguments.jobs < 1:
+        print('Error: The number of jobs has to be positive.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    if arguments.component is not None:
+        if os.path.isdir(arguments.source_path):
+            print('Error: --component requires a single FITS file.',
+                  file=sys.stderr)
+            sys.exit(1)
+        if arguments.pyramid:
+            print('Error: --component cannot be combined with --pyramid.',
+                  file=sys.stderr)
+            sys.exit(1)
+        try:
+            get_component_name(arguments.component)
+        except ValueError as error:
+            print(f'Error: {error}', file=sys.stderr)
+            sys.exit(1)
+
+
+def add_interpolate_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<source *.h5>',
+                        dest='source_file_path',
+                        help='H5 file file that contains the gas distribution '
+                             'that should be interpolated at the simulation '
+                             'grid points')
+
+    parser.add_argument(metavar='<destination *.h5>',
+                        dest='destination_file_path',
+                        help='H5 file into which the interpolated gas '
+                             'distribution should be saved')
+
+    parser.add_argument(metavar='<parameter *.nx>',
+                        dest='parameter_file_path',
+                        help='Picard parameter file')
+
+    region = parser.add_mutually_exclusive_group()
+
+    region.add_argument('--region',
+                        metavar=('<x start>', '<x stop>', '<y start>',
+                                 '<y stop>', '<z start>', '<z stop>'),
+                        dest='region',
+                        type=int,
+                        nargs=6,
+                        help='interpolate only the sub-block [<x start>, '
+                             '<x stop>) x [<y start>, <y stop>) x [<z start>, '
+                             '<z stop>) of the indices of the Picard grid and '
+                             'write it into the destination file, which may '
+                             'already exist')
+
+    region.add_argument('--region-kpc',
+                        metavar=('<x min>', '<x max>', '<y min>', '<y max>',
+                                 '<z min>', '<z max>'),
+                        dest='region_kpc',
+                        type=float,
+                        nargs=6,
+                        help='like --region, but the sub-block consists of '
+                             'the grid points within the given limits / kpc')
+
+    parser.add_argument('--shard',
+                        metavar='<index>/<count>',
+                        dest='shard',
+                        type=parse_shard,
+                        help='split the Picard grid into <count> x-slabs and '
+                             'interpolate only the slab <index> (0, 1, ..., '
+                             '<count> - 1) into a partial destination file; '
+                             'the partial files are assembled by merge_h5')
+
+    parser.add_argument('--method',
+                        choices=INTERPOLATION_METHODS,
+                        default='trilinear',
+                        help='interpolation method; tricubic uses cubic '
+                             'B-splines, which are smooth across the cell '
+                             'boundaries (default = trilinear)')
+
+    parser.add_argument('--spline-cache',
+                        metavar='<cache *.h5>',
+                        dest='spline_cache',
+                        help='H5 file in which the B-spline coefficients of '
+                             '--method tricubic are saved on first use and '
+                             'from which they are read by later runs with '
+                             'the same source')
+
+    parser.add_argument('--pointwise',
+                        action='store_true',
+                        help='evaluate the distribution point by point '
+                             'instead of axis by axis (slower, for '
+                             'cross-checking)')
+
+    parser.add_argument('--max-memory',
+                        metavar='<MiB>',
+                        dest='max_memory',
+                        type=float,
+                        help='stream the distribution slab by slab such that '
+                             'approximately at most <MiB> MiB of memory are '
+                             'used')
+
+    parser.add_argument('--pipeline',
+                        action='store_true',
+                        help='read the next slab and write the previous slab '
+                             'of a --max-memory run in background threads '
+                             'while the current slab is interpolated, which '
+                             'hides the I/O time (the slabs are half as '
+                             'large)')
+
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='continue an interrupted --max-memory run: the '
+                             'x-slabs that are already in the destination '
+                             'file are skipped (the source, the parameter '
+                             'file, and the precision have to be unchanged)')
+
+    parser.add_argument('--checkpoint-interval',
+                        metavar='<s>',
+                        dest='checkpoint_interval',
+                        type=float,
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='minimum time between two checkpoints of a '
+                             '--max-memory run, which record the finished '
+                             'x-slabs in the destination file (default = '
+                             f'{DEFAULT_CHECKPOINT_INTERVAL:g})')
+
+    parser.add_argument('--operator-cache',
+                        metavar='<directory>',
+                        dest='operator_cache',
+                        help='directory of the on-disk cache of the '
+                             'interpolation weights, which only depend on the '
+                             'grid of the distribution and on the Picard grid')
+
+    parser.add_argument('--operator-cache-size',
+                        metavar='<MiB>',
+                        dest='operator_cache_size',
+                        type=float,
+                        default=DEFAULT_MAX_CACHE_SIZE / 2**20,
+                        help='maximum size of the operator cache (default = '
+                             f'{DEFAULT_MAX_CACHE_SIZE // 2**20})')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        dest='jobs',
+                        type=int,
+                        default=1,
+                        help='number of processes that interpolate in '
+                             'parallel (default = 1)')
+
+    parser.add_argument('--precision',
+                        choices=PRECISION_NAMES,
+                        default='float64',
+                        help='data type in which the distribution is read '
+                             'and interpolated; float32 halves the memory '
+                             '(default = float64, native = data type of the '
+                             'source)')
+
+    parser.add_argument('--memory-map',
+                        action='store_true',
+                        dest='memory_map',
+                        help='memory-map the distribution instead of copying '
+                             'it if it is stored contiguously and has the '
+                             'data type given by --precision')
+
+    parser.add_argument('--use-pyramid',
+                        action='store_true',
+                        dest='use_pyramid',
+                        help='read the distribution from the coarsest '
+                             'downsampled level of the source file whose '
+                             'cells are still at most as large as the cells '
+                             'of the Picard grid (see --pyramid of '
+                             'fits_to_h5)')
+
+    add_layout_arguments(
+        parser, default_dtype_description='data type given by --precision'
+    )
+
+    add_metrics_arguments(parser)
+
+
+def check_interpolate_arguments(arguments: argparse.Namespace) -> None:
+    if arguments.jobs < 1:
+        print('Error: The number of jobs has to be positive.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.jobs > 1 and arguments.max_memory is not None:
+        print('Error: --jobs cannot be combined with --max-memory.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    for name in ('resume', 'pipeline'):
+        if getattr(arguments, name) and arguments.max_memory is None:
+            print(f'Error: --{name} requires --max-memory.', file=sys.stderr)
+            sys.exit(1)
+
+    if arguments.spline_cache is not None and arguments.method != 'tricubic':
+        print('Error: --spline-cache requires --method tricubic.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    if arguments.method == 'tricubic':
+        for name in ('pointwise', 'max_memory', 'operator_cache', 'region',
+                     'region_kpc', 'shard', 'resume'):
+            if getattr(arguments, name) not in (None, False):
+                option = '--' + name.replace('_', '-')
+                print(f'Error: --method tricubic cannot be combined with '
+                      f'{option}.', file=sys.stderr)
+                sys.exit(1)
+        if arguments.jobs > 1:
+            print('Error: --method tricubic cannot be combined with --jobs.',
+                  file=sys.stderr)
+            sys.exit(1)
+
+    has_region = (arguments.region is not None
+                  or arguments.region_kpc is not None)
+    if has_region:
+        for name in ('pointwise', 'max_memory', 'operator_cache', 'pyramid',
+                     'shard', 'resume'):
+            if getattr(arguments, name) not in (None, False):
+                option = '--' + name.replace('_', '-')
+                print(f'Error: --region cannot be combined with {option}.',
+                      file=sys.stderr)
+                sys.exit(1)
+        if arguments.jobs > 1:
+            print('Error: --region cannot be combined with --jobs.',
+                  file=sys.stderr)
+            sys.exit(1)
+
+    if arguments.shard is not None:
+        # The pyramid of the whole density is written by merge_h5.
+        for name in ('pointwise', 'max_memory', 'operator_cache', 'pyramid'):
+            if getattr(arguments, name) not in (None, False):
+                option = '--' + name.replace('_', '-')
+                print(f'Error: --shard cannot be combined with {option}.',
+                      file=sys.stderr)
+                sys.exit(1)
+        if arguments.jobs > 1:
+            print('Error: --shard cannot be combined with --jobs.',
+                  file=sys.stderr)
+            sys.exit(1)
+
+    if not has_region and not arguments.resume:
+        check_new_file(arguments.destination_file_path)
+
+
+def check_component_arguments(arguments: argparse.Namespace) -> None:
+    """
+    Raises ValueError if an option is given that can't be used for a source
+    with several density components, which are projected together in the
+    memory. Called by interpolate_gas once it knows that the source file has
+    components.
+    """
+    for name in ('pointwise', 'max_memory', 'region', 'region_kpc',
+                 'shard', 'use_pyramid', 'pyramid'):
+        if getattr(arguments, name) not in (None, False):
+            option = '--' + name.replace('_', '-')
+            raise ValueError(f'The components of a source file cannot be '
+                             f'projected with {option}.')
+    if arguments.method == 'tricubic' or arguments.jobs > 1:
+        raise ValueError('The components of a source file cannot be '
+                         'projected with --method tricubic or --jobs.')
+
+
+def add_merge_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<shard *.h5>',
+                        dest='shard_file_paths',
+                        nargs='+',
+                        help='partial files written by interpolate_gas '
+                             '--shard (all shards of the run)')
+
+    parser.add_argument(metavar='<destination *.h5>',
+                        dest='destination_file_path',
+                        help='H5 file into which the shards are assembled')
+
+    parser.add_argument('--block-size',
+                        metavar='<MiB>',
+                        dest='block_size',
+                        type=float,
+                        default=DEFAULT_BLOCK_SIZE,
+                        help='size of the blocks in which the data are copied '
+                             f'(default = {DEFAULT_BLOCK_SIZE})')
+
+    add_layout_arguments(parser,
+                         default_dtype_description='data type of the shards')
+
+    add_metrics_arguments(parser)
+
+
+def check_merge_arguments(arguments: argparse.Namespace) -> None:
+    if arguments.block_size <= 0:
+        print('Error: The block size has to be positive.', file=sys.stderr)
+        sys.exit(1)
+    check_new_file(arguments.destination_file_path)
+
+
+def read_manifest(manifest_path: str) -> dict:
+    """
+    Reads a JSON manifest of the form
+        {
+            "sources": ["HI_*.h5", "H2_dens_mean_model_1.h5"],
+            "parameter files": ["grids/*.nx"],
+            "output directory": "projections"
+        }
+    The paths may contain glob patterns.
+    """
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        print(f"Error: The manifest '{manifest_path}' does not exist.",
+              file=sys.stderr)
+        sys.exit(1)
+    except json.JSONDecodeError as error:
+        print(f"Error: The manifest '{manifest_path}' is invalid: {error}",
+              file=sys.stderr)
+        sys.exit(1)
+    return manifest
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-s', '--sources',
+                        metavar='<source *.h5>',
+                        dest='sources',
+                        nargs='+',
+                        default=[],
+                        help='H5 files (or glob patterns) that contain the '
+                             'gas distributions')
+
+    parser.add_argument('-p', '--parameter-files',
+                        metavar='<parameter *.nx>',
+                        dest='parameter_files',
+                        nargs='+',
+                        default=[],
+                        help='Picard parameter files (or glob patterns)')
+
+    parser.add_argument('-o', '--output-directory',
+                        metavar='<directory>',
+                        dest='output_directory',
+                        help='directory into which the interpolated gas '
+                             'distributions should be saved')
+
+    parser.add_argument('-m', '--manifest',
+                        metavar='<manifest *.json>',
+                        dest='manifest',
+                        help='JSON file with the lists "sources" and '
+                             '"parameter files" and the "output directory"; '
+                             'the other options extend or override it')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        dest='jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='number of processes (default = number of CPUs)')
+
+    parser.add_argument('--operator-cache',
+                        metavar='<directory>',
+                        dest='operator_cache',
+                        help='directory of the on-disk cache of the '
+                             'interpolation weights')
+
+    parser.add_argument('--precision',
+                        choices=PRECISION_NAMES,
+                        default='float64',
+                        help='data type in which the distributions are read '
+                             'and interpolated (default = float64, native = '
+                             'data type of the sources)')
+
+    add_layout_arguments(
+        parser, default_dtype_description='data type given by --precision'
+    )
+
+
+def check_batch_arguments(arguments: argparse.Namespace) -> None:
+    if arguments.manifest is not None:
+        manifest = read_manifest(arguments.manifest)
+        arguments.sources = manifest.get('sources', []) + arguments.sources
+        arguments.parameter_files = (manifest.get('parameter files', [])
+                                     + arguments.parameter_files)
+        if arguments.output_directory is None:
+            arguments.output_directory = manifest.get('output directory')
+
+    if len(arguments.sources) == 0:
+        print('Error: No source files have been specified.', file=sys.stderr)
+        sys.exit(1)
+    if len(arguments.parameter_files) == 0:
+        print('Error: No parameter files have been specified.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.output_directory is None:
+        print('Error: No output directory has been specified.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.jobs < 1:
+        print('Error: The number of jobs has to be positive.',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+def add_plot_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<file .*h5>',
+                        dest='h5_file_path',
+                        help='h5 file')
+
+    parser.add_argument('-a', '--axis',
+                        choices=AXES,
+                        help='axis perpendicular to the plane (default = z)')
+
+    parser.add_argument('-i', '--index',
+                        metavar='<index>',
+                        dest='index',
+                        type=int,
+                        help='index of the plane along the axis (default = '
+                             'max_index // 2)')
+
+    parser.add_argument('-z',
+                        metavar='<z index>',
+                        dest='z_index',
+                        type=int,
+                        help='z index (same as -a z -i <z index>)')
+
+    parser.add_argument('-p', '--projection',
+                        choices=PROJECTIONS,
+                        help='show the density integrated along the axis or '
+                             'its maximum along the axis instead of a plane')
+
+    parser.add_argument('-I', '--interactive',
+                        action='store_true',
+                        help='show a slider for the index and buttons for the '
+                             'axis and the projection')
+
+    parser.add_argument('--level',
+                        metavar='<factor>',
+                        dest='level',
+                        type=int,
+                        help='plot the downsampled level with the given '
+                             'factor, e.g., 4 (see --pyramid of fits_to_h5)')
+
+    parser.add_argument('-c', '--component',
+                        metavar='<name>',
+                        dest='component',
+                        help='plot the density component <name> (see '
+                             '--component of fits_to_h5)')
+
+    parser.add_argument('-L',
+                        metavar='<lower limit>',
+                        dest='lower_limit',
+                        type=float,
+                        help='lower density limit / cm^-3')
+
+    parser.add_argument('-U',
+                        metavar='<upper limit>',
+                        dest='upper_limit',
+                        type=float,
+                        help='upper density limit / cm^-3')
+
+    parser.add_argument('-l', '--logarithmic',
+                        action='store_true',
+                        help='logarithmic')
+
+    add_metrics_arguments(parser)
+
+
+def check_plot_arguments(arguments: argparse.Namespace) -> None:
+    def sign_check(value, argument_name):
+        is_negative = value is not None and value < 0
+        if is_negative:
+            print(f'{argument_name} has to be positive.', file=sys.stderr)
+            sys.exit(1)
+
+    sign_check(arguments.z_index, 'The z index')
+    sign_check(arguments.index, 'The index')
+    sign_check(arguments.lower_limit, 'The lower limit')
+    sign_check(arguments.upper_limit, 'The upper limit')
+
+    if arguments.component is not None and arguments.level is not None:
+        print('--component cannot be combined with --level.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    if arguments.z_index is not None:
+        if arguments.axis not in (None, 'z') or arguments.index is not None:
+            print('-z cannot be combined with --axis or --index.',
+                  file=sys.stderr)
+            sys.exit(1)
+        arguments.axis = 'z'
+        arguments.index = arguments.z_index
+    if arguments.axis is None:
+        arguments.axis = 'z'
+
+
+def add_columns_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<source *.h5>',
+                        dest='source_file_path',
+                        help='H5 file that contains the gas density')
+
+    parser.add_argument(metavar='<destination *.h5>',
+                        dest='destination_file_path',
+                        help='H5 file into which the sky map of the column '
+                             'densities is saved')
+
+    parser.add_argument('--observer',
+                        metavar=('<x>', '<y>', '<z>'),
+                        dest='observer',
+                        type=float,
+                        nargs=3,
+                        required=True,
+                        help='position of the observer / kpc; the longitude '
+                             '0 points from the observer towards the z axis')
+
+    parser.add_argument('--n-longitudes',
+                        metavar='<number>',
+                        dest='n_longitudes',
+                        type=int,
+                        default=DEFAULT_N_LONGITUDES,
+                        help='number of pixels along the longitude (default = '
+                             f'{DEFAULT_N_LONGITUDES})')
+
+    parser.add_argument('--n-latitudes',
+                        metavar='<number>',
+                        dest='n_latitudes',
+                        type=int,
+                        default=DEFAULT_N_LATITUDES,
+                        help='number of pixels along the latitude (default = '
+                             f'{DEFAULT_N_LATITUDES})')
+
+    parser.add_argument('--distances',
+                        metavar='<kpc>',
+                        dest='distances',
+                        type=float,
+                        nargs='+',
+                        default=[0., float('inf')],
+                        help='increasing limits of the distance shells, for '
+                             'each of which a sky map is integrated, e.g., 0 '
+                             '1 2 inf (default = 0 inf)')
+
+    parser.add_argument('--step',
+                        metavar='<kpc>',
+                        dest='step',
+                        type=float,
+                        help='maximum distance between two samples along a '
+                             f'ray (default = {DEFAULT_STEP} x the smallest '
+                             'cell size)')
+
+    parser.add_argument('--component',
+                        metavar='<name>',
+                        dest='component',
+                        help='integrate the density component <name> (see '
+                             '--component of fits_to_h5)')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        dest='jobs',
+                        type=int,
+                        default=1,
+                        help='number of processes that integrate in parallel '
+                             '(default = 1)')
+
+    add_metrics_arguments(parser)
+
+
+def check_columns_arguments(arguments: argparse.Namespace) -> None:
+    for name in ('n_longitudes', 'n_latitudes', 'jobs', 'step'):
+        value = getattr(arguments, name)
+        if value is not None and value <= 0:
+            option = '--' + name.replace('_', '-')
+            print(f'Error: {option} has to be positive.', file=sys.stderr)
+            sys.exit(1)
+    distances = arguments.distances
+    if (len(distances) < 2 or distances[0] < 0
+            or any(stop <= start
+                   for start, stop in zip(distances, distances[1:]))):
+        print('Error: The distances have to be at least two increasing, '
+              'non-negative limits.', file=sys.stderr)
+        sys.exit(1)
+    observer = arguments.observer
+    if observer[0] == 0 and observer[1] == 0:
+        print('Error: The observer must not be located on the z axis.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    check_new_file(arguments.destination_file_path)
+
+
+def add_info_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<file *.h5>',
+                        dest='h5_file_path',
+                        help='H5 file')
+
+    parser.add_argument('--values',
+                        metavar='<number>',
+                        dest='max_values',
+                        type=int,
+                        default=16,
+                        help='print the values of the datasets with at most '
+                             '<number> elements, e.g., of the grid limits '
+                             '(default = 16)')
+
+
+def check_info_arguments(arguments: argparse.Namespace) -> None:
+    if arguments.max_values < 0:
+        print('Error: --values has to be non-negative.', file=sys.stderr)
+        sys.exit(1)
+
+
+def add_compare_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(metavar='<reference *.h5>',
+                        dest='reference_file_path',
+                        help='H5 file that contains the reference density')
+
+    parser.add_argument(metavar='<compared *.h5>',
+                        dest='compared_file_path',
+                        help='H5 file that contains the density that is '
+                             'compared with the reference')
+
+    parser.add_argument('--rtol',
+                        metavar='<relative tolerance>',
+                        dest='rtol',
+                        type=float,
+                        default=DEFAULT_RTOL,
+                        help='a value is outside the tolerance if |compared '
+                             '- reference| > atol + rtol * |reference| '
+                             f'(default = {DEFAULT_RTOL:g})')
+
+    parser.add_argument('--atol',
+                        metavar='<cm^-3>',
+                        dest='atol',
+                        type=float,
+                        default=DEFAULT_ATOL,
+                        help='absolute tolerance (default = '
+                             f'{DEFAULT_ATOL:g})')
+
+    parser.add_argument('--max-fraction',
+                        metavar='<fraction>',
+                        dest='max_fraction',
+                        type=float,
+                        default=0.,
+                        help='exit with 1 if more than this fraction of the '
+                             'values is outside the tolerance (default = 0)')
+
+    parser.add_argument('--fail-fast',
+                        action='store_true',
+                        dest='fail_fast',
+                        help='stop as soon as more values than allowed by '
+                             '--max-fraction are outside the tolerance')
+
+    parser.add_argument('--component',
+                        metavar='<name>',
+                        dest='component',
+                        help='compare the density components <name> (see '
+                             '--component of fits_to_h5)')
+
+    parser.add_argument('--block-size',
+                        metavar='<MiB>',
+                        dest='block_size',
+                        type=float,
+                        default=DEFAULT_BLOCK_SIZE,
+                        help='size of the blocks in which the densities are '
+                             f'compared (default = {DEFAULT_BLOCK_SIZE})')
+
+    parser.add_argument('-j', '--jobs',
+                        metavar='<number of jobs>',
+                        dest='jobs',
+                        type=int,
+                        default=1,
+                        help='number of processes that compare blocks in '
+                             'parallel (default = 1)')
+
+    add_metrics_arguments(parser)
+
+
+def check_compare_arguments(arguments: argparse.Namespace) -> None:
+    for name in ('jobs', 'block_size'):
+        if getattr(arguments, name) <= 0:
+            option = '--' + name.replace('_', '-')
+            print(f'Error: {option} has to be positive.', file=sys.stderr)
+            sys.exit(1)
+    for name in ('rtol', 'atol'):
+        if not getattr(arguments, name) >= 0:
+            print(f'Error: --{name} has to be non-negative.', file=sys.stderr)
+            sys.exit(1)
+    if not 0 <= arguments.max_fraction <= 1:
+        print('Error: --max-fraction has to be between 0 and 1.',
+              file=sys.stderr)
+        sys.exit(1)
+    if arguments.component is not None:
+        try:
+            get_component_name(arguments.component)
+        except ValueError as error:
+            print(f'Error: {error}', file=sys.stderr)
+            sys.exit(1)
+
+
+# description, function that adds the arguments, and function that checks
+# the parsed arguments of each subcommand
+PARSERS: Dict[str, Tuple[str,
+                         Callable[[argparse.ArgumentParser], None],
+                         Callable[[argparse.Namespace], None]]] = {
+    'convert': ('Converts the 3D FITS files from '
+                'https://zenodo.org/record/5501196 to H5 files.',
+                add_convert_arguments,
+                check_convert_arguments),
+    'interpolate': ('Projects the numerical distribution onto the grid '
+                    'specified by the Picard parameter file.',
+                    add_interpolate_arguments,
+                    check_interpolate_arguments),
+    'merge': ('Assembles the partial files of a sharded interpolate_gas run '
+              'into a single H5 file.',
+              add_merge_arguments,
+              check_merge_arguments),
+    'batch': ('Projects several numerical distributions onto several grids '
+              'specified by Picard parameter files in a single process.',
+              add_batch_arguments,
+              check_batch_arguments),
+    'plot': ('Shows a plane or a projection of a gas density.',
+             add_plot_arguments,
+             check_plot_arguments),
+    'columns': ('Integrates a gas density along the lines of sight of a '
+                'full-sky grid of pixels.',
+                add_columns_arguments,
+                check_columns_arguments),
+    'compare': ('Compares the density of an H5 file with the one of a '
+                'reference H5 file block by block.',
+                add_compare_arguments,
+                check_compare_arguments),
+    'info': ('Prints the datasets of an H5 file with their shapes and '
+             'attributes and the grid limits without reading the densities.',
+             add_info_arguments,
+             check_info_arguments),
+}
+
+
+def parse_arguments(subcommand: str,
+                    args: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parses and checks the arguments `args` (default: sys.argv[1:]) of the
+    subcommand `subcommand`, e.g., 'interpolate', of a console script.
+    """
+    description, add_arguments, check_arguments = PARSERS[subcommand]
+    parser = argparse.ArgumentParser(description=description)
+    add_arguments(parser)
+    arguments = parser.parse_args(args)
+    check_arguments(arguments)
+    return arguments
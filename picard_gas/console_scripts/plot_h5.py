@@ -1,93 +1,224 @@
 #!/usr/bin/env python
 """
-Shows an X-Y plot of a gas density.
+Shows a plane or a projection of a gas density.
+
+Only the shown plane is read from the file. In the interactive mode, the
+plane can be chosen via a slider, and the recently shown planes as well as the
+projections are kept in the memory (see plane_cache.PlaneCache).
 
 Author: Stefan Lepperdinger
 """
 from picard_gas.H5File import H5File
+from picard_gas.console_scripts.arguments import report_metrics
+from picard_gas.console_scripts.errors import exit_on_user_error
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.metrics import Metrics
+from picard_gas.plane_cache import AXES
+from picard_gas.plane_cache import PROJECTIONS
+from picard_gas.plane_cache import PlaneCache
+from picard_gas.settings import get_component_name
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from matplotlib import colors
+from matplotlib.widgets import RadioButtons
+from matplotlib.widgets import Slider
 import argparse
 import numpy as np
 import sys
+from typing import Optional
+from typing import Tuple
+
+SLICE = 'slice'
 
 
-def plot(arguments: argparse.Namespace):
+def plot(arguments: argparse.Namespace, metrics: Metrics):
     """
-    Shows an X-Y plot of the gas density.
+    Shows a plane or a projection of the gas density.
     """
     file = H5File(arguments.h5_file_path, 'r')
-    density = file.read_density()
-    grid_volume_limits = file.read_grid_volume_limits()
-    print('Shape of the density:', density.shape)
-    z_index = (arguments.z_index if arguments.z_index is not None
-               else density.shape[2] // 2)
-    image = density[:, :, z_index]
+    if arguments.level is not None:
+        if arguments.level not in file.read_levels():
+            print(f'Error: The file has no {arguments.level}x level.',
+                  file=sys.stderr)
+            sys.exit(1)
+        file.use_level(arguments.level)
+    if arguments.component is not None:
+        name = get_component_name(arguments.component)
+        if name not in file.read_density_names():
+            print(f"Error: The file has no component "
+                  f"'{arguments.component}'.", file=sys.stderr)
+            sys.exit(1)
+        file.use_density(name)
+    planes = PlaneCache(file)
+    print('Shape of the density:', planes.shape)
+    axis_index = AXES.index(arguments.axis)
+    index = (arguments.index if arguments.index is not None
+             else planes.shape[axis_index] // 2)
+    if index >= planes.shape[axis_index]:
+        print(f'Error: The {arguments.axis} index has to be smaller than '
+              f'{planes.shape[axis_index]}.', file=sys.stderr)
+        sys.exit(1)
+    view = SLICE if arguments.projection is None else arguments.projection
+
+    if arguments.interactive:
+        show_viewer(planes, arguments.axis, index, view, arguments)
+        metrics.count('bytes read', file.bytes_read)
+        return
+
+    with metrics.stage('read density'):
+        image = get_image(planes, arguments.axis, index, view)
+    metrics.count('bytes read', file.bytes_read)
+    with metrics.stage('plot'):
+        draw(image, planes.grid_volume_limits, arguments.axis, index, view,
+             arguments)
+    plt.show()
+
+
+def get_image(planes: PlaneCache,
+              axis: str,
+              index: int,
+              view: str) -> np.ndarray:
+    """
+    Returns the plane at the index `index` of the axis `axis` or, if `view`
+    is a projection, the projection along the axis.
+    """
+    if view == SLICE:
+        return planes.get_plane(axis, index)
+    return planes.get_projection(axis, view)
+
+
+def get_plot_properties(grid_volume_limits: np.ndarray,
+                        axis: str,
+                        index: int,
+                        view: str) -> Tuple[np.ndarray, str, str, str, str]:
+    """
+    Returns the extent, the horizontal and vertical axis labels, the title,
+    and the color bar label of a plot of a plane perpendicular to `axis`.
+    """
+    horizontal, vertical = (other for other in AXES if other != axis)
+    extent = np.concatenate([grid_volume_limits[AXES.index(horizontal)],
+                             grid_volume_limits[AXES.index(vertical)]])
+    if view == SLICE:
+        title = f'{axis} index = {index}'
+        label = 'Density [cm$^{-3}$]'
+    elif view == 'integrated':
+        title = f'density integrated along {axis}'
+        label = 'Integrated density [cm$^{-3}$ kpc]'
+    else:
+        title = f'maximum density along {axis}'
+        label = 'Maximum density [cm$^{-3}$]'
+    return (extent, f'{horizontal} [kpc]', f'{vertical} [kpc]', title,
+            label)
+
+
+def draw(image: np.ndarray,
+         grid_volume_limits: np.ndarray,
+         axis: str,
+         index: int,
+         view: str,
+         arguments: argparse.Namespace):
+    """
+    Draws the plane `image`, which is perpendicular to `axis`.
+    """
+    extent, x_label, y_label, title, label = get_plot_properties(
+        grid_volume_limits, axis, index, view
+    )
     norm = colors.LogNorm() if arguments.logarithmic else None
     color_map = cm.get_cmap('magma')
     color_map.set_bad('black')
     image = plt.imshow(image.T,
                        cmap=color_map,
                        norm=norm,
-                       extent=np.concatenate(grid_volume_limits[:2]),
+                       extent=extent,
                        origin='lower')
-    plt.colorbar(image, location='bottom', label='Density [cm$^{-3}]$')
+    plt.colorbar(image, location='bottom', label=label)
     plt.clim(arguments.lower_limit, arguments.upper_limit)
-    plt.xlabel('x [kpc]')
-    plt.ylabel('y [kpc]')
-    plt.title(f'z index = {z_index}')
-    plt.show()
+    plt.xlabel(x_label)
+    plt.ylabel(y_label)
+    plt.title(title)
+    return image
 
 
-def parse_arguments() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(
-        description='Shows an X-Y gas density plot.',
-    )
-    parser.add_argument(metavar='<file .*h5>',
-                        dest='h5_file_path',
-                        help='h5 file')
-
-    parser.add_argument('-z',
-                        metavar='<z index>',
-                        dest='z_index',
-                        type=int,
-                        help='z index (default = max_z_index // 2)')
-
-    parser.add_argument('-L',
-                        metavar='<lower limit>',
-                        dest='lower_limit',
-                        type=float,
-                        help='lower density limit / cm^-3')
-
-    parser.add_argument('-U',
-                        metavar='<upper limit>',
-                        dest='upper_limit',
-                        type=float,
-                        help='upper density limit / cm^-3')
-
-    parser.add_argument('-l', '--logarithmic',
-                        action='store_true',
-                        help='logarithmic')
-
-    parsed_arguments = parser.parse_args()
-
-    def sign_check(value, argument_name):
-        is_negative = value is not None and value < 0
-        if is_negative:
-            print(f'{argument_name} has to be positive.', file=sys.stderr)
-            sys.exit(1)
+def show_viewer(planes: PlaneCache,
+                axis: str,
+                index: int,
+                view: str,
+                arguments: argparse.Namespace):
+    """
+    Shows the density with a slider for the index of the plane and with
+    buttons for choosing the axis and the view (slice or projection).
+    """
+    figure = plt.figure()
+    plot_axes = figure.add_axes([0.3, 0.25, 0.65, 0.7])
+    plt.sca(plot_axes)
+    image = draw(get_image(planes, axis, index, view),
+                 planes.grid_volume_limits, axis, index, view, arguments)
+    slider = Slider(figure.add_axes([0.3, 0.03, 0.55, 0.03]),
+                    'index',
+                    valmin=0,
+                    valmax=planes.shape[AXES.index(axis)] - 1,
+                    valinit=index,
+                    valstep=1)
+    axis_buttons = RadioButtons(figure.add_axes([0.02, 0.6, 0.15, 0.2]),
+                                AXES,
+                                active=AXES.index(axis))
+    views = (SLICE,) + PROJECTIONS
+    view_buttons = RadioButtons(figure.add_axes([0.02, 0.3, 0.15, 0.2]),
+                                views,
+                                active=views.index(view))
+    state = {'axis': axis, 'index': index, 'view': view}
+
+    def update(new_axis: Optional[str] = None):
+        if new_axis is not None and new_axis != state['axis']:
+            state['axis'] = new_axis
+            n = planes.shape[AXES.index(new_axis)]
+            slider.valmax = n - 1
+            slider.ax.set_xlim(slider.valmin, slider.valmax)
+            # set_val calls update again
+            slider.set_val(n // 2)
+            return
+        extent, x_label, y_label, title, _ = get_plot_properties(
+            planes.grid_volume_limits, state['axis'], state['index'],
+            state['view']
+        )
+        image.set_data(get_image(planes, state['axis'], state['index'],
+                                 state['view']).T)
+        image.set_extent(extent)
+        image.autoscale()
+        image.set_clim(
+            arguments.lower_limit if arguments.lower_limit is not None
+            else image.norm.vmin,
+            arguments.upper_limit if arguments.upper_limit is not None
+            else image.norm.vmax,
+        )
+        plot_axes.set_xlabel(x_label)
+        plot_axes.set_ylabel(y_label)
+        plot_axes.set_title(title)
+        figure.canvas.draw_idle()
+
+    def on_index(value):
+        state['index'] = int(value)
+        update()
+
+    def on_view(label):
+        state['view'] = label
+        update()
+
+    slider.on_changed(on_index)
+    axis_buttons.on_clicked(update)
+    view_buttons.on_clicked(on_view)
+    plt.show()
 
-    sign_check(parsed_arguments.z_index, 'The z index')
-    sign_check(parsed_arguments.lower_limit, 'The lower limit')
-    sign_check(parsed_arguments.upper_limit, 'The upper limit')
 
-    return parsed_arguments
+def run(arguments: argparse.Namespace) -> None:
+    metrics = Metrics()
+    plot(arguments, metrics)
+    report_metrics(metrics, arguments)
 
 
+@exit_on_user_error
 def main():
-    arguments = parse_arguments()
-    plot(arguments)
+    run(parse_arguments('plot'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+"""
+Differences between a density and a reference density that are accumulated
+block by block (see the console script compare_h5), so that neither density
+has to fit into the memory:
+
+    maximum absolute error        : max |compared - reference| and its index
+    maximum relative error        : max |compared - reference| / |reference|
+                                    of the values whose reference isn't 0
+                                    and its index
+    RMS error                     : root mean square of compared - reference
+    values outside the tolerance  : number of values with
+                                    |compared - reference|
+                                    > atol + rtol * |reference|
+
+NaN matches NaN. A NaN that is compared with a number is outside the
+tolerance and is otherwise ignored, like a pair of NaNs.
+
+Usage:
+    difference = DensityDifference(rtol, atol)
+    for start, reference_block, compared_block in blocks:
+        difference.update(start, reference_block, compared_block)
+
+Author: Stefan Lepperdinger
+"""
+import numpy as np
+from typing import Optional
+from typing import Tuple
+
+
+class DensityDifference:
+    def __init__(self, rtol: float, atol: float):
+        self.rtol = rtol
+        self.atol = atol
+        # number of compared values
+        self.count = 0
+        # number of pairs of values of which at least one is NaN
+        self.n_nan = 0
+        self.sum_of_squares = 0.
+        self.max_abs_error = 0.
+        # index (x, y, z) of the maximum absolute error and the reference and
+        # the compared value at it
+        self.max_abs_error_index: Optional[Tuple[int, ...]] = None
+        self.max_abs_error_values: Optional[Tuple[float, float]] = None
+        self.max_rel_error = 0.
+        self.max_rel_error_index: Optional[Tuple[int, ...]] = None
+        self.n_outside = 0
+
+    def update(self,
+               start: Tuple[int, ...],
+               reference: np.ndarray,
+               compared: np.ndarray) -> None:
+        """
+        Adds the differences between the blocks `reference` and `compared`,
+        which start at the index `start` = (x, y, z) of the densities.
+        """
+        reference = np.asarray(reference, dtype=np.float64)
+        abs_errors = np.subtract(compared, reference, dtype=np.float64)
+        np.abs(abs_errors, out=abs_errors)
+        self.count += abs_errors.size
+        is_nan = np.isnan(abs_errors)
+        n_nan = int(np.count_nonzero(is_nan))
+        if n_nan > 0:
+            self.n_nan += n_nan
+            self.n_outside += int(np.count_nonzero(
+                np.isnan(reference) != np.isnan(compared)
+            ))
+            abs_errors[is_nan] = 0.
+        if n_nan == abs_errors.size:
+            return
+
+        abs_references = np.abs(reference)
+        self.sum_of_squares += float(np.vdot(abs_errors, abs_errors))
+        tolerance = abs_references * self.rtol
+        tolerance += self.atol
+        self.n_outside += int(np.count_nonzero(abs_errors > tolerance))
+
+        flat_index = int(np.argmax(abs_errors))
+        max_abs_error = float(abs_errors.flat[flat_index])
+        if max_abs_error > self.max_abs_error:
+            self.max_abs_error = max_abs_error
+            self.max_abs_error_index = self._get_index(start, abs_errors,
+                                                       flat_index)
+            self.max_abs_error_values = (
+                float(reference.flat[flat_index]),
+                float(np.asarray(compared).flat[flat_index]),
+            )
+
+        is_zero = abs_references == 0
+        rel_errors = np.divide(abs_errors, abs_references,
+                               out=abs_errors, where=~is_zero)
+        rel_errors[is_zero] = 0.
+        flat_index = int(np.argmax(rel_errors))
+        max_rel_error = float(rel_errors.flat[flat_index])
+        if max_rel_error > self.max_rel_error:
+            self.max_rel_error = max_rel_error
+            self.max_rel_error_index = self._get_index(start, rel_errors,
+                                                       flat_index)
+
+    @staticmethod
+    def _get_index(start: Tuple[int, ...],
+                   block: np.ndarray,
+                   flat_index: int) -> Tuple[int, ...]:
+        index = np.unravel_index(flat_index, block.shape)
+        return tuple(int(first + offset)
+                     for first, offset in zip(start, index))
+
+    def merge(self, other: 'DensityDifference') -> None:
+        """
+        Adds the differences accumulated by `other`, e.g., by a worker
+        process. Equal maxima are attributed to the blocks added first.
+        """
+        self.count += other.count
+        self.n_nan += other.n_nan
+        self.sum_of_squares += other.sum_of_squares
+        self.n_outside += other.n_outside
+        if other.max_abs_error > self.max_abs_error:
+            self.max_abs_error = other.max_abs_error
+            self.max_abs_error_index = other.max_abs_error_index
+            self.max_abs_error_values = other.max_abs_error_values
+        if other.max_rel_error > self.max_rel_error:
+            self.max_rel_error = other.max_rel_error
+            self.max_rel_error_index = other.max_rel_error_index
+
+    def get_rms_error(self) -> float:
+        n_values = self.count - self.n_nan
+        if n_values == 0:
+            return 0.
+        return float(np.sqrt(self.sum_of_squares / n_values))
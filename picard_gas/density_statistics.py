@@ -0,0 +1,140 @@
+"""
+Summary statistics of a density that are accumulated block by block while the
+density is written (see H5File.write_statistics), so that checking a
+projection against its source doesn't need another pass over the files:
+
+    volume integral [cm^-3 kpc^3] : sum of the densities times the cell
+                                    volume, i.e., the amount of gas
+    minimum, maximum [cm^-3]      : extrema of the values that aren't NaN
+    negative values, NaN values   : numbers of such values
+    log histogram                 : numbers of positive values in the
+                                    logarithmic bins given by
+                                    'log histogram edges [cm^-3]'
+
+Usage:
+    statistics = DensityStatistics()
+    for block in blocks:
+        statistics.update(block)
+    attributes = statistics.get_attributes(cell_volume)
+
+Author: Stefan Lepperdinger
+"""
+import numpy as np
+from typing import Tuple
+
+# edges of the bins of the histogram / cm^-3 (4 bins per decade); positive
+# values outside of them are counted in the first or the last bin
+HISTOGRAM_DECADES = -10, 4
+HISTOGRAM_BINS_PER_DECADE = 4
+HISTOGRAM_EDGES = 10. ** np.linspace(
+    HISTOGRAM_DECADES[0], HISTOGRAM_DECADES[1],
+    (HISTOGRAM_DECADES[1] - HISTOGRAM_DECADES[0]) * HISTOGRAM_BINS_PER_DECADE
+    + 1
+)
+# number of values whose bins are computed at once
+HISTOGRAM_PIECE_SIZE = 2**16
+
+# attributes of a density dataset that contain its statistics
+VOLUME_INTEGRAL_ATTRIBUTE_NAME = 'volume integral [cm^-3 kpc^3]'
+MINIMUM_ATTRIBUTE_NAME = 'minimum [cm^-3]'
+MAXIMUM_ATTRIBUTE_NAME = 'maximum [cm^-3]'
+NEGATIVE_VALUES_ATTRIBUTE_NAME = 'negative values'
+NAN_VALUES_ATTRIBUTE_NAME = 'NaN values'
+HISTOGRAM_ATTRIBUTE_NAME = 'log histogram'
+HISTOGRAM_EDGES_ATTRIBUTE_NAME = 'log histogram edges [cm^-3]'
+STATISTICS_ATTRIBUTE_NAMES = (
+    VOLUME_INTEGRAL_ATTRIBUTE_NAME,
+    MINIMUM_ATTRIBUTE_NAME,
+    MAXIMUM_ATTRIBUTE_NAME,
+    NEGATIVE_VALUES_ATTRIBUTE_NAME,
+    NAN_VALUES_ATTRIBUTE_NAME,
+    HISTOGRAM_ATTRIBUTE_NAME,
+    HISTOGRAM_EDGES_ATTRIBUTE_NAME,
+)
+
+
+def get_cell_volume(grid_volume_limits: np.ndarray,
+                    grid_shape: Tuple[int, ...]) -> float:
+    """
+    Returns the volume / kpc^3 of a cell of the grid given by its volume
+    limits and its shape (for a shard, the shape of the whole grid).
+
+    Raises ValueError if the volume isn't positive.
+    """
+    cell_size = ((grid_volume_limits[:, 1] - grid_volume_limits[:, 0])
+                 / np.asarray(grid_shape))
+    cell_volume = float(np.prod(cell_size))
+    if not cell_volume > 0:
+        raise ValueError(f'The cell volume {cell_volume:g} kpc^3 given by '
+                         f"the grid volume limits isn't positive.")
+    return cell_volume
+
+
+class DensityStatistics:
+    def __init__(self):
+        # number of values
+        self.count = 0
+        # sum of the values that aren't NaN
+        self.sum = 0.
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.n_negative = 0
+        self.n_nan = 0
+        self.histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+
+    def update(self, block: np.ndarray) -> None:
+        """
+        Adds the values of `block`.
+        """
+        values = np.ravel(block)
+        self.count += values.size
+        is_nan = np.isnan(values)
+        n_nan = int(np.count_nonzero(is_nan))
+        if n_nan > 0:
+            self.n_nan += n_nan
+            values = values[~is_nan]
+        if values.size == 0:
+            return
+        self.sum += float(np.sum(values, dtype=np.float64))
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.n_negative += int(np.count_nonzero(values < 0))
+        # The bins are computed in pieces that fit into the CPU cache, and
+        # in place, which is about 3 times faster than for the whole block.
+        n_bins = len(self.histogram)
+        for start in range(0, values.size, HISTOGRAM_PIECE_SIZE):
+            piece = values[start:start + HISTOGRAM_PIECE_SIZE]
+            bins = np.log10(piece[piece > 0], dtype=np.float64)
+            bins -= HISTOGRAM_DECADES[0]
+            bins *= HISTOGRAM_BINS_PER_DECADE
+            # Values below the first edge become negative here, so
+            # truncating them instead of flooring doesn't matter.
+            np.clip(bins, 0, n_bins - 1, out=bins)
+            self.histogram += np.bincount(bins.astype(np.intp),
+                                          minlength=n_bins)
+
+    def add_zeros(self, n: int) -> None:
+        """
+        Adds `n` zeros, e.g., the parts of a density that haven't been
+        written and read as 0.
+        """
+        if n > 0:
+            self.count += n
+            self.minimum = min(self.minimum, 0.)
+            self.maximum = max(self.maximum, 0.)
+
+    def get_attributes(self, cell_volume: float) -> dict:
+        """
+        Returns the statistics as attributes of a density dataset whose
+        cells have the volume `cell_volume` / kpc^3.
+        """
+        has_values = self.count > self.n_nan
+        return {
+            VOLUME_INTEGRAL_ATTRIBUTE_NAME: self.sum * cell_volume,
+            MINIMUM_ATTRIBUTE_NAME: self.minimum if has_values else np.nan,
+            MAXIMUM_ATTRIBUTE_NAME: self.maximum if has_values else np.nan,
+            NEGATIVE_VALUES_ATTRIBUTE_NAME: self.n_negative,
+            NAN_VALUES_ATTRIBUTE_NAME: self.n_nan,
+            HISTOGRAM_ATTRIBUTE_NAME: self.histogram,
+            HISTOGRAM_EDGES_ATTRIBUTE_NAME: HISTOGRAM_EDGES,
+        }
@@ -0,0 +1,43 @@
+"""
+Reading of the grid of the 3D FITS files from
+https://zenodo.org/record/5501196, which is used by the console script
+fits_to_h5 and by the library API.
+
+Author: Stefan Lepperdinger
+"""
+from astropy.io import fits
+import numpy as np
+from typing import Tuple
+
+
+def get_grid_limits(header: fits.Header) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the x, y, and z limits of the volume represented by the grid and
+    the x, y, and z limits of the cell centers. Raises ValueError if the
+    grid isn't centered at the Galactic Center.
+    """
+    # x, y, and z limits of the volume represented by the grid
+    grid_volume_limits = []
+    # x, y, and z limits of the cell centers
+    grid_cell_center_limits = []
+    for coordinate in range(1, 4):  # 1, 2, 3 = x, y, z
+        first_cell_center = header[f'CRVAL{coordinate}']
+        cell_width = header[f'CDELT{coordinate}']
+        lower_volume_limit = first_cell_center - cell_width/2
+        # I assume the distribution is centered at the Galactic Center
+        if not lower_volume_limit < 0:
+            raise ValueError(f'The grid of the FITS file has to be centered '
+                             f'at the Galactic Center, but the lower limit '
+                             f'along axis {coordinate} is '
+                             f'{lower_volume_limit:g} kpc.')
+        upper_volume_limit = -lower_volume_limit
+        upper_cell_center = upper_volume_limit - cell_width/2
+        grid_volume_limits.append([
+            lower_volume_limit,
+            upper_volume_limit,
+        ])
+        grid_cell_center_limits.append([
+            first_cell_center,
+            upper_cell_center,
+        ])
+    return np.array(grid_volume_limits), np.array(grid_cell_center_limits)
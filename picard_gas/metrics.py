@@ -0,0 +1,192 @@
+"""
+Stage-level timing, throughput counters, and a rate-limited progress reporter
+for the console scripts.
+
+Usage:
+    metrics = Metrics()
+    with metrics.stage('read source'):
+        density = source_file.read_density()
+    metrics.count('bytes read', density.nbytes)
+    metrics.write_json(metrics_file_path)
+
+Author: Stefan Lepperdinger
+"""
+from contextlib import contextmanager
+import json
+import sys
+import time
+from typing import Dict
+from typing import Optional
+from typing import TextIO
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# minimum time between two progress lines / s
+DEFAULT_PROGRESS_INTERVAL = 1.
+
+
+def get_peak_rss() -> Dict[str, float]:
+    """
+    Returns the peak resident set size of this process and of its terminated
+    child processes (e.g., the workers of a process pool) in MiB.
+    """
+    if resource is None:
+        return dict()
+    # ru_maxrss is given in KiB on Linux and in bytes on macOS
+    unit = 2**20 if sys.platform == 'darwin' else 2**10
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+        / 2**20,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        * unit / 2**20,
+    }
+
+
+class Metrics:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        # stage name: {'wall seconds': ..., 'cpu seconds': ..., 'calls': ...}
+        self.stages: Dict[str, Dict[str, float]] = dict()
+        # counter name: value, e.g., 'bytes read' or 'points interpolated'
+        self.counters: Dict[str, float] = dict()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the wall time and the CPU time of this process of a stage.
+        Stages that are entered several times (e.g., once per slab) are
+        accumulated.
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(
+                name, {'wall seconds': 0., 'cpu seconds': 0., 'calls': 0}
+            )
+            stage['wall seconds'] += time.perf_counter() - wall_start
+            stage['cpu seconds'] += time.process_time() - cpu_start
+            stage['calls'] += 1
+
+    def count(self, name: str, value: float) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: 'Metrics') -> None:
+        """
+        Adds the stages and the counters of `other`, e.g., of a worker
+        process.
+        """
+        for name, other_stage in other.stages.items():
+            stage = self.stages.setdefault(
+                name, {'wall seconds': 0., 'cpu seconds': 0., 'calls': 0}
+            )
+            for key, value in other_stage.items():
+                stage[key] += value
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def to_dict(self) -> dict:
+        metrics = {
+            'wall seconds': time.perf_counter() - self.start_time,
+            'cpu seconds': time.process_time() - self.start_cpu_time,
+            'stages': self.stages,
+            'counters': self.counters,
+            'peak RSS MiB': get_peak_rss(),
+        }
+        points = self.counters.get('points interpolated')
+        interpolation = self.stages.get('interpolate')
+        if points is not None and interpolation is not None:
+            seconds = interpolation['wall seconds']
+            metrics['points per second'] = (points / seconds if seconds > 0
+                                            else None)
+        return metrics
+
+    def write_json(self, file_path: str) -> None:
+        with open(file_path, 'w') as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=4)
+
+    def print_summary(self, file: TextIO = sys.stderr) -> None:
+        metrics = self.to_dict()
+        print(f"total: {metrics['wall seconds']:.3f} s wall, "
+              f"{metrics['cpu seconds']:.3f} s CPU", file=file)
+        for name, stage in self.stages.items():
+            print(f"  {name}: {stage['wall seconds']:.3f} s wall, "
+                  f"{stage['cpu seconds']:.3f} s CPU", file=file)
+        for name, value in self.counters.items():
+            print(f'  {name}: {value:.6g}', file=file)
+        if metrics.get('points per second') is not None:
+            print(f"  points per second: {metrics['points per second']:.3g}",
+                  file=file)
+        for name, peak_rss in metrics['peak RSS MiB'].items():
+            print(f'  peak RSS ({name}): {peak_rss:.1f} MiB', file=file)
+
+
+class ProgressReporter:
+    def __init__(self,
+                 total: int,
+                 interval: float = DEFAULT_PROGRESS_INTERVAL,
+                 file: Optional[TextIO] = None):
+        """
+        Prints the progress, the rate, and the estimated remaining time at
+        most every `interval` seconds. If the output stream isn't a terminal,
+        e.g., a log file, only the final line is printed (see finish).
+
+        Parameters
+        ----------
+            total    : total number of work units, e.g., x-planes
+            interval : minimum time between two progress lines / s
+            file     : output stream (default: standard output)
+        """
+        self.total = total
+        self.interval = interval
+        self.file = file
+        self.start_time = time.perf_counter()
+        self.last_report_time = None
+
+    def get_file(self) -> TextIO:
+        return sys.stdout if self.file is None else self.file
+
+    def is_terminal(self) -> bool:
+        isatty = getattr(self.get_file(), 'isatty', None)
+        return isatty is not None and isatty()
+
+    def get_line(self, done: int, now: float) -> str:
+        elapsed = now - self.start_time
+        percent = round(done / self.total * 100) if self.total > 0 else 100
+        line = f'{percent} %'
+        if 0 < done < self.total and elapsed > 0:
+            remaining = elapsed / done * (self.total - done)
+            line += f' ({done / elapsed:.3g}/s, ETA {remaining:.0f} s)'
+        return line
+
+    def update(self, done: int) -> None:
+        """
+        Reports that `done` of the `total` work units are finished.
+        """
+        if not self.is_terminal():
+            return
+        now = time.perf_counter()
+        if (self.last_report_time is not None
+                and now - self.last_report_time < self.interval
+                and done < self.total):
+            return
+        self.last_report_time = now
+        # The line is overwritten by the next one.
+        print(f'{self.get_line(done, now):<40}', end='\r',
+              file=self.get_file(), flush=True)
+
+    def finish(self) -> None:
+        """
+        Prints the final line.
+        """
+        if self.is_terminal():
+            self.update(self.total)
+            print(file=self.get_file(), flush=True)
+        else:
+            print(self.get_line(self.total, time.perf_counter()),
+                  file=self.get_file(), flush=True)
@@ -0,0 +1,152 @@
+"""
+An on-disk cache of the interpolation operator.
+
+The cell indices and the weights of the trilinear interpolation only depend on
+the grid of the distribution and on the Picard grid and not on the gas map
+that is projected. Since both grids are regular, the operator is stored in its
+separable form, i.e., as the x, y, and z weights (see
+trilinear_interpolation.get_grid_weights). Applying it reduces to a gather and
+a weighted sum along each axis (see
+trilinear_interpolation.resample_with_weights).
+
+Usage:
+    cache = OperatorCache(cache_directory)
+    weights = cache.get_weights(grid_volume_limits, source_shape, parameters)
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.settings import DEFAULT_MAX_CACHE_SIZE
+from picard_gas.trilinear_interpolation import AxisWeights
+from picard_gas.trilinear_interpolation import get_grid_weights
+import hashlib
+import json
+import numpy as np
+import os
+import tempfile
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+CACHE_FILE_SUFFIX = '.npz'
+# version of the layout of the cache files (part of the cache key)
+CACHE_VERSION = 1
+
+
+class OperatorCache:
+    def __init__(self,
+                 directory: str,
+                 max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+            directory : directory of the cache files
+            max_size  : maximum total size of the cache files in bytes; the
+                        least recently used files are evicted if the cache
+                        becomes larger
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(grid_volume_limits: np.ndarray,
+                source_shape: Tuple[int, ...],
+                parameters: dict) -> str:
+        """
+        Returns the hash of the grid of the distribution and of the grid
+        parameters from picard_grid.parse_parameter_file.
+        """
+        description = {
+            'version': CACHE_VERSION,
+            'grid volume limits': np.asarray(grid_volume_limits,
+                                             dtype=np.float64).tolist(),
+            'source shape': [int(n) for n in source_shape],
+            'parameters': parameters,
+        }
+        serialized = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha256(serialized).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+    def load(self, key: str) -> Optional[List[AxisWeights]]:
+        """
+        Returns the cached weights or None if they aren't cached.
+        """
+        path = self._get_path(key)
+        try:
+            with np.load(path) as cache_file:
+                weights = [(cache_file[f'{coordinate} cell index'],
+                            cache_file[f'{coordinate} weight'],
+                            cache_file[f'{coordinate} within grid'])
+                           for coordinate in 'xyz']
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        # marks the file as recently used
+        os.utime(path)
+        return weights
+
+    def store(self, key: str, weights: List[AxisWeights]) -> None:
+        arrays = dict()
+        for coordinate, (cell_index, weight, within_grid) in zip('xyz',
+                                                                 weights):
+            arrays[f'{coordinate} cell index'] = cell_index
+            arrays[f'{coordinate} weight'] = weight
+            arrays[f'{coordinate} within grid'] = within_grid
+        # writes into a temporary file first such that concurrent runs never
+        # read a partially written cache file
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, suffix=CACHE_FILE_SUFFIX + '.tmp'
+        )
+        with os.fdopen(file_descriptor, 'wb') as temporary_file:
+            np.savez(temporary_file, **arrays)
+        os.replace(temporary_path, self._get_path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used cache files until the total size of
+        the cache doesn't exceed max_size.
+        """
+        cache_files = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cache_files.append((status.st_mtime, status.st_size, path))
+        cache_size = sum(size for _, size, _ in cache_files)
+        for _, size, path in sorted(cache_files):
+            if cache_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            cache_size -= size
+
+    def get_weights(self,
+                    grid_volume_limits: np.ndarray,
+                    source_shape: Tuple[int, ...],
+                    parameters: dict) -> List[AxisWeights]:
+        """
+        Returns the x, y, and z weights of the Picard grid specified by
+        `parameters` (see picard_grid.parse_parameter_file) within the grid
+        of the distribution. The weights are computed and stored if they
+        aren't cached yet.
+        """
+        key = self.get_key(grid_volume_limits, source_shape, parameters)
+        weights = self.load(key)
+        if weights is None:
+            picard_grid = get_picard_grid(parameters)
+            weights = get_grid_weights(grid_volume_limits,
+                                       source_shape,
+                                       picard_grid['x centers'],
+                                       picard_grid['y centers'],
+                                       picard_grid['z centers'])
+            self.store(key, weights)
+        return weights
@@ -3,7 +3,12 @@ A class for parsing Picard parameter files *.nx
 
 Author: Stefan Lepperdinger
 """
-import sys
+
+
+class ParameterFileError(ValueError):
+    """
+    Raised if a parameter is missing in a parameter file or is invalid.
+    """
 
 
 class ParameterFile:
@@ -55,15 +60,17 @@ class ParameterFile:
         Returns
         -------
             parameter value
+
+        Raises ParameterFileError if the value doesn't exist.
         """
         try:
             parameter = self.parameters[section][parameter][value_index]
-        except KeyError:
-            print(f"Error: Couldn't find the value with the index "
-                  f"{value_index} of the parameter '{parameter}' in the "
-                  f"section '{section}' in the parameter file.",
-                  file=sys.stderr)
-            sys.exit(1)
+        except (KeyError, IndexError):
+            raise ParameterFileError(
+                f"Couldn't find the value with the index {value_index} of "
+                f"the parameter '{parameter}' in the section '{section}' in "
+                f"the parameter file '{self.file_path}'."
+            )
         if type_ is None:
             return parameter
         else:
@@ -7,21 +7,22 @@ Usage:
     grid = get_final_grid(parameters)
 """
 from picard_gas.parameter_file import ParameterFile
-import sys
+from picard_gas.parameter_file import ParameterFileError
 from typing import Dict
 import numpy as np
 
 
 def parse_parameter_file(parameter_file_path: str) -> dict:
     """
-    Gets the necessary parameters from the parameter file.
+    Gets the necessary parameters from the parameter file. Raises
+    ParameterFileError if a parameter is missing or if the grid isn't 3D.
     """
     parameter_file = ParameterFile(parameter_file_path)
 
     if parameter_file('no_section', 'n_spatial_dimensions', 0, int) != 3:
-        print('Error: The value of the parameter n_spatial_dimensions in the '
-              'parameter file is not 3.', file=sys.stderr)
-        sys.exit(1)
+        raise ParameterFileError('The value of the parameter '
+                                 'n_spatial_dimensions in the parameter file '
+                                 'is not 3.')
 
     def parameter(parameter_name, type_):
         return parameter_file('Grid', parameter_name, 0, type_)
@@ -65,6 +66,7 @@ def get_picard_grid(parameters: dict) -> Dict[str, np.ndarray]:
     grid_size = (grid['cell center limits'][:, 1] -
                  grid['cell center limits'][:, 0])
     cell_size = grid_size / (grid['shape'] - 1)
+    grid['cell size'] = cell_size
     lower_cell_center_limits = grid['cell center limits'][:, 0] - cell_size*0.5
     upper_cell_center_limits = grid['cell center limits'][:, 1] + cell_size*0.5
     grid['volume limits'] = np.vstack([lower_cell_center_limits,
@@ -0,0 +1,115 @@
+"""
+Reads single planes of the density of an H5 file and keeps the recently read
+ones in a small LRU cache, so that browsing through a large density (see
+plot_h5 --interactive) only reads the planes that are shown.
+
+Usage:
+    planes = PlaneCache(H5File(h5_file_path))
+    image = planes.get_plane('z', z_index)        # density[:, :, z_index]
+    image = planes.get_projection('z', 'max')     # maximum along z
+
+Author: Stefan Lepperdinger
+"""
+from collections import OrderedDict
+from picard_gas.H5File import H5File
+from picard_gas.settings import AXES
+from picard_gas.settings import PROJECTIONS
+import numpy as np
+from typing import Dict
+from typing import Tuple
+
+# maximum number of planes that are kept in the cache
+DEFAULT_MAX_PLANES = 16
+# approximate size of the x-slabs that are read for the projections
+DEFAULT_BLOCK_BYTES = 64 * 2**20
+
+
+class PlaneCache:
+    def __init__(self,
+                 h5_file: H5File,
+                 max_planes: int = DEFAULT_MAX_PLANES,
+                 block_bytes: int = DEFAULT_BLOCK_BYTES):
+        """
+        Parameters
+        ----------
+            h5_file     : file from which the density is read
+            max_planes  : maximum number of planes that are kept in the cache
+            block_bytes : approximate size of the x-slabs in which the density
+                          is read for the projections
+        """
+        self.h5_file = h5_file
+        self.max_planes = max_planes
+        self.block_bytes = block_bytes
+        self.shape = tuple(h5_file.read_density_shape())
+        self.grid_volume_limits = h5_file.read_grid_volume_limits()
+        # (axis, index): plane, ordered from the least to the most recently
+        # used plane
+        self.planes: 'OrderedDict[Tuple[str, int], np.ndarray]' = OrderedDict()
+        # (axis, projection): projected density (see compute_projections)
+        self.projections: Dict[Tuple[str, str], np.ndarray] = dict()
+
+    def get_plane(self, axis: str, index: int) -> np.ndarray:
+        """
+        Returns the plane of the density at the index `index` of the axis
+        `axis` ('x', 'y', or 'z'). Only this plane is read from the file.
+        """
+        axis_index = AXES.index(axis)
+        if not 0 <= index < self.shape[axis_index]:
+            raise IndexError(f'The {axis} index {index} is out of range.')
+        key = axis, index
+        if key in self.planes:
+            self.planes.move_to_end(key)
+            return self.planes[key]
+        selection = [slice(None)] * 3
+        selection[axis_index] = index
+        plane = self.h5_file.read_density(tuple(selection))
+        self.planes[key] = plane
+        while len(self.planes) > self.max_planes:
+            self.planes.popitem(last=False)
+        return plane
+
+    def get_projection(self, axis: str, projection: str) -> np.ndarray:
+        """
+        Returns the projection `projection` ('integrated' or 'max') of the
+        density along the axis `axis`. All projections are computed in a
+        single pass through the density when the first one is requested.
+        """
+        if projection not in PROJECTIONS:
+            raise ValueError('Invalid projection.')
+        if not self.projections:
+            self.compute_projections()
+        return self.projections[axis, projection]
+
+    def compute_projections(self) -> None:
+        """
+        Computes the integrated and the maximum density along each axis slab
+        by slab.
+        """
+        nx, ny, nz = self.shape
+        cell_size = ((self.grid_volume_limits[:, 1]
+                      - self.grid_volume_limits[:, 0]) / self.shape)
+        sums = {
+            'x': np.zeros((ny, nz)),
+            'y': np.empty((nx, nz)),
+            'z': np.empty((nx, ny)),
+        }
+        maxima = {
+            'x': np.full((ny, nz), -np.inf),
+            'y': np.empty((nx, nz)),
+            'z': np.empty((nx, ny)),
+        }
+        plane_bytes = max(ny * nz * 8, 1)
+        planes_per_block = max(self.block_bytes // plane_bytes, 1)
+        for x_start in range(0, nx, planes_per_block):
+            x_stop = min(x_start + planes_per_block, nx)
+            slab = self.h5_file.read_density(np.s_[x_start:x_stop])
+            sums['x'] += slab.sum(axis=0)
+            np.maximum(maxima['x'], slab.max(axis=0), out=maxima['x'])
+            sums['y'][x_start:x_stop] = slab.sum(axis=1)
+            maxima['y'][x_start:x_stop] = slab.max(axis=1)
+            sums['z'][x_start:x_stop] = slab.sum(axis=2)
+            maxima['z'][x_start:x_stop] = slab.max(axis=2)
+        for axis_index, axis in enumerate(AXES):
+            self.projections[axis, 'integrated'] = (sums[axis]
+                                                    * cell_size[axis_index])
+            self.projections[axis, 'max'] = maxima[axis]
@@ -0,0 +1,38 @@
+"""
+Settings of the library that the command-line parsers need as well.
+
+This module must not import NumPy, h5py, or any other module of the library
+that does, so that the command line can be parsed and checked without loading
+them (see console_scripts.cli). The library modules re-export the settings,
+e.g., H5File.COMPRESSION_FILTERS.
+
+Author: Stefan Lepperdinger
+"""
+
+# H5File
+COMPRESSION_FILTERS = 'gzip', 'lzf'
+DEFAULT_COMPRESSION = 'gzip'
+DEFAULT_COMPRESSION_LEVEL = 4
+DEFAULT_PYRAMID_FACTORS = 2, 4, 8
+# Further density components of the same grid, e.g., HI and H2 of several
+# gas-flow models, are stored as the datasets 'components/<component>' (see
+# get_component_name).
+COMPONENTS_GROUP_NAME = 'components'
+
+# operator_cache
+DEFAULT_MAX_CACHE_SIZE = 2**30  # bytes
+
+# plane_cache
+AXES = 'x', 'y', 'z'
+# 'integrated': integral of the density along the axis / (cm^-3 kpc)
+# 'max': maximum of the density along the axis / cm^-3
+PROJECTIONS = 'integrated', 'max'
+
+
+def get_component_name(component: str) -> str:
+    """
+    Returns the name of the dataset of the density component `component`.
+    """
+    if not component or '/' in component:
+        raise ValueError(f"Invalid component name '{component}'.")
+    return f'{COMPONENTS_GROUP_NAME}/{component}'
@@ -0,0 +1,57 @@
+"""
+A NumPy array in shared memory, which worker processes attach by name instead
+of receiving a pickled copy.
+
+Usage:
+    shared_array = SharedArray(shape)              # in the parent process
+    worker_array = SharedArray(shape, name=shared_array.name)  # in a worker
+    ...
+    worker_array.close()
+    shared_array.close()                           # also frees the memory
+
+Author: Stefan Lepperdinger
+"""
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from typing import Optional
+from typing import Tuple
+
+
+class SharedArray:
+    def __init__(self,
+                 shape: Tuple[int, ...],
+                 dtype=np.float64,
+                 name: Optional[str] = None):
+        """
+        Parameters
+        ----------
+            shape : shape of the array
+            dtype : data type of the array
+            name  : name of an existing shared array that should be attached;
+                    if None, a new shared array is created
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.is_owner = name is None
+        if self.is_owner:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.memory = SharedMemory(create=True, size=size)
+        else:
+            self.memory = SharedMemory(name=name)
+        self.array = np.ndarray(self.shape,
+                                dtype=self.dtype,
+                                buffer=self.memory.buf)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def close(self) -> None:
+        """
+        Detaches the array. The owner also frees the shared memory.
+        """
+        # the buffer can only be released if no array refers to it anymore
+        self.array = None
+        self.memory.close()
+        if self.is_owner:
+            self.memory.unlink()
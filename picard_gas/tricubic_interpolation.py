@@ -0,0 +1,280 @@
+"""
+A class for tricubic B-spline interpolation, which has the same interface as
+TrilinearInterpolation but is continuously differentiable across the cell
+boundaries.
+
+The field is first converted into the coefficients of the cubic B-splines
+that pass through the field values at the cell centers (the prefilter, see
+get_spline_coefficients). The coefficients can be stored in the H5 file of
+the field (see H5File.write_spline_coefficients) and passed to the class, so
+the prefilter is only applied once per field.
+
+Usage:
+    interpolation = TricubicInterpolation(field, volume_limits)
+    values = interpolation.evaluate(locations)
+
+Author: Stefan Lepperdinger
+"""
+from picard_gas.trilinear_interpolation import PointNotWithinGrid
+from picard_gas.trilinear_interpolation import TrilinearInterpolation
+from picard_gas.trilinear_interpolation import get_compute_dtype
+import numpy as np
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# pole of the recursive cubic B-spline prefilter
+SPLINE_POLE = np.sqrt(3.) - 2.
+# number of locations that TricubicInterpolation.evaluate processes at once
+# (each location gathers 4 x 4 x 4 coefficients)
+BATCH_SIZE = 2**14
+
+# indices of the 4 neighbouring cells (shape (N, 4)), their weights (shape
+# (N, 4)), and the within-grid mask along one axis (see get_cubic_axis_weights)
+CubicAxisWeights = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def prefilter_axis(data: np.ndarray, axis: int) -> None:
+    """
+    Replaces `data` in place by its cubic B-spline coefficients along `axis`
+    with mirror-symmetric boundaries, i.e., data[-1] = data[1] and data[n] =
+    data[n - 2] (see M. Unser, "Splines: A Perfect Fit for Signal and Image
+    Processing", IEEE Signal Processing Magazine, 1999).
+    """
+    coefficients = np.moveaxis(data, axis, 0)
+    n = coefficients.shape[0]
+    if n < 2:
+        return
+    z = SPLINE_POLE
+    coefficients *= (1 - z) * (1 - 1 / z)
+
+    # initial value of the causal filter for mirror-symmetric boundaries
+    k = np.arange(n)
+    initial_weights = z**k + np.where((k > 0) & (k < n - 1),
+                                      z**(2 * n - 2 - k), 0.)
+    initial_weights /= 1 - z**(2 * n - 2)
+    coefficients[0] = np.tensordot(initial_weights.astype(data.dtype),
+                                   coefficients, axes=1)
+    for index in range(1, n):
+        coefficients[index] += z * coefficients[index - 1]
+
+    coefficients[n - 1] = (z / (z * z - 1)
+                           * (coefficients[n - 1] + z * coefficients[n - 2]))
+    for index in range(n - 2, -1, -1):
+        coefficients[index] = z * (coefficients[index + 1]
+                                   - coefficients[index])
+
+
+def get_spline_coefficients(field: np.ndarray) -> np.ndarray:
+    """
+    Returns the cubic B-spline coefficients of `field` in the data type
+    get_compute_dtype(field.dtype).
+    """
+    coefficients = np.array(field, dtype=get_compute_dtype(field.dtype))
+    for axis in range(coefficients.ndim):
+        prefilter_axis(coefficients, axis)
+    return coefficients
+
+
+def get_cubic_axis_weights(centers: np.ndarray,
+                           lower_volume_limit: float,
+                           cell_size: float,
+                           n_cells: int) -> CubicAxisWeights:
+    """
+    Determines the cubic B-spline weights of the locations `centers` along
+    one axis of a regular grid. Like for trilinear interpolation, the
+    locations are within the grid if they are between the first and the last
+    cell center.
+
+    Returns
+    -------
+        cell_indices : indices of the 4 neighbouring cells of each location;
+                       the cells beyond the boundaries are mirrored
+        weights      : weights of the 4 neighbouring cells (0 for the
+                       locations that are not within the grid)
+        within_grid  : mask of the locations that are within the grid
+    """
+    float_index = ((np.asarray(centers, dtype=np.float64) - lower_volume_limit)
+                   / cell_size - 0.5)
+    cell_index = np.floor(float_index).astype(np.intp)
+    within_grid = (cell_index >= 0) & (cell_index <= n_cells - 2)
+    cell_index[~within_grid] = 0
+    t = float_index - cell_index
+    t[~within_grid] = 0.
+    weights = np.stack([
+        (1 - t)**3 / 6,
+        (4 - 6 * t**2 + 3 * t**3) / 6,
+        (1 + 3 * t + 3 * t**2 - 3 * t**3) / 6,
+        t**3 / 6,
+    ], axis=1)
+    weights[~within_grid] = 0.
+    cell_indices = cell_index[:, np.newaxis] + np.arange(-1, 3)
+    # mirror-symmetric boundaries (see prefilter_axis)
+    cell_indices = np.abs(cell_indices)
+    cell_indices = np.where(cell_indices > n_cells - 1,
+                            2 * (n_cells - 1) - cell_indices,
+                            cell_indices)
+    if n_cells < 2:
+        # No location is within such a grid, so all weights are 0.
+        cell_indices = np.clip(cell_indices, 0, max(n_cells - 1, 0))
+    return cell_indices, weights, within_grid
+
+
+def resample_with_cubic_weights(coefficients: np.ndarray,
+                                weights: List[CubicAxisWeights],
+                                fill_value: float = 0.) -> np.ndarray:
+    """
+    Evaluates the splines with the coefficients `coefficients` along the x,
+    y, and z axis, i.e., at the rectilinear grid described by the x, y, and z
+    weights (see get_cubic_axis_weights).
+    """
+    compute_dtype = get_compute_dtype(coefficients.dtype)
+    resampled_field = coefficients
+    for axis, (cell_indices, axis_weights, _) in enumerate(weights):
+        shape = [1, 1, 1]
+        shape[axis] = len(axis_weights)
+        axis_weights = axis_weights.astype(compute_dtype, copy=False)
+        contracted_field = None
+        for neighbour in range(4):
+            term = (np.take(resampled_field, cell_indices[:, neighbour],
+                            axis=axis)
+                    * axis_weights[:, neighbour].reshape(shape))
+            if contracted_field is None:
+                contracted_field = term
+            else:
+                contracted_field += term
+        resampled_field = contracted_field
+    (_, _, x_within), (_, _, y_within), (_, _, z_within) = weights
+    resampled_field[~x_within, :, :] = fill_value
+    resampled_field[:, ~y_within, :] = fill_value
+    resampled_field[:, :, ~z_within] = fill_value
+    return resampled_field
+
+
+class TricubicInterpolation:
+    def __init__(self,
+                 scalar_field: np.ndarray,
+                 volume_limits: np.ndarray,
+                 coefficients: Optional[np.ndarray] = None):
+        """
+        Parameters
+        ----------
+            scalar_field  : 3D scalar field:
+                            scalar_field[x_index, y_index, z_index]
+            volume_limits : size of the volume (see TrilinearInterpolation)
+            coefficients  : precomputed B-spline coefficients of the field
+                            (see get_spline_coefficients); if None, they are
+                            computed
+        """
+        self.scalar_field = scalar_field
+        self.volume_limits = volume_limits
+        self.volume_size = volume_limits[:, 1] - volume_limits[:, 0]
+        self.cell_size = self.volume_size / scalar_field.shape
+        self.compute_dtype = get_compute_dtype(scalar_field.dtype)
+        if coefficients is None:
+            coefficients = get_spline_coefficients(scalar_field)
+        elif coefficients.shape != scalar_field.shape:
+            raise ValueError('The coefficients have to have the shape of the '
+                             'field.')
+        self.coefficients = np.ascontiguousarray(coefficients,
+                                                 dtype=self.compute_dtype)
+
+    def __call__(self,
+                 x_location: float,
+                 y_location: float,
+                 z_location: float) -> float:
+        """
+        Determines the value of the scalar field at (x_location, y_location,
+        z_location). Raises PointNotWithinGrid if the location is not within
+        the grid.
+        """
+        location = np.array([[x_location, y_location, z_location]])
+        within_grid = self._get_weights(location)[2]
+        if not np.all(within_grid):
+            raise PointNotWithinGrid('Interpolation is not possible because '
+                                     'the point is not within the grid.')
+        return float(self.evaluate(location)[0])
+
+    def _get_weights(self,
+                     locations: np.ndarray
+                     ) -> Tuple[List[np.ndarray], List[np.ndarray],
+                                np.ndarray]:
+        """
+        Returns the x, y, and z neighbour indices and weights and the
+        within-grid mask of the (N, 3) locations.
+        """
+        indices = []
+        weights = []
+        within_grid = np.ones(len(locations), dtype=bool)
+        for axis in range(3):
+            axis_indices, axis_weights, axis_within_grid = \
+                self.get_axis_weights(axis, locations[:, axis])
+            indices.append(axis_indices)
+            weights.append(axis_weights.astype(self.compute_dtype,
+                                               copy=False))
+            within_grid &= axis_within_grid
+        return indices, weights, within_grid
+
+    def evaluate(self,
+                 x_locations: np.ndarray,
+                 y_locations: Optional[np.ndarray] = None,
+                 z_locations: Optional[np.ndarray] = None,
+                 fill_value: float = 0.) -> np.ndarray:
+        """
+        Evaluates the scalar field at N locations at once (see
+        TrilinearInterpolation.evaluate). The locations are processed in
+        batches of BATCH_SIZE.
+        """
+        locations = TrilinearInterpolation._stack_locations(x_locations,
+                                                            y_locations,
+                                                            z_locations)
+        scalars = np.empty(len(locations), dtype=self.compute_dtype)
+        # The 4 x 4 x 4 neighbours are gathered via flat indices, which is
+        # faster than indexing with three index arrays.
+        coefficients = self.coefficients.ravel()
+        _, ny, nz = self.coefficients.shape
+        for start in range(0, len(locations), BATCH_SIZE):
+            stop = start + BATCH_SIZE
+            (x_i, y_i, z_i), (x_w, y_w, z_w), within_grid = \
+                self._get_weights(locations[start:stop])
+            flat_indices = ((x_i * (ny * nz))[:, :, None, None]
+                            + (y_i * nz)[:, None, :, None]
+                            + z_i[:, None, None, :])
+            neighbours = coefficients.take(flat_indices)
+            batch = np.einsum('nijk,ni,nj,nk->n', neighbours, x_w, y_w, z_w,
+                              optimize=True)
+            batch[~within_grid] = fill_value
+            scalars[start:stop] = batch
+        return scalars
+
+    def get_axis_weights(self,
+                         axis: int,
+                         centers: np.ndarray) -> CubicAxisWeights:
+        """
+        Determines the cubic B-spline weights of the locations `centers`
+        along the axis `axis` (0, 1, 2 = x, y, z) of the scalar field (see
+        get_cubic_axis_weights).
+        """
+        return get_cubic_axis_weights(centers,
+                                      self.volume_limits[axis, 0],
+                                      self.cell_size[axis],
+                                      self.scalar_field.shape[axis])
+
+    def resample(self,
+                 x_centers: np.ndarray,
+                 y_centers: np.ndarray,
+                 z_centers: np.ndarray,
+                 fill_value: float = 0.) -> np.ndarray:
+        """
+        Evaluates the scalar field at every point of the rectilinear grid
+        spanned by the axes x_centers, y_centers, and z_centers. Like the
+        trilinear interpolation, the tricubic B-spline interpolation is
+        separable and carried out axis by axis.
+        """
+        weights = [self.get_axis_weights(axis, centers)
+                   for axis, centers in enumerate([x_centers,
+                                                   y_centers,
+                                                   z_centers])]
+        return resample_with_cubic_weights(self.coefficients,
+                                           weights,
+                                           fill_value)
@@ -4,6 +4,13 @@ A class for trilinear interpolation
 Author: Stefan Lepperdinger
 """
 import numpy as np
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# cell indices, weights, and within-grid mask along one axis (see
+# get_axis_weights)
+AxisWeights = Tuple[np.ndarray, np.ndarray, np.ndarray]
 
 
 class PointNotWithinGrid(ValueError):
@@ -12,6 +19,138 @@ class PointNotWithinGrid(ValueError):
         super().__init__(message)
 
 
+def get_compute_dtype(field_dtype) -> np.dtype:
+    """
+    Returns the floating-point type in which a field of the data type
+    `field_dtype` is interpolated: float32 fields are interpolated in single
+    precision and all other fields in double precision.
+    """
+    field_dtype = np.dtype(field_dtype)
+    if field_dtype.kind == 'f' and field_dtype.itemsize <= 4:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+def get_axis_weights(centers: np.ndarray,
+                     lower_volume_limit: float,
+                     cell_size: float,
+                     n_cells: int) -> AxisWeights:
+    """
+    Determines the 1D linear interpolation weights of the locations `centers`
+    along one axis of a regular grid.
+
+    Parameters
+    ----------
+        centers            : locations along the axis
+        lower_volume_limit : position at the outer boundary of the first cell
+        cell_size          : size of the cells along the axis
+        n_cells            : number of cells along the axis
+
+    Returns
+    -------
+        cell_index  : index of the lower neighbouring cell of each location
+                      (0 for the locations that are not within the grid)
+        weight      : weight of the upper neighbouring cell (0 for the
+                      locations that are not within the grid)
+        within_grid : mask of the locations that are within the grid
+    """
+    float_index = ((np.asarray(centers, dtype=np.float64) - lower_volume_limit)
+                   / cell_size - 0.5)
+    cell_index = np.floor(float_index).astype(np.intp)
+    within_grid = (cell_index >= 0) & (cell_index <= n_cells - 2)
+    cell_index[~within_grid] = 0
+    weight = float_index - cell_index
+    weight[~within_grid] = 0.
+    return cell_index, weight, within_grid
+
+
+def get_within_range(centers: np.ndarray,
+                     lower_volume_limit: float,
+                     cell_size: float,
+                     n_cells: int) -> Tuple[int, int]:
+    """
+    Returns the range [start, stop) of the increasing locations `centers`
+    along one axis that are within the grid (see get_axis_weights), i.e.,
+    between the first cell center and the last cell center of the grid. The
+    range is determined from the grid limits instead of location by location.
+    """
+    first_center = lower_volume_limit + cell_size / 2
+    last_center = lower_volume_limit + cell_size * (n_cells - 0.5)
+    start = int(np.searchsorted(centers, first_center, side='left'))
+    stop = int(np.searchsorted(centers, last_center, side='left'))
+    return start, max(start, stop)
+
+
+def get_grid_weights(volume_limits: np.ndarray,
+                     shape: Tuple[int, ...],
+                     x_centers: np.ndarray,
+                     y_centers: np.ndarray,
+                     z_centers: np.ndarray) -> List[AxisWeights]:
+    """
+    Determines the x, y, and z weights (see get_axis_weights) of the
+    rectilinear grid spanned by x_centers, y_centers, and z_centers within the
+    regular grid of the shape `shape` that fills the volume `volume_limits`.
+    """
+    volume_size = volume_limits[:, 1] - volume_limits[:, 0]
+    cell_size = volume_size / shape
+    return [get_axis_weights(centers,
+                             volume_limits[axis, 0],
+                             cell_size[axis],
+                             shape[axis])
+            for axis, centers in enumerate([x_centers, y_centers, z_centers])]
+
+
+def contract_axis(field: np.ndarray,
+                  axis: int,
+                  cell_index: np.ndarray,
+                  weight: np.ndarray) -> np.ndarray:
+    """
+    Linearly interpolates `field` along `axis`, i.e., replaces the axis by the
+    locations represented by `cell_index` and `weight` (see
+    get_axis_weights). The result has the data type get_compute_dtype(field
+    .dtype).
+    """
+    shape = [1] * field.ndim
+    shape[axis] = len(weight)
+    weight = weight.astype(get_compute_dtype(field.dtype),
+                           copy=False).reshape(shape)
+    lower = np.take(field, cell_index, axis=axis)
+    upper = np.take(field, cell_index + 1, axis=axis, mode='clip')
+    return lower * (1 - weight) + upper * weight
+
+
+def resample_with_weights(field: np.ndarray,
+                          weights: List[AxisWeights],
+                          fill_value: float = 0.) -> np.ndarray:
+    """
+    Interpolates `field` along the x, y, and z axis.
+
+    Parameters
+    ----------
+        field      : 3D scalar field or several fields of the same grid
+                     stacked along a leading component axis, i.e.,
+                     field[component, x_index, y_index, z_index]; all
+                     components are interpolated at once with the same
+                     weights
+        weights    : x, y, and z weights (see get_axis_weights) of the
+                     locations at which the field should be evaluated
+        fill_value : value of the locations that are not within the grid
+    """
+    # The x, y, and z axes are the last three axes.
+    first_axis = field.ndim - 3
+    resampled_field = field
+    for axis, (cell_index, weight, _) in enumerate(weights):
+        resampled_field = contract_axis(resampled_field,
+                                        first_axis + axis,
+                                        cell_index,
+                                        weight)
+    (_, _, x_within), (_, _, y_within), (_, _, z_within) = weights
+    resampled_field[..., ~x_within, :, :] = fill_value
+    resampled_field[..., :, ~y_within, :] = fill_value
+    resampled_field[..., :, :, ~z_within] = fill_value
+    return resampled_field
+
+
 class TrilinearInterpolation:
     def __init__(self, scalar_field: np.ndarray, volume_limits: np.ndarray):
         """
@@ -19,6 +158,9 @@ class TrilinearInterpolation:
         ----------
             scalar_field  : 3D scalar field:
                             scalar_field[x_index, y_index, z_index]
+                            (It isn't copied, so it can also be a memory
+                             map. float32 fields are interpolated in single
+                             precision, see get_compute_dtype.)
             volume_limits : size of the volume:
                             volume_limits = numpy.array([[x_min, x_max],
                                                          [y_min, y_max)],
@@ -31,6 +173,7 @@ class TrilinearInterpolation:
         self.volume_limits = volume_limits
         self.volume_size = volume_limits[:, 1] - volume_limits[:, 0]
         self.cell_size = self.volume_size / scalar_field.shape
+        self.compute_dtype = get_compute_dtype(scalar_field.dtype)
 
     def __call__(self,
                  x_location: float,
@@ -74,3 +217,136 @@ class TrilinearInterpolation:
             + field[x_i + 1, y_i + 1, z_i + 1] * x_p * y_p * z_p  # 111
         )
         return scalar
+
+    def evaluate(self,
+                 x_locations: np.ndarray,
+                 y_locations: Optional[np.ndarray] = None,
+                 z_locations: Optional[np.ndarray] = None,
+                 fill_value: float = 0.) -> np.ndarray:
+        """
+        Vectorized version of __call__ that evaluates the scalar field at N
+        locations at once.
+
+        Parameters
+        ----------
+            x_locations : either an (N, 3) array of (x, y, z) locations or an
+                          array of N x locations
+            y_locations : array of N y locations (only if x_locations contains
+                          only the x locations)
+            z_locations : array of N z locations (only if x_locations contains
+                          only the x locations)
+            fill_value  : value of the locations that are not within the grid
+
+        Returns
+        -------
+            array of the N interpolated values
+        """
+        locations = self._stack_locations(x_locations,
+                                          y_locations,
+                                          z_locations)
+        float_index = ((locations - self.volume_limits[:, 0])/self.cell_size
+                       - 0.5)
+        cell_index = np.floor(float_index).astype(np.intp)
+
+        maximum_index = np.array(self.scalar_field.shape) - 2
+        within_grid = np.all((cell_index >= 0) & (cell_index <= maximum_index),
+                             axis=1)
+        # Points outside the grid are evaluated at the first cell and
+        # overwritten afterwards, which avoids fancy-indexing with a mask.
+        cell_index[~within_grid] = 0
+
+        position_inside_cell = (float_index - cell_index).astype(
+            self.compute_dtype, copy=False
+        )
+        x_i, y_i, z_i = cell_index.T
+        x_p, y_p, z_p = position_inside_cell.T
+        x_q, y_q, z_q = 1 - x_p, 1 - y_p, 1 - z_p
+        field = self._get_corner_reader(x_i, y_i, z_i)
+        scalars = (
+            field(0, 0, 0) * x_q * y_q * z_q    # 000
+            + field(1, 0, 0) * x_p * y_q * z_q  # 100
+            + field(0, 1, 0) * x_q * y_p * z_q  # 010
+            + field(0, 0, 1) * x_q * y_q * z_p  # 001
+            + field(1, 0, 1) * x_p * y_q * z_p  # 101
+            + field(0, 1, 1) * x_q * y_p * z_p  # 011
+            + field(1, 1, 0) * x_p * y_p * z_q  # 110
+            + field(1, 1, 1) * x_p * y_p * z_p  # 111
+        )
+        scalars[~within_grid] = fill_value
+        return scalars
+
+    def _get_corner_reader(self,
+                           x_i: np.ndarray,
+                           y_i: np.ndarray,
+                           z_i: np.ndarray):
+        """
+        Returns a function that returns the values of the field at the corner
+        (x_i + dx, y_i + dy, z_i + dz) of each cell for the offsets (dx, dy,
+        dz) of the corner.
+        """
+        field = self.scalar_field
+        if not field.flags.c_contiguous:
+            return lambda dx, dy, dz: field[x_i + dx, y_i + dy, z_i + dz]
+        # Gathering via flat indices is about twice as fast as indexing with
+        # three index arrays.
+        flat_field = field.reshape(-1)
+        _, ny, nz = field.shape
+        flat_index = (x_i * ny + y_i) * nz + z_i
+        return lambda dx, dy, dz: flat_field.take(
+            flat_index + ((dx * ny + dy) * nz + dz)
+        )
+
+    @staticmethod
+    def _stack_locations(x_locations: np.ndarray,
+                         y_locations: Optional[np.ndarray],
+                         z_locations: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Returns the locations as an (N, 3) array.
+        """
+        if y_locations is None and z_locations is None:
+            locations = np.asarray(x_locations, dtype=np.float64)
+            if locations.ndim != 2 or locations.shape[1] != 3:
+                raise ValueError('The locations have to be an (N, 3) array.')
+            return locations
+        if y_locations is None or z_locations is None:
+            raise ValueError('Either an (N, 3) array or three coordinate '
+                             'arrays have to be specified.')
+        coordinates = np.broadcast_arrays(
+            np.ravel(x_locations), np.ravel(y_locations), np.ravel(z_locations)
+        )
+        return np.stack(coordinates, axis=1).astype(np.float64)
+
+    def get_axis_weights(self,
+                         axis: int,
+                         centers: np.ndarray) -> AxisWeights:
+        """
+        Determines the 1D interpolation weights of the locations `centers`
+        along the axis `axis` (0, 1, 2 = x, y, z) of the scalar field (see
+        get_axis_weights).
+        """
+        return get_axis_weights(centers,
+                                self.volume_limits[axis, 0],
+                                self.cell_size[axis],
+                                self.scalar_field.shape[axis])
+
+    def resample(self,
+                 x_centers: np.ndarray,
+                 y_centers: np.ndarray,
+                 z_centers: np.ndarray,
+                 fill_value: float = 0.) -> np.ndarray:
+        """
+        Evaluates the scalar field at every point of the rectilinear grid
+        spanned by the axes x_centers, y_centers, and z_centers.
+
+        Since trilinear interpolation is separable, the interpolation is
+        carried out as three 1D interpolations along the x, y, and z axis.
+
+        Returns
+        -------
+            array of the shape (len(x_centers), len(y_centers), len(z_centers))
+        """
+        weights = [self.get_axis_weights(axis, centers)
+                   for axis, centers in enumerate([x_centers,
+                                                   y_centers,
+                                                   z_centers])]
+        return resample_with_weights(self.scalar_field, weights, fill_value)
@@ -3,15 +3,23 @@ import setuptools
 src_directory = 'picard_gas'
 
 console_scripts = [
+    'compare_h5',
     'fits_to_h5',
+    'integrate_columns',
     'interpolate_gas',
+    'interpolate_gas_batch',
+    'merge_h5',
     'plot_h5',
 ]
 
+# The console scripts are aliases of the subcommands of picard-gas, which
+# import only the modules that the chosen subcommand needs.
 entry_points = {
     'console_scripts': [
+        f'picard-gas = {src_directory}.console_scripts.cli:main'
+    ] + [
         f'{console_script} = '
-        f'{src_directory}.console_scripts.{console_script}:main'
+        f'{src_directory}.console_scripts.cli:{console_script}'
         for console_script in console_scripts
     ]
 }
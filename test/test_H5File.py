@@ -0,0 +1,159 @@
+"""
+These tests check that densities written with different layouts are read back
+unchanged.
+"""
+import pytest
+import numpy as np
+from picard_gas.H5File import H5File
+
+density = np.random.default_rng(0).random((20, 22, 12))
+
+
+@pytest.mark.parametrize(
+    ['layout'],
+    (
+        [dict()],
+        [dict(contiguous=True, compression=None)],
+        [dict(compression='lzf', chunk_shape=(3, 100, 5))],
+        [dict(compression=None, dtype=np.float32)],
+    )
+)
+def test_write_density(tmp_path, layout):
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w', **layout)
+    h5_file.write_density(density)
+    h5_file.file.close()
+
+    h5_file = H5File(file_path, 'r')
+    result = h5_file.read_density()
+    expected = density.astype(layout.get('dtype', np.float64))
+    assert np.array_equal(expected, result)
+
+
+@pytest.mark.parametrize(
+    ['layout', 'is_memory_mapped'],
+    (
+        [dict(contiguous=True, compression=None), True],
+        [dict(), False],
+    )
+)
+def test_memory_map_density(tmp_path, layout, is_memory_mapped):
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w', **layout)
+    h5_file.write_density(density)
+    h5_file.file.close()
+
+    h5_file = H5File(file_path, 'r')
+    assert (h5_file.memory_map_density() is not None) == is_memory_mapped
+    result = h5_file.read_density(dtype=None, memory_map=True)
+    assert np.array_equal(density, result)
+
+
+def test_write_pyramid(tmp_path):
+    file_path = str(tmp_path / 'density.h5')
+    volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+    h5_file = H5File(file_path, 'w')
+    h5_file.write_density(density)
+    h5_file.write_grid_limits(volume_limits, volume_limits)
+    h5_file.write_pyramid()
+    h5_file.file.close()
+
+    h5_file = H5File(file_path, 'r')
+    assert list(h5_file.read_levels()) == [1, 2, 4, 8]
+    h5_file.use_level(4)
+    expected = density[:20, :20, :12].reshape(5, 4, 5, 4, 3, 4)
+    expected = expected.mean(axis=(1, 3, 5))
+    assert np.allclose(expected, h5_file.read_density())
+    assert np.allclose([[-10., 10.], [-11., 9.], [-3., 3.]],
+                       h5_file.read_grid_volume_limits())
+
+    # The cells of the full-resolution density are 1 x 1 x 0.5 kpc large.
+    assert h5_file.select_level(np.array([2.5, 2.5, 2.5])) == 2
+    assert h5_file.read_density_shape() == (10, 11, 6)
+    assert h5_file.select_level(np.array([0.5, 0.5, 0.5])) == 1
+    assert h5_file.read_density_shape() == density.shape
+
+
+def test_write_sparse_density(tmp_path):
+    file_path = str(tmp_path / 'density.h5')
+    sparse_density = density.copy()
+    sparse_density[:, :, 8:] = 0.
+    sparse_density[5:15] = 0.
+    h5_file = H5File(file_path, 'w', sparse=True, chunk_shape=(5, 11, 4))
+    h5_file.create_density(sparse_density.shape)
+    # slabs that aren't aligned with the chunks
+    for x_start in range(0, 20, 3):
+        h5_file.write_density_slab(x_start,
+                                   sparse_density[x_start:x_start + 3])
+    h5_file.file.close()
+
+    h5_file = H5File(file_path, 'r')
+    assert np.array_equal(sparse_density, h5_file.read_density())
+    occupancy, block_shape = h5_file.read_block_occupancy()
+    assert block_shape == (5, 11, 4)
+    expected = np.zeros((4, 2, 3), dtype=bool)
+    expected[[0, 3], :, :2] = True
+    assert np.array_equal(expected, occupancy)
+    # only the non-empty chunks are allocated
+    assert h5_file.file['gas_density'].id.get_num_chunks() == 8
+
+
+@pytest.mark.parametrize(['sparse'], ([False], [True]))
+def test_write_statistics(tmp_path, sparse):
+    statistics_density = density.copy()
+    statistics_density[0, 0, :3] = np.nan
+    statistics_density[1, 1, :2] = -1.
+    statistics_density[4:] = 0.
+    # cells of 1 x 1 x 0.5 kpc
+    volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+    cell_center_limits = np.array([[-9.5, 9.5], [-10.5, 10.5], [-2.75, 2.75]])
+
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w', sparse=sparse, chunk_shape=(2, 11, 4))
+    h5_file.create_density(statistics_density.shape)
+    # The zeros from x = 4 on aren't written.
+    h5_file.write_density_slab(0, statistics_density[:3])
+    h5_file.write_density_slab(3, statistics_density[3:4])
+    h5_file.write_grid_limits(volume_limits, cell_center_limits)
+    h5_file.write_statistics()
+    h5_file.file.close()
+
+    statistics = H5File(file_path, 'r').read_statistics()
+    assert np.isclose(statistics['volume integral [cm^-3 kpc^3]'],
+                      np.nansum(statistics_density) * 0.5)
+    assert statistics['minimum [cm^-3]'] == -1.
+    assert statistics['maximum [cm^-3]'] == np.nanmax(statistics_density)
+    assert statistics['negative values'] == 2
+    assert statistics['NaN values'] == 3
+    assert statistics['log histogram'].sum() == np.sum(statistics_density > 0)
+    assert len(statistics['log histogram edges [cm^-3]']) == 57
+
+    # A density that hasn't been written via this object is read.
+    h5_file = H5File(file_path, 'r+')
+    h5_file.write_statistics(['gas_density'])
+    h5_file.file.close()
+    recomputed = H5File(file_path, 'r').read_statistics()
+    for name, value in statistics.items():
+        assert np.allclose(value, recomputed[name], equal_nan=True)
+
+
+def test_write_statistics_with_equal_limits(tmp_path):
+    # Files whose volume limits are also used as the cell center limits
+    # (cells of 1 x 1 x 0.5 kpc)
+    limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w')
+    h5_file.write_density(density)
+    h5_file.write_grid_limits(limits, limits)
+    h5_file.write_statistics()
+    h5_file.file.close()
+    statistics = H5File(file_path, 'r').read_statistics()
+    assert np.isclose(statistics['volume integral [cm^-3 kpc^3]'],
+                      density.sum() * 0.5)
+
+    h5_file = H5File(str(tmp_path / 'flat.h5'), 'w')
+    h5_file.write_density(density)
+    limits[2] = 0.
+    h5_file.write_grid_limits(limits, limits)
+    with pytest.raises(ValueError):
+        h5_file.write_statistics()
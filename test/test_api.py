@@ -0,0 +1,97 @@
+"""
+These tests compare the projections of the library API with the ones of the
+console scripts and check that errors are raised instead of exiting.
+"""
+import pytest
+import numpy as np
+from astropy.io import fits
+from picard_gas.H5File import H5File
+from picard_gas.api import project
+from picard_gas.api import read_fits
+from picard_gas.console_scripts.fits_to_h5 import convert_fits_file
+from picard_gas.console_scripts.interpolate_gas import interpolate
+from picard_gas.parameter_file import ParameterFileError
+from picard_gas.picard_grid import get_picard_grid
+
+parameters = {
+    'x_min': -12., 'x_max': 12., 'n_xgrid': 31,
+    'y_min': -9., 'y_max': 9., 'n_ygrid': 23,
+    'z_min': -4., 'z_max': 4., 'n_zgrid': 11,
+}
+grid = get_picard_grid(parameters)
+grid_volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+distribution = np.random.default_rng(0).random((20, 22, 12))
+
+
+def test_project_array():
+    density, volume_limits, cell_center_limits = project(
+        distribution, parameters, grid_volume_limits=grid_volume_limits
+    )
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected, density)
+    assert np.array_equal(grid['volume limits'], volume_limits)
+    assert np.array_equal(grid['cell center limits'], cell_center_limits)
+
+
+def write_fits_file(file_path: str,
+                    header_data_unit: fits.PrimaryHDU,
+                    volume_limits: np.ndarray = grid_volume_limits) -> None:
+    for coordinate, (lower, upper), n in zip(range(1, 4),
+                                             volume_limits,
+                                             distribution.shape):
+        cell_width = (upper - lower) / n
+        header_data_unit.header[f'CRVAL{coordinate}'] = lower + cell_width/2
+        header_data_unit.header[f'CDELT{coordinate}'] = cell_width
+    header_data_unit.writeto(file_path)
+
+
+def test_project_fits_file(tmp_path):
+    fits_path = str(tmp_path / 'source.fits')
+    h5_path = str(tmp_path / 'source.h5')
+    write_fits_file(fits_path, fits.PrimaryHDU(distribution.astype('>f4')))
+    convert_fits_file(fits_path, h5_path, dict(), 2**20)
+    h5_file = H5File(h5_path, 'r')
+    expected = interpolate(h5_file.read_density(),
+                           h5_file.read_grid_volume_limits(),
+                           grid)
+
+    density, _, _ = project(fits_path, parameters)
+    assert np.array_equal(expected, density)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, None])
+def test_read_fits_scaled(tmp_path, dtype):
+    fits_path = str(tmp_path / 'source.fits')
+    # scale converts the data in place
+    header_data_unit = fits.PrimaryHDU(distribution.copy())
+    header_data_unit.scale('int16', bscale=1e-4, bzero=1.)
+    write_fits_file(fits_path, header_data_unit)
+
+    density, volume_limits = read_fits(fits_path, dtype)
+    assert density.dtype == (np.float64 if dtype is None else dtype)
+    # astropy scales the data in float32
+    assert np.allclose(density, fits.getdata(fits_path), rtol=0., atol=1e-6)
+    assert np.allclose(density, distribution, rtol=0., atol=1e-4)
+    assert np.allclose(volume_limits, grid_volume_limits)
+
+
+def test_errors(tmp_path):
+    with pytest.raises(ParameterFileError):
+        project(distribution, {'x_min': -1.},
+                grid_volume_limits=grid_volume_limits)
+    with pytest.raises(ValueError):
+        project(distribution, parameters)
+    with pytest.raises(FileNotFoundError):
+        project(str(tmp_path / 'missing.fits'), parameters)
+    with pytest.raises(FileNotFoundError):
+        H5File(str(tmp_path / 'missing.h5'), 'r')
+    # also raised, not exited, by the conversion, e.g., in a worker process
+    with pytest.raises(FileNotFoundError, match='missing.fits'):
+        convert_fits_file(str(tmp_path / 'missing.fits'),
+                          str(tmp_path / 'missing.h5'), dict(), 2**20)
+    # grids that aren't centered at the Galactic Center
+    fits_path = str(tmp_path / 'shifted.fits')
+    write_fits_file(fits_path, fits.PrimaryHDU(distribution),
+                    grid_volume_limits + 20.)
+    with pytest.raises(ValueError, match='Galactic Center'):
+        project(fits_path, parameters)
@@ -0,0 +1,89 @@
+"""
+These tests check that the command line of picard-gas is parsed without
+loading the heavy libraries, that the info subcommand describes a file, and
+that the compare subcommand finds the differences between two files.
+"""
+import numpy as np
+import pytest
+import subprocess
+import sys
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts.cli import main
+
+HEAVY_MODULES = 'numpy', 'h5py', 'astropy', 'matplotlib'
+
+
+def test_parse_without_heavy_modules():
+    code = (
+        'import sys\n'
+        'from picard_gas.console_scripts.parsers import parse_arguments\n'
+        "parse_arguments('interpolate', ['a.h5', 'missing.h5', 'b.nx',\n"
+        "                                '--max-memory', '100'])\n"
+        "parse_arguments('columns', ['a.h5', 'missing.h5',\n"
+        "                            '--observer', '8', '0', '0'])\n"
+        f'print([name for name in {HEAVY_MODULES}\n'
+        '       if name in sys.modules])\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_info(tmp_path, capsys):
+    h5_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(h5_path, 'w')
+    h5_file.write_density(np.ones((4, 5, 6)))
+    h5_file.write_grid_limits(np.array([[-2., 2.], [-3., 3.], [-1., 1.]]),
+                              np.array([[-1.5, 1.5], [-2.4, 2.4],
+                                        [-5 / 6, 5 / 6]]))
+    h5_file.file.close()
+
+    main(['info', h5_path])
+    output = capsys.readouterr().out
+    assert '/gas_density: shape (4, 5, 6), float64' in output
+    assert 'unit: cm^-3' in output
+    assert 'values: [[-2.0, 2.0], [-3.0, 3.0], [-1.0, 1.0]]' in output
+
+
+def write_file(path: str, density: np.ndarray) -> None:
+    h5_file = H5File(path, 'w', chunk_shape=(2, 5, 6))
+    h5_file.write_density(density)
+    h5_file.write_grid_limits(np.array([[-5., 5.], [-3., 3.], [-1., 1.]]),
+                              np.array([[-4.5, 4.5], [-2.4, 2.4],
+                                        [-5 / 6, 5 / 6]]))
+    h5_file.file.close()
+
+
+@pytest.mark.parametrize(['jobs'], ([1], [2]))
+def test_compare(tmp_path, capsys, jobs):
+    reference = np.random.default_rng(0).random((10, 5, 6))
+    compared = reference.copy()
+    compared[3, 1, 2] += 0.5
+    compared[7, 4, 0] *= 1 + 1e-3
+    reference_path = str(tmp_path / 'reference.h5')
+    compared_path = str(tmp_path / 'compared.h5')
+    write_file(reference_path, reference)
+    write_file(compared_path, compared)
+    # blocks of a single chunk, i.e., 2 x-planes
+    options = ['--block-size', '1e-4', '-j', str(jobs)]
+
+    main(['compare', reference_path, reference_path] + options)
+    assert 'outside the tolerance  : 0 values' in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(['compare', reference_path, compared_path] + options)
+    assert exit_info.value.code == 1
+    output = capsys.readouterr().out
+    assert 'compared values        : 300 of 300' in output
+    assert 'maximum absolute error : 0.5 cm^-3 at (3, 1, 2)' in output
+    assert 'outside the tolerance  : 2 values' in output
+    assert f'RMS error              : {np.sqrt(0.25 / 300):.6g}' in output
+
+    # The slabs after the one with the first failure aren't compared.
+    with pytest.raises(SystemExit):
+        main(['compare', reference_path, compared_path, '--fail-fast']
+             + options)
+    assert 'compared values        : 120 of 300' in capsys.readouterr().out
+
+    main(['compare', reference_path, compared_path, '--rtol', '1e-2',
+          '--max-fraction', '0.01'] + options)
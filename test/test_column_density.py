@@ -0,0 +1,42 @@
+"""
+These tests compare the column densities of a uniform density with the
+lengths of the lines of sight within the grid and the parallel integration
+with the serial one.
+"""
+import numpy as np
+from picard_gas.column_density import KPC_IN_CM
+from picard_gas.column_density import get_directions
+from picard_gas.column_density import get_sky_grid
+from picard_gas.column_density import integrate_columns
+from picard_gas.column_density import integrate_columns_parallel
+
+volume_limits = np.array([[-10., 10.], [-10., 10.], [-5., 5.]])
+observer = np.array([2., 0., 0.])
+
+
+def test_integrate_columns():
+    density = np.ones((20, 20, 10))
+    # towards the z axis, perpendicular to it, away from it, and upwards
+    # (the density is interpolated between the first and the last cell
+    # center)
+    directions = get_directions(observer,
+                                np.array([0., 90., 180.]),
+                                np.array([0.]))
+    directions = np.concatenate([directions, [[0., 0., 1.]]])
+    distance_limits = np.array([0., 3., np.inf])
+    result = integrate_columns(density, volume_limits, observer, directions,
+                               distance_limits, step=0.1)
+    expected = np.array([[3., 8.5], [3., 6.5], [3., 4.5], [3., 1.5]])
+    assert np.allclose(expected * KPC_IN_CM, result)
+
+
+def test_integrate_columns_parallel():
+    density = np.random.default_rng(0).random((20, 20, 10))
+    directions = get_directions(observer, *get_sky_grid(24, 12))
+    distance_limits = np.array([0., 5., np.inf])
+    expected = integrate_columns(density, volume_limits, observer,
+                                 directions, distance_limits, step=0.2)
+    result = integrate_columns_parallel(density, volume_limits, observer,
+                                        directions, distance_limits,
+                                        step=0.2, jobs=2)
+    assert np.array_equal(expected, result)
@@ -0,0 +1,82 @@
+"""
+These tests compare the densities converted by fits_to_h5 block by block, in
+one or several processes, with the data read by astropy.
+"""
+import numpy as np
+import os
+import pytest
+from astropy.io import fits
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts import fits_to_h5
+from picard_gas.console_scripts.parsers import parse_arguments
+
+grid_volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+distribution = np.random.default_rng(0).random((20, 22, 12))
+# smaller than the distribution, which is converted in several blocks
+BLOCK_SIZE = '0.01'  # MiB
+
+
+def write_fits_file(file_path: str, scaled: bool) -> None:
+    """
+    Writes the distribution as big-endian float32 values or as big-endian
+    int16 values that are scaled by BSCALE and BZERO.
+    """
+    # a copy, which scale converts in place
+    header_data_unit = fits.PrimaryHDU(distribution.astype('>f4'))
+    if scaled:
+        header_data_unit.scale('int16', bscale=1e-4, bzero=1.)
+    for coordinate, (lower, upper), n in zip(range(1, 4),
+                                             grid_volume_limits,
+                                             distribution.shape):
+        cell_width = (upper - lower) / n
+        header_data_unit.header[f'CRVAL{coordinate}'] = lower + cell_width/2
+        header_data_unit.header[f'CDELT{coordinate}'] = cell_width
+    header_data_unit.writeto(file_path)
+
+
+def check_conversion(fits_file_path: str, h5_file_path: str) -> None:
+    h5_file = H5File(h5_file_path, 'r')
+    density = h5_file.read_density(dtype=None)
+    expected = fits.getdata(fits_file_path)
+    assert density.dtype.isnative
+    if fits.getheader(fits_file_path).get('BSCALE', 1) != 1:
+        # astropy scales the data in float32, fits_to_h5 in float64
+        assert density.dtype == np.float64
+        assert np.allclose(density, expected, rtol=0., atol=1e-6)
+    else:
+        assert np.array_equal(density, expected)
+    assert np.allclose(h5_file.read_grid_volume_limits(), grid_volume_limits)
+    h5_file.file.close()
+
+
+@pytest.mark.parametrize('scaled', [False, True])
+def test_convert_file(tmp_path, scaled):
+    fits_file_path = str(tmp_path / 'source.fits')
+    h5_file_path = str(tmp_path / 'source.h5')
+    write_fits_file(fits_file_path, scaled)
+    arguments = parse_arguments('convert', [
+        fits_file_path, h5_file_path, '--block-size', BLOCK_SIZE,
+    ])
+    fits_to_h5.run(arguments)
+    check_conversion(fits_file_path, h5_file_path)
+
+    with pytest.raises(FileExistsError, match='already exists'):
+        fits_to_h5.run(arguments)
+
+
+def test_convert_directory(tmp_path):
+    source_directory = tmp_path / 'fits'
+    source_directory.mkdir()
+    for name, scaled in (('unscaled', False), ('scaled', True)):
+        write_fits_file(str(source_directory / f'{name}.fits'), scaled)
+    destination_directory = tmp_path / 'h5'
+    fits_to_h5.run(parse_arguments('convert', [
+        str(source_directory), str(destination_directory),
+        '--block-size', BLOCK_SIZE, '-j', '2',
+    ]))
+
+    assert sorted(os.listdir(destination_directory)) == ['scaled.h5',
+                                                         'unscaled.h5']
+    for name in ('unscaled', 'scaled'):
+        check_conversion(str(source_directory / f'{name}.fits'),
+                         str(destination_directory / f'{name}.h5'))
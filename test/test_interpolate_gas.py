@@ -0,0 +1,334 @@
+"""
+These tests compare the slab-by-slab, the parallel, the region-wise, the
+multi-component, the sparse, and the sharded interpolation of a distribution
+with the serial in-memory interpolation.
+"""
+import json
+import numpy as np
+import os
+import pytest
+from picard_gas.H5File import H5File
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.settings import get_component_name
+from picard_gas.console_scripts.interpolate_gas import interpolate
+from picard_gas.console_scripts.interpolate_gas import \
+    interpolate_components
+from picard_gas.console_scripts.interpolate_gas import interpolate_slabs
+from picard_gas.console_scripts.interpolate_gas import interpolate_parallel
+from picard_gas.console_scripts.interpolate_gas import interpolate_region
+from picard_gas.console_scripts.interpolate_gas import interpolate_sparse
+from picard_gas.console_scripts.interpolate_gas import get_source_weights
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.console_scripts import interpolate_gas
+from picard_gas.console_scripts import interpolate_gas_batch
+from picard_gas.console_scripts import merge_h5
+
+parameters = {
+    'x_min': -12.,
+    'x_max': 12.,
+    'n_xgrid': 31,
+
+    'y_min': -9.,
+    'y_max': 9.,
+    'n_ygrid': 23,
+
+    'z_min': -4.,
+    'z_max': 4.,
+    'n_zgrid': 11,
+}
+grid = get_picard_grid(parameters)
+grid_volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+distribution = np.random.default_rng(0).random((20, 22, 12))
+
+
+def write_source_file(file_path: str,
+                      density: np.ndarray = distribution) -> None:
+    source_file = H5File(file_path, 'w')
+    source_file.write_density(density)
+    source_file.write_grid_limits(grid_volume_limits, grid_volume_limits)
+    source_file.file.close()
+
+
+def write_parameter_file(file_path: str,
+                         grid_parameters: dict = parameters) -> None:
+    with open(file_path, 'w') as parameter_file:
+        parameter_file.write('n_spatial_dimensions = 3\n[Grid]\n' + ''.join(
+            f'{name} = {value}\n' for name, value in grid_parameters.items()
+        ))
+
+
+def test_interpolate_slabs(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    write_source_file(source_path)
+
+    source_file = H5File(source_path, 'r')
+    destination_file = H5File(destination_path, 'w')
+    # small enough to require several slabs
+    interpolate_slabs(source_file, destination_file, grid, max_memory=2**16)
+    result = destination_file.read_density()
+
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected, result)
+
+
+def test_interpolate_slabs_pipelined(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    write_source_file(source_path)
+
+    source_file = H5File(source_path, 'r')
+    destination_file = H5File(destination_path, 'w')
+    interpolate_slabs(source_file, destination_file, grid, max_memory=2**16,
+                      pipelined=True)
+    result = destination_file.read_density()
+
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected, result)
+
+
+def test_resume_interpolate_slabs(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    write_source_file(source_path)
+
+    source_file = H5File(source_path, 'r')
+    destination_file = H5File(destination_path, 'w')
+    interpolate_slabs(source_file, destination_file, grid, max_memory=2**16,
+                      checkpoint_interval=0.)
+    # simulates a run that was interrupted after 10 x-planes
+    destination_file.density_dataset[10:] = -1.
+    destination_file.write_progress(10)
+    destination_file.file.close()
+
+    destination_file = H5File(destination_path, 'r+')
+    interpolate_slabs(source_file, destination_file, grid, max_memory=2**16,
+                      resume=True)
+    assert destination_file.read_progress() == grid['shape'][0]
+    result = destination_file.read_density()
+
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected, result)
+
+
+def test_interpolate_parallel():
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    result = interpolate_parallel(distribution, grid_volume_limits, grid,
+                                  jobs=3)
+    assert np.array_equal(expected, result)
+
+
+def test_interpolate_files_parallel(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    parameter_file_path = str(tmp_path / 'grid.nx')
+    destination_path = str(tmp_path / 'destination.h5')
+    write_source_file(source_path)
+    write_parameter_file(parameter_file_path)
+    interpolate_gas.run(parse_arguments('interpolate', [
+        source_path, destination_path, parameter_file_path, '-j', '2',
+    ]))
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected,
+                          H5File(destination_path, 'r').read_density())
+
+
+def test_interpolate_region(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    write_source_file(source_path)
+    expected = interpolate(distribution, grid_volume_limits, grid)
+    source_file = H5File(source_path, 'r')
+    # The region reaches beyond the source grid along x and z.
+    for region in (((0, 9), (3, 20), (2, 11)), ((12, 19), (0, 23), (5, 6))):
+        result = interpolate_region(source_file, grid, region)
+        selection = tuple(slice(start, stop) for start, stop in region)
+        assert np.array_equal(expected[selection], result)
+
+
+def test_interpolate_components(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    components = {
+        'HI_model_1': distribution,
+        'H2_model_1': distribution ** 2,
+    }
+    source_file = H5File(source_path, 'w')
+    for component, density in components.items():
+        source_file.write_density(density, get_component_name(component),
+                                  attributes={'model': 1})
+    source_file.write_grid_limits(grid_volume_limits, grid_volume_limits)
+    source_file.file.close()
+
+    source_file = H5File(source_path, 'r')
+    names = source_file.read_density_names()
+    destination_file = H5File(destination_path, 'w')
+    interpolate_components(source_file, destination_file, names,
+                           grid_volume_limits, grid)
+    destination_file.file.close()
+
+    destination_file = H5File(destination_path, 'r')
+    assert destination_file.read_density_names() == names
+    for component, density in components.items():
+        name = get_component_name(component)
+        destination_file.use_density(name)
+        result = destination_file.read_density()
+        expected = interpolate(density, grid_volume_limits, grid)
+        assert np.array_equal(expected, result)
+        attributes = destination_file.read_density_attributes(name)
+        assert attributes['component'] == component
+        assert attributes['model'] == 1
+
+
+@pytest.mark.parametrize(['use_weights'], ([False], [True]))
+def test_interpolate_sparse(tmp_path, use_weights):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    sparse_distribution = distribution.copy()
+    sparse_distribution[:, :, 6:] = 0.
+    sparse_distribution[12:] = 0.
+    source_file = H5File(source_path, 'w', sparse=True, chunk_shape=(4, 4, 4))
+    source_file.write_density(sparse_distribution)
+    source_file.write_grid_limits(grid_volume_limits, grid_volume_limits)
+    source_file.file.close()
+
+    source_file = H5File(source_path, 'r')
+    destination_file = H5File(destination_path, 'w', sparse=True,
+                              chunk_shape=(5, 5, 5))
+    destination_file.create_density(tuple(grid['shape']))
+    # e.g., from the operator cache
+    weights = (get_source_weights(grid_volume_limits,
+                                  sparse_distribution.shape, grid)
+               if use_weights else None)
+    interpolate_sparse(source_file, destination_file, grid, weights=weights)
+    destination_file.file.close()
+
+    destination_file = H5File(destination_path, 'r')
+    expected = interpolate(sparse_distribution, grid_volume_limits, grid)
+    assert np.array_equal(expected, destination_file.read_density())
+    occupancy, _ = destination_file.read_block_occupancy()
+    assert not np.all(occupancy)
+
+
+def test_merge_shards(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    parameter_file_path = str(tmp_path / 'grid.nx')
+    destination_path = str(tmp_path / 'destination.h5')
+    write_source_file(source_path)
+    write_parameter_file(parameter_file_path)
+
+    n_shards = 4
+    shard_paths = [str(tmp_path / f'shard_{index}.h5')
+                   for index in range(n_shards)]
+    for index, shard_path in enumerate(shard_paths):
+        interpolate_gas.run(parse_arguments('interpolate', [
+            source_path, shard_path, parameter_file_path,
+            '--shard', f'{index}/{n_shards}',
+        ]))
+    merge_h5.run(parse_arguments('merge', shard_paths[::-1]
+                                 + [destination_path, '--chunk-shape', '4',
+                                    '23', '11']))
+
+    destination_file = H5File(destination_path, 'r')
+    assert np.array_equal(
+        interpolate(distribution, grid_volume_limits, grid),
+        destination_file.read_density(),
+    )
+    assert np.array_equal(grid['volume limits'],
+                          destination_file.read_grid_volume_limits())
+
+
+def test_spline_cache(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    parameter_file_path = str(tmp_path / 'grid.nx')
+    cache_path = str(tmp_path / 'cache.h5')
+    write_source_file(source_path)
+    write_parameter_file(parameter_file_path)
+    modification_time = os.stat(source_path).st_mtime_ns
+
+    densities = []
+    for run_index in range(2):
+        destination_path = str(tmp_path / f'destination_{run_index}.h5')
+        interpolate_gas.run(parse_arguments('interpolate', [
+            source_path, destination_path, parameter_file_path,
+            '--method', 'tricubic', '--spline-cache', cache_path,
+        ]))
+        densities.append(H5File(destination_path, 'r').read_density())
+        # The coefficients are saved in the cache and not in the source.
+        assert os.stat(source_path).st_mtime_ns == modification_time
+        assert H5File(source_path, 'r').read_spline_coefficients() is None
+        assert H5File(cache_path, 'r').read_spline_coefficients() is not None
+    assert np.array_equal(densities[0], densities[1])
+
+
+@pytest.mark.parametrize('jobs', [2, 4])
+def test_batch(tmp_path, jobs):
+    # 2 jobs: a group per source; 4 jobs: both sources in a group
+    densities = {'first': distribution, 'second': 2. * distribution[::-1]}
+    for name, density in densities.items():
+        write_source_file(str(tmp_path / f'{name}.h5'), density)
+    grids = {'coarse': parameters, 'fine': dict(parameters, n_xgrid=45)}
+    for name, grid_parameters in grids.items():
+        write_parameter_file(str(tmp_path / f'{name}.nx'), grid_parameters)
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text(json.dumps({
+        'parameter files': [str(tmp_path / '*.nx')],
+        'output directory': str(tmp_path / 'output'),
+    }))
+    arguments = parse_arguments('batch', [
+        '-s', str(tmp_path / '*.h5'), str(tmp_path / 'first.h5'),
+        '-m', str(manifest_path),
+        '-j', str(jobs),
+    ])
+    interpolate_gas_batch.run(arguments)
+
+    assert sorted(os.listdir(tmp_path / 'output')) == [
+        'first_coarse.h5', 'first_fine.h5',
+        'second_coarse.h5', 'second_fine.h5',
+    ]
+    for source_name, density in densities.items():
+        for grid_name, grid_parameters in grids.items():
+            projection_file = H5File(
+                str(tmp_path / 'output' / f'{source_name}_{grid_name}.h5'),
+                'r'
+            )
+            expected = interpolate(density, grid_volume_limits,
+                                   get_picard_grid(grid_parameters))
+            assert np.array_equal(projection_file.read_density(), expected)
+            projection_file.file.close()
+
+    # the projections aren't overwritten
+    with pytest.raises(FileExistsError):
+        interpolate_gas_batch.run(arguments)
+
+
+def test_user_errors(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    destination_path = str(tmp_path / 'destination.h5')
+    parameter_file_path = str(tmp_path / 'parameters.nx')
+    other_parameter_file_path = str(tmp_path / 'other_parameters.nx')
+    write_source_file(source_path)
+    write_parameter_file(parameter_file_path)
+    write_parameter_file(other_parameter_file_path,
+                         dict(parameters, n_xgrid=45))
+
+    region = ['--region', '0', '5', '0', '5', '0', '5']
+    interpolate_gas.run(parse_arguments('interpolate', [
+        source_path, destination_path, parameter_file_path, *region,
+    ]))
+    with pytest.raises(ValueError, match='differs'):
+        interpolate_gas.run(parse_arguments('interpolate', [
+            source_path, destination_path, other_parameter_file_path,
+            *region,
+        ]))
+
+    components_path = str(tmp_path / 'components.h5')
+    components_file = H5File(components_path, 'w')
+    for component in ('HI', 'H2'):
+        components_file.write_density(distribution,
+                                      get_component_name(component))
+    components_file.write_grid_limits(grid_volume_limits, grid_volume_limits)
+    components_file.file.close()
+    with pytest.raises(ValueError, match='--jobs'):
+        interpolate_gas.run(parse_arguments('interpolate', [
+            components_path, str(tmp_path / 'projection.h5'),
+            parameter_file_path, '-j', '2',
+        ]))
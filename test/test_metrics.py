@@ -0,0 +1,104 @@
+"""
+These tests check the accumulation of the stages and the counters of the
+metrics, the metrics saved by --metrics-json, and the rate limiting of the
+progress reporter.
+"""
+import io
+import json
+import numpy as np
+from picard_gas.H5File import H5File
+from picard_gas.console_scripts import interpolate_gas
+from picard_gas.console_scripts.parsers import parse_arguments
+from picard_gas.metrics import Metrics
+from picard_gas.metrics import ProgressReporter
+
+
+class Terminal(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+def test_metrics():
+    metrics = Metrics()
+    for _ in range(3):
+        with metrics.stage('interpolate'):
+            pass
+    metrics.count('points interpolated', 10)
+    metrics.count('points interpolated', 5)
+
+    worker_metrics = Metrics()
+    with worker_metrics.stage('interpolate'):
+        pass
+    with worker_metrics.stage('read source'):
+        pass
+    worker_metrics.count('points interpolated', 1)
+    worker_metrics.count('bytes read', 8)
+    metrics.merge(worker_metrics)
+
+    assert metrics.stages['interpolate']['calls'] == 4
+    assert metrics.stages['read source']['calls'] == 1
+    assert metrics.counters == {'points interpolated': 16, 'bytes read': 8}
+    dictionary = metrics.to_dict()
+    assert dictionary['stages'] == metrics.stages
+    assert dictionary['counters'] == metrics.counters
+    assert dictionary['wall seconds'] >= 0
+    assert 'points per second' in dictionary
+
+
+def test_metrics_json(tmp_path):
+    source_path = str(tmp_path / 'source.h5')
+    parameter_file_path = str(tmp_path / 'parameters.nx')
+    metrics_path = str(tmp_path / 'metrics.json')
+    source_file = H5File(source_path, 'w')
+    source_file.write_density(np.ones((4, 5, 6)))
+    limits = np.array([[-2., 2.], [-2., 2.], [-2., 2.]])
+    source_file.write_grid_limits(limits, limits)
+    source_file.file.close()
+    with open(parameter_file_path, 'w') as parameter_file:
+        parameter_file.write('n_spatial_dimensions = 3\n[Grid]\n' + ''.join(
+            f'{axis}_min = -1.\n{axis}_max = 1.\nn_{axis}grid = 3\n'
+            for axis in 'xyz'
+        ))
+
+    interpolate_gas.run(parse_arguments('interpolate', [
+        source_path, str(tmp_path / 'destination.h5'), parameter_file_path,
+        '--metrics-json', metrics_path,
+    ]))
+    with open(metrics_path) as metrics_file:
+        metrics = json.load(metrics_file)
+    assert metrics['counters']['points interpolated'] == 27
+    assert 'interpolate' in metrics['stages']
+    assert set(metrics['peak RSS MiB']) == {'self', 'children'}
+
+
+def test_progress_reporter():
+    # every update is printed
+    file = Terminal()
+    progress = ProgressReporter(4, interval=0, file=file)
+    for done in range(1, 5):
+        progress.update(done)
+    progress.finish()
+    lines = file.getvalue().split('\r')
+    assert len(lines) == 6
+    assert lines[0].startswith('25 %')
+    assert lines[-2].startswith('100 %')
+    assert lines[-1] == '\n'
+
+    # only the first and the final update are printed
+    file = Terminal()
+    progress = ProgressReporter(4, interval=float('inf'), file=file)
+    for done in range(1, 5):
+        progress.update(done)
+    progress.finish()
+    lines = file.getvalue().split('\r')
+    assert len(lines) == 4
+    assert lines[0].startswith('25 %')
+    assert lines[1].startswith('100 %')
+
+    # only the final line is printed into files that aren't terminals
+    file = io.StringIO()
+    progress = ProgressReporter(4, interval=0, file=file)
+    for done in range(1, 5):
+        progress.update(done)
+    progress.finish()
+    assert file.getvalue() == '100 %\n'
@@ -0,0 +1,50 @@
+"""
+This test checks that the cached interpolation weights are identical to the
+computed ones and that the cache evicts files if it becomes too large.
+"""
+import os
+import numpy as np
+from picard_gas.operator_cache import OperatorCache
+from picard_gas.picard_grid import get_picard_grid
+from picard_gas.trilinear_interpolation import get_grid_weights
+
+parameters = {
+    'x_min': -12.,
+    'x_max': 12.,
+    'n_xgrid': 31,
+
+    'y_min': -9.,
+    'y_max': 9.,
+    'n_ygrid': 23,
+
+    'z_min': -4.,
+    'z_max': 4.,
+    'n_zgrid': 11,
+}
+grid_volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+source_shape = (20, 22, 12)
+
+
+def test_operator_cache(tmp_path):
+    grid = get_picard_grid(parameters)
+    expected = get_grid_weights(grid_volume_limits, source_shape,
+                                grid['x centers'],
+                                grid['y centers'],
+                                grid['z centers'])
+    cache = OperatorCache(str(tmp_path))
+    key = cache.get_key(grid_volume_limits, source_shape, parameters)
+    assert cache.load(key) is None
+    for _ in range(2):  # computed and cached, then loaded
+        weights = cache.get_weights(grid_volume_limits, source_shape,
+                                    parameters)
+        for axis_weights, expected_axis_weights in zip(weights, expected):
+            for array, expected_array in zip(axis_weights,
+                                             expected_axis_weights):
+                assert np.array_equal(array, expected_array)
+    assert cache.load(key) is not None
+
+
+def test_operator_cache_eviction(tmp_path):
+    cache = OperatorCache(str(tmp_path), max_size=0)
+    cache.get_weights(grid_volume_limits, source_shape, parameters)
+    assert len(os.listdir(tmp_path)) == 0
@@ -0,0 +1,43 @@
+"""
+These tests check that the planes and the projections of the plane cache
+equal the ones of the whole density.
+"""
+import numpy as np
+from picard_gas.H5File import H5File
+from picard_gas.plane_cache import PlaneCache
+
+density = np.random.default_rng(0).random((20, 22, 12))
+volume_limits = np.array([[-10., 10.], [-11., 11.], [-3., 3.]])
+
+
+def get_plane_cache(tmp_path, **kwargs) -> PlaneCache:
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w')
+    h5_file.write_density(density)
+    h5_file.write_grid_limits(volume_limits, volume_limits)
+    h5_file.file.close()
+    return PlaneCache(H5File(file_path, 'r'), **kwargs)
+
+
+def test_get_plane(tmp_path):
+    planes = get_plane_cache(tmp_path, max_planes=2)
+    assert np.array_equal(density[3], planes.get_plane('x', 3))
+    assert np.array_equal(density[:, 5], planes.get_plane('y', 5))
+    assert np.array_equal(density[:, :, 7], planes.get_plane('z', 7))
+    # only the two most recently read planes are cached
+    assert list(planes.planes) == [('y', 5), ('z', 7)]
+    bytes_read = planes.h5_file.bytes_read
+    planes.get_plane('y', 5)
+    assert planes.h5_file.bytes_read == bytes_read
+
+
+def test_get_projection(tmp_path):
+    planes = get_plane_cache(tmp_path, block_bytes=1)
+    assert np.allclose(density.sum(axis=2) * 0.5,
+                       planes.get_projection('z', 'integrated'))
+    assert np.allclose(density.sum(axis=0),
+                       planes.get_projection('x', 'integrated'))
+    assert np.array_equal(density.max(axis=0),
+                          planes.get_projection('x', 'max'))
+    assert np.array_equal(density.max(axis=1),
+                          planes.get_projection('y', 'max'))
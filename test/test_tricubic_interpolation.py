@@ -0,0 +1,87 @@
+"""
+These tests check the B-spline prefilter against the corresponding linear
+system and compare the tricubic interpolation at the cell centers and at
+random locations with the field and with the axis-by-axis evaluation.
+"""
+import pytest
+import numpy as np
+from picard_gas.H5File import H5File
+from picard_gas.trilinear_interpolation import PointNotWithinGrid
+from picard_gas.tricubic_interpolation import TricubicInterpolation
+from picard_gas.tricubic_interpolation import get_spline_coefficients
+from picard_gas.tricubic_interpolation import prefilter_axis
+
+rng = np.random.default_rng(0)
+field = rng.random((12, 9, 5))
+volume_limits = np.array([[-6., 6.], [-3., 6.], [-1., 1.5]])
+cell_size = (volume_limits[:, 1] - volume_limits[:, 0]) / field.shape
+cell_centers = [volume_limits[axis, 0]
+                + cell_size[axis] * (np.arange(field.shape[axis]) + 0.5)
+                for axis in range(3)]
+
+
+def test_prefilter_axis():
+    n = 7
+    samples = rng.random(n)
+    # B-spline values at the samples with mirror-symmetric boundaries
+    matrix = np.zeros((n, n))
+    for row in range(n):
+        for column, weight in ((row - 1, 1/6), (row, 4/6), (row + 1, 1/6)):
+            column = abs(column)
+            if column > n - 1:
+                column = 2 * (n - 1) - column
+            matrix[row, column] += weight
+    coefficients = samples.copy()
+    prefilter_axis(coefficients, 0)
+    assert np.allclose(samples, matrix @ coefficients)
+
+
+def test_resample_cell_centers():
+    interpolation = TricubicInterpolation(field, volume_limits)
+    result = interpolation.resample(*cell_centers)
+    # the last cell center of each axis is outside of the grid
+    assert np.allclose(field[:-1, :-1, :-1], result[:-1, :-1, :-1])
+
+
+def test_evaluate():
+    interpolation = TricubicInterpolation(field, volume_limits)
+    x, y, z = (np.linspace(lower - 0.5, upper + 0.5, n)
+               for (lower, upper), n in zip(volume_limits, (17, 13, 7)))
+    expected = interpolation.resample(x, y, z, fill_value=-1.)
+    locations = np.stack(np.meshgrid(x, y, z, indexing='ij'),
+                         axis=-1).reshape(-1, 3)
+    result = interpolation.evaluate(locations, fill_value=-1.)
+    assert np.allclose(expected.ravel(), result)
+    assert np.any(result == -1.)
+
+    location = volume_limits.mean(axis=1)
+    assert (interpolation(*location)
+            == pytest.approx(interpolation.evaluate(location[None])[0]))
+    with pytest.raises(PointNotWithinGrid):
+        interpolation(*volume_limits[:, 0])
+
+
+def test_spline_coefficients_cache(tmp_path):
+    file_path = str(tmp_path / 'density.h5')
+    h5_file = H5File(file_path, 'w')
+    h5_file.write_density(field)
+    assert h5_file.read_spline_coefficients() is None
+    coefficients = get_spline_coefficients(field)
+    h5_file.write_spline_coefficients(coefficients)
+    h5_file.file.close()
+
+    h5_file = H5File(file_path, 'r')
+    assert np.array_equal(coefficients, h5_file.read_spline_coefficients())
+
+
+def test_one_cell_along_an_axis():
+    # Like for trilinear interpolation, no location is within such a grid.
+    thin_field = field[:, :, :1]
+    interpolation = TricubicInterpolation(thin_field, volume_limits)
+    x, y = cell_centers[:2]
+    result = interpolation.resample(x, y, np.array([0., 0.25]),
+                                    fill_value=-1.)
+    assert result.shape == (12, 9, 2)
+    assert np.all(result == -1.)
+    locations = np.array([[0., 0., 0.25]])
+    assert np.all(interpolation.evaluate(locations, fill_value=-1.) == -1.)
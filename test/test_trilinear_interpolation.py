@@ -62,3 +62,40 @@ def test_evaluate_evenness(xyz_location: List[float]):
     result = interpolation(*xyz_location)
     deviation = abs(expected - result)
     assert deviation < test_tolerance
+
+
+test_locations = np.array([
+    [19.32, -5.32, 19.37],
+    [-13.74, -9.82, 1.12],
+    [-16.74, -29.7, 11.68],
+    [-39.32, -24.28, 31.94],
+])
+
+
+def test_evaluate_batch():
+    expected = continuous_linear_scalar_field(*test_locations.T)
+    result = interpolation.evaluate(test_locations)
+    assert np.all(np.abs(expected - result) < test_tolerance)
+    result = interpolation.evaluate(*test_locations.T)
+    assert np.all(np.abs(expected - result) < test_tolerance)
+
+
+def test_evaluate_outside_of_grid():
+    locations = np.vstack([test_locations, [[100., 0., 0.]]])
+    result = interpolation.evaluate(locations, fill_value=-1.)
+    assert result[-1] == -1.
+    expected = continuous_linear_scalar_field(*test_locations.T)
+    assert np.all(np.abs(expected - result[:-1]) < test_tolerance)
+
+
+def test_resample():
+    x_centers = np.linspace(-40., 19., 7)
+    y_centers = np.linspace(-50., 10., 11)
+    z_centers = np.linspace(-29., 35., 5)
+    result = interpolation.resample(x_centers, y_centers, z_centers,
+                                    fill_value=-1.)
+    x, y, z = np.meshgrid(x_centers, y_centers, z_centers, indexing='ij')
+    expected = interpolation.evaluate(x, y, z, fill_value=-1.)
+    expected = expected.reshape(result.shape)
+    assert np.all(np.abs(expected - result) < test_tolerance)
+    assert np.any(result == -1.)